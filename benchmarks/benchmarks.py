@@ -0,0 +1,195 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+# asv benchmarks over scaling grids of synthetic data. time_* benchmarks
+# track wall time and peakmem_* benchmarks track peak resident memory; see
+# asv.conf.json at the repository root and run ``make bench``.
+
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from .synthetic import simulate_inference, simulate_table, write_run_dir
+
+
+class ModelConstruction:
+    """Build ModelSingle for one feature and ModelIterator for a chunk."""
+
+    params = ([100, 1000, 5000], [1, 4])
+    param_names = ["n_samples", "n_covariates"]
+
+    def setup(self, n_samples, n_covariates):
+        self.table, self.metadata, self.formula, _ = simulate_table(
+            n_features=50, n_samples=n_samples, n_covariates=n_covariates
+        )
+
+    def time_model_single(self, n_samples, n_covariates):
+        from q2_birdman.src.model_single import ModelSingle
+
+        ModelSingle(
+            table=self.table, feature_id="F0", metadata=self.metadata,
+            formula=self.formula
+        )
+
+    def time_model_iterator(self, n_samples, n_covariates):
+        from birdman import ModelIterator
+        from q2_birdman.src.model_single import ModelSingle
+
+        ModelIterator(
+            self.table, ModelSingle, num_chunks=20,
+            metadata=self.metadata, formula=self.formula
+        )
+
+    def peakmem_model_iterator(self, n_samples, n_covariates):
+        self.time_model_iterator(n_samples, n_covariates)
+
+
+class Summarize:
+    """Summarize and diagnose a run directory of per-feature inferences."""
+
+    params = ([100, 1000, 5000], [1, 4])
+    param_names = ["n_features", "threads"]
+    timeout = 600
+
+    def setup_cache(self):
+        # Inferences are written once per grid and shared by all benchmarks
+        root = os.path.abspath("summarize_cache")
+        for n_features in self.params[0]:
+            write_run_dir(os.path.join(root, str(n_features)), n_features)
+        return root
+
+    def setup(self, root, n_features, threads):
+        self.run_dir = tempfile.mkdtemp()
+        shutil.copytree(
+            os.path.join(root, str(n_features)), self.run_dir,
+            dirs_exist_ok=True
+        )
+
+    def teardown(self, root, n_features, threads):
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+    def time_summarize_inferences(self, root, n_features, threads):
+        from q2_birdman.src._summarize import summarize_inferences
+
+        summarize_inferences(self.run_dir, threads=threads, incremental=False)
+
+    def peakmem_summarize_inferences(self, root, n_features, threads):
+        self.time_summarize_inferences(root, n_features, threads)
+
+    def time_compute_diagnostics(self, root, n_features, threads):
+        from q2_birdman.src._diagnostics import compute_diagnostics
+
+        compute_diagnostics(self.run_dir, threads=threads)
+
+
+class StreamedSummary:
+    """Summarize a fitted feature while its draws are in memory."""
+
+    params = [[500, 2000]]
+    param_names = ["draws"]
+
+    def setup(self, draws):
+        self.run_dir = tempfile.mkdtemp()
+        self.inf = simulate_inference(
+            np.random.default_rng(0), ["Intercept", "x1"], draws=draws
+        )
+
+    def teardown(self, draws):
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+    def time_append_chunk_summary(self, draws):
+        from q2_birdman.src._summarize import append_chunk_summary
+
+        append_chunk_summary(self.run_dir, 1, "F0", self.inf)
+
+
+class Plot:
+    """Plot the summary of a run."""
+
+    params = [[100, 1000, 10000]]
+    param_names = ["n_features"]
+    timeout = 600
+
+    def setup(self, n_features):
+        from q2_birdman.src._summarize import summarize_draws
+
+        rng = np.random.default_rng(0)
+        self.run_dir = tempfile.mkdtemp()
+        for sub_dir in ["results", "plots"]:
+            os.makedirs(os.path.join(self.run_dir, sub_dir))
+        # Tight posteriors around spread out effects, so most are credible
+        effects = rng.normal(0, 1, size=(n_features, 1, 1, 2))
+        summary = summarize_draws(
+            effects + rng.normal(0, 0.1, size=(n_features, 4, 100, 2)),
+            [f"F{i}" for i in range(n_features)], ["Intercept", "x1"]
+        )
+        summary.to_csv(
+            os.path.join(self.run_dir, "results", "beta_var.tsv"), sep="\t"
+        )
+
+    def teardown(self, n_features):
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+    def time_plot(self, n_features):
+        from q2_birdman.src._plot import birdman_plot_multiple_vars
+
+        birdman_plot_multiple_vars(self.run_dir, "x1", None, False)
+
+    def peakmem_plot(self, n_features):
+        self.time_plot(n_features)
+
+    def time_plot_overview(self, n_features):
+        from q2_birdman.src._plot import birdman_plot_multiple_vars
+
+        birdman_plot_multiple_vars(
+            self.run_dir, "Intercept,x1", None, False, threads=2, overview=True
+        )
+
+
+class Run:
+    """Fit the full pipeline end to end; needs CmdStan."""
+
+    params = ([20, 100], [50, 200])
+    param_names = ["n_features", "n_samples"]
+    timeout = 3600
+    number = 1
+    repeat = 1
+
+    def setup(self, n_features, n_samples):
+        from qiime2 import Metadata
+
+        self.table, metadata, self.formula, _ = simulate_table(
+            n_features=n_features, n_samples=n_samples
+        )
+        self.metadata = Metadata(metadata)
+        self.work_dir = tempfile.mkdtemp()
+
+    def teardown(self, n_features, n_samples):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def time_run(self, n_features, n_samples):
+        from q2_birdman._methods import run
+
+        run(
+            self.table, self.metadata, self.formula, threads=4,
+            work_dir=self.work_dir
+        )
+
+    def peakmem_run(self, n_features, n_samples):
+        self.time_run(n_features, n_samples)
+
+
+class PluginImport:
+    """Import the plugin as QIIME 2 plugin discovery does, in a new process."""
+
+    def timeraw_import_plugin_setup(self):
+        return "import q2_birdman.plugin_setup"
+
+    def timeraw_import_methods(self):
+        return "import q2_birdman._methods"
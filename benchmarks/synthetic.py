@@ -0,0 +1,131 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import arviz as az
+import biom
+import numpy as np
+import pandas as pd
+
+
+def simulate_table(n_features=100, n_samples=100, n_covariates=1,
+                   sparsity=0.5, depth_mean=10000, depth_sd=0.5,
+                   inv_disp=2.0, effect_sd=1.0, seed=0):
+    """
+    Simulate a negative binomial feature table with known effects.
+
+    Counts follow the BIRDMAn model: the log mean of each feature is its
+    log sequencing depth, plus a baseline log proportion, plus a linear
+    effect of the covariates. A fraction of counts is then zeroed to reach
+    the requested sparsity.
+
+    Parameters
+    ----------
+    n_features, n_samples : int
+        Shape of the table
+    n_covariates : int
+        Number of standard normal covariates, named ``x1``, ``x2``, ...
+    sparsity : float
+        Fraction of counts set to zero on top of those drawn as zero
+    depth_mean : float
+        Median sequencing depth per sample
+    depth_sd : float
+        Standard deviation of the log depth; 0 gives equal depths
+    inv_disp : float
+        Inverse dispersion of the negative binomial
+    effect_sd : float
+        Standard deviation of the true covariate effects
+    seed : int
+        Seed of the random generator
+
+    Returns
+    -------
+    table : biom.Table
+        Simulated counts
+    metadata : pd.DataFrame
+        Covariates indexed by sample ID
+    formula : str
+        Formula over all covariates, e.g. ``"x1+x2"``
+    beta : pd.DataFrame
+        True intercepts and effects, indexed by feature ID
+    """
+    rng = np.random.default_rng(seed)
+    sample_ids = [f"S{i}" for i in range(n_samples)]
+    feature_ids = [f"F{i}" for i in range(n_features)]
+    covariates = [f"x{i + 1}" for i in range(n_covariates)]
+
+    metadata = pd.DataFrame(
+        rng.normal(size=(n_samples, n_covariates)),
+        index=pd.Index(sample_ids, name="sampleid"), columns=covariates
+    )
+    depth = np.exp(rng.normal(np.log(depth_mean), depth_sd, size=n_samples))
+    intercept = np.log(rng.dirichlet(np.ones(n_features)))
+    effects = rng.normal(0, effect_sd, size=(n_features, n_covariates))
+
+    log_mu = (np.log(depth)[None] + intercept[:, None]
+              + effects @ metadata.values.T)
+    mu = np.exp(log_mu)
+    # numpy parameterizes the negative binomial by successes and probability
+    counts = rng.negative_binomial(inv_disp, inv_disp / (inv_disp + mu))
+    counts[rng.random(counts.shape) < sparsity] = 0
+
+    table = biom.Table(counts, feature_ids, sample_ids)
+    beta = pd.DataFrame(
+        effects, index=pd.Index(feature_ids, name="feature id"),
+        columns=covariates
+    )
+    beta.insert(0, "Intercept", intercept)
+    return table, metadata, "+".join(covariates), beta
+
+
+def simulate_inference(rng, covariates, chains=4, draws=500, n_samples=0):
+    """
+    Simulate the posterior of one feature as ModelSingle would store it.
+
+    With ``n_samples`` set, a pointwise log likelihood is included as well.
+    """
+    posterior = {
+        "beta_var": rng.normal(size=(chains, draws, len(covariates))),
+        "inv_disp": rng.gamma(2, size=(chains, draws)),
+    }
+    log_likelihood = None
+    if n_samples:
+        log_likelihood = {
+            "log_lhood": rng.normal(-3, 0.5, size=(chains, draws, n_samples))
+        }
+    return az.from_dict(
+        posterior=posterior,
+        sample_stats={
+            "diverging": np.zeros((chains, draws), dtype=bool),
+            "tree_depth": rng.integers(2, 6, size=(chains, draws)),
+        },
+        log_likelihood=log_likelihood,
+        coords={"covariate": list(covariates)},
+        dims={"beta_var": ["covariate"], "log_lhood": ["tbl_sample"]},
+    )
+
+
+def write_run_dir(output_dir, n_features, covariates=("Intercept", "x1"),
+                  chains=4, draws=500, seed=0):
+    """
+    Lay out a run directory holding one simulated NetCDF inference per feature.
+
+    The directory can be summarized, diagnosed and plotted like the output
+    of a real run without sampling any model.
+    """
+    from q2_birdman.src._store import write_netcdf
+
+    rng = np.random.default_rng(seed)
+    for sub_dir in ["logs", "inferences", "results", "plots"]:
+        os.makedirs(os.path.join(output_dir, sub_dir), exist_ok=True)
+    for i in range(n_features):
+        write_netcdf(
+            simulate_inference(rng, covariates, chains=chains, draws=draws),
+            os.path.join(output_dir, "inferences", f"F{i:04d}_F{i}.nc")
+        )
+    return output_dir
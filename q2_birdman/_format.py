@@ -0,0 +1,55 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from qiime2.plugin import ValidationError, model
+
+# NetCDF4 files and consolidated chunk stores are both HDF5 files; NetCDF3
+# files start with "CDF"
+HDF5_SIGNATURE = b"\x89HDF\r\n\x1a\n"
+NETCDF3_SIGNATURE = b"CDF"
+SQLITE_SIGNATURE = b"SQLite format 3\x00"
+
+
+class BIRDMAnInferenceFormat(model.BinaryFileFormat):
+    """Posterior draws of one feature (NetCDF) or one chunk (HDF5 store)."""
+
+    def _validate_(self, level):
+        with self.open() as fh:
+            header = fh.read(len(HDF5_SIGNATURE))
+        if not (header == HDF5_SIGNATURE
+                or header.startswith(NETCDF3_SIGNATURE)):
+            raise ValidationError(
+                "Inference file is neither a NetCDF nor an HDF5 file."
+            )
+
+
+class BIRDMAnManifestFormat(model.BinaryFileFormat):
+    """SQLite manifest recording the status and output of every feature."""
+
+    def _validate_(self, level):
+        with self.open() as fh:
+            if fh.read(len(SQLITE_SIGNATURE)) != SQLITE_SIGNATURE:
+                raise ValidationError("Manifest is not a SQLite database.")
+
+
+class BIRDMAnInferencesDirectoryFormat(model.DirectoryFormat):
+    """
+    Fitted BIRDMAn posteriors, laid out like the run directory they came from.
+
+    ``inferences/`` holds per-feature NetCDF files or per-chunk HDF5 stores
+    and ``manifest.sqlite`` maps each finished feature to its file, so the
+    directory can be summarized like a run directory.
+    """
+    manifest = model.File('manifest.sqlite', format=BIRDMAnManifestFormat)
+    inferences = model.FileCollection(
+        r'inferences/.+\.(nc|h5)$', format=BIRDMAnInferenceFormat
+    )
+
+    @inferences.set_path_maker
+    def inferences_path_maker(self, name):
+        return 'inferences/%s' % name
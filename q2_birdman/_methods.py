@@ -7,58 +7,269 @@
 # ----------------------------------------------------------------------------
 
 import os
+import shutil
 import tempfile
-import pandas as pd
-from joblib import Parallel, delayed
 from qiime2 import Metadata
 import biom
 
-from .src.birdman_chunked import run_birdman_chunk
-from .src._utils import validate_table_and_metadata, validate_formula
-from .src._summarize import summarize_inferences
+from ._format import BIRDMAnInferencesDirectoryFormat
+
+# This module is imported by plugin_setup whenever QIIME 2 discovers plugins,
+# so only modules QIIME 2 itself loads (qiime2, biom) are imported here.
+# joblib, birdman, cmdstanpy, arviz, xarray, ... are imported when an action
+# runs.
 
 def _create_dir(output_dir):
   sub_dirs = ["slurm_out", "logs", "inferences", "results", "plots"]
   for sub_dir in sub_dirs:
       os.makedirs(os.path.join(output_dir, sub_dir), exist_ok=True)
 
-def run(table: biom.Table, metadata: Metadata, formula: str, threads: int = 16) -> Metadata:
-    """Run BIRDMAn and return the inference results as ImmutableMetadata."""
-   
-    validate_table_and_metadata(table, metadata)
-    validate_formula(formula, table, metadata)
-    
-    metadata_df = metadata.to_dataframe()
 
-    chunks = 20
-    output_dir = os.path.join(os.getcwd(), "test_out") 
+def _fit_chunks(output_dir, table, metadata_df, formula, threads, timer,
+                profile, scratch_dir=None, **chunk_kwargs):
+    """Fit every feature of ``table`` into a run directory, chunk by chunk."""
+    from joblib import Parallel, delayed
+    from .src.birdman_chunked import run_birdman_chunk
+    from .src.logger import teardown_loggers
+    from .src._manifest import create_manifest
+    from .src._scratch import resolve_scratch_root
+    from .src._profile import profiled
+    from .src._models import compile_model
+    from .src.model_single import MODEL_NAME
+    from .src._partition import partition_feature_ids
+
+    # ModelIterator may make fewer than 20 chunks of small tables
+    chunks = len(partition_feature_ids(table.ids(axis="observation"), 20))
     _create_dir(output_dir)
     print(f"Output dir is {output_dir}")
     os.makedirs(os.path.join(output_dir, "logs"), exist_ok=True)
+    create_manifest(output_dir, table.ids(axis="observation"))
+    scratch_root = resolve_scratch_root(output_dir, scratch_dir)
 
     def run_chunk(chunk_num):
         log_path = os.path.join(output_dir, "logs", f"chunk_{chunk_num}.log")
-        run_birdman_chunk(
-            table=table,
-            metadata=metadata_df,
-            formula=formula,
-            inference_dir=output_dir,
-            num_chunks=chunks,
-            chunk_num=chunk_num,
-            logfile=log_path
-        )
+        profile_name = f"chunk_{str(chunk_num).zfill(4)}"
+        try:
+            with profiled(output_dir, profile_name, profile):
+                run_birdman_chunk(
+                    table=table,
+                    metadata=metadata_df,
+                    formula=formula,
+                    inference_dir=output_dir,
+                    num_chunks=chunks,
+                    chunk_num=chunk_num,
+                    logfile=log_path,
+                    scratch_root=scratch_root,
+                    **chunk_kwargs
+                )
+        finally:
+            # Flush and close this chunk's log before the worker moves on
+            teardown_loggers()
+
+    # Build (or find cached) the model once, so workers never compile
+    with timer.stage("compile_model"):
+        compile_model(MODEL_NAME)
+    try:
+        with timer.stage("fit"):
+            Parallel(n_jobs=threads)(
+                delayed(run_chunk)(i) for i in range(1, chunks + 1)
+            )
+    finally:
+        if scratch_root is not None:
+            shutil.rmtree(scratch_root, ignore_errors=True)
+
+
+def _finish_run(output_dir, timer, prometheus_metrics, profile):
+    from .src._metrics import append_metrics, collect_metrics
+    from .src._profile import write_profile_report
+    from .src._resources import write_memory_scaling
+
+    append_metrics(output_dir, "run", timer.stages, scope="run")
+    collect_metrics(output_dir, prometheus=prometheus_metrics)
+    # Runs sharing a work_dir together show how memory grows with N
+    write_memory_scaling(os.path.dirname(output_dir))
+    if profile != "none":
+        report = write_profile_report(output_dir)
+        print(f"Profiling hotspots are in: {report}")
+
 
-    Parallel(n_jobs=threads)(
-        delayed(run_chunk)(i) for i in range(1, chunks + 1)
+def _export_inferences(output_dir, inferences_dir):
+    """Copy the inferences and manifest of a run into an artifact directory."""
+    from .src._utils import link_or_copy
+
+    os.makedirs(os.path.join(inferences_dir, "inferences"), exist_ok=True)
+    for name in os.listdir(os.path.join(output_dir, "inferences")):
+        if not name.endswith((".nc", ".h5")):
+            continue
+        # Hard links avoid copying the draws when both are on one filesystem;
+        # they are made read-only so the run directory can't change them
+        link_or_copy(
+            os.path.join(output_dir, "inferences", name),
+            os.path.join(inferences_dir, "inferences", name)
+        )
+    shutil.copy2(
+        os.path.join(output_dir, "manifest.sqlite"),
+        os.path.join(inferences_dir, "manifest.sqlite")
     )
 
-    summarized_results = summarize_inferences(output_dir)
+
+def run(table: biom.Table, metadata: Metadata, formula: str, threads: int = 16,
+        inference_store: str = "netcdf", retain: str = "full",
+        float32: bool = False, compression: int = 0, scratch_dir: str = None,
+        scratch_cap_mb: int = 4096, work_dir: str = None,
+        debug: bool = False, diagnostics: bool = False,
+        prometheus_metrics: bool = False, profile: str = "none") -> Metadata:
+    """Run BIRDMAn and return the inference results as ImmutableMetadata."""
+    from .src._utils import (
+        validate_table_and_metadata, validate_formula, create_run_dir
+    )
+    from .src._summarize import summarize_inferences, collect_chunk_summaries
+    from .src._diagnostics import compute_diagnostics
+    from .src._metrics import StageTimer
+    from .src._profile import profiled, resolve_profile_mode
+   
+    validate_table_and_metadata(table, metadata)
+    validate_formula(formula, table, metadata)
     
+    metadata_df = metadata.to_dataframe()
+
+    profile = resolve_profile_mode(profile)
+    work_dir = work_dir or os.path.join(os.getcwd(), "test_out")
+    # Each run gets its own directory so concurrent runs sharing a work_dir
+    # never overwrite each other's inferences
+    output_dir = create_run_dir(work_dir)
+    timer = StageTimer()
+    _fit_chunks(
+        output_dir, table, metadata_df, formula, threads, timer, profile,
+        scratch_dir=scratch_dir, store=inference_store, retain=retain,
+        float32=float32, compression=compression,
+        scratch_cap_mb=scratch_cap_mb, debug=debug
+    )
+
+    # Workers stream per-feature summaries; only fall back to re-reading the
+    # inferences when none were written
+    with timer.stage("collect_summaries"), \
+            profiled(output_dir, "summarize", profile):
+        summarized_results = collect_chunk_summaries(output_dir)
+        if summarized_results is None:
+            summarized_results = summarize_inferences(
+                output_dir, threads=threads
+            )
+
+    # R-hat, ESS and PSIS-LOO are computed from the stored draws once all
+    # chunks are done, instead of inline for every feature
+    if diagnostics:
+        with timer.stage("diagnostics"), \
+                profiled(output_dir, "diagnostics", profile):
+            feature_diagnostics = compute_diagnostics(
+                output_dir, threads=threads
+            )
+        if feature_diagnostics is not None:
+            summarized_results = summarized_results.join(feature_diagnostics)
+
+    _finish_run(output_dir, timer, prometheus_metrics, profile)
+
     # Rename index to a valid feature ID column name
     summarized_results.index.name = 'featureid'
-    
+
     results_metadata = Metadata(summarized_results)
 
     print(f"Results are stored in: {output_dir}")
 
     return results_metadata
+
+
+def fit(table: biom.Table, metadata: Metadata, formula: str, threads: int = 16,
+        inference_store: str = "netcdf", retain: str = "full",
+        float32: bool = False, compression: int = 0, scratch_dir: str = None,
+        scratch_cap_mb: int = 4096, work_dir: str = None,
+        debug: bool = False, prometheus_metrics: bool = False,
+        profile: str = "none") -> BIRDMAnInferencesDirectoryFormat:
+    """Fit BIRDMAn and return the posteriors of every feature."""
+    from .src._utils import (
+        validate_table_and_metadata, validate_formula, create_run_dir
+    )
+    from .src._metrics import StageTimer
+    from .src._profile import resolve_profile_mode
+
+    validate_table_and_metadata(table, metadata)
+    validate_formula(formula, table, metadata)
+
+    profile = resolve_profile_mode(profile)
+    work_dir = work_dir or os.path.join(os.getcwd(), "test_out")
+    output_dir = create_run_dir(work_dir)
+    timer = StageTimer()
+    _fit_chunks(
+        output_dir, table, metadata.to_dataframe(), formula, threads, timer,
+        profile, scratch_dir=scratch_dir, store=inference_store,
+        retain=retain, float32=float32, compression=compression,
+        scratch_cap_mb=scratch_cap_mb, debug=debug
+    )
+    inferences = BIRDMAnInferencesDirectoryFormat()
+    with timer.stage("export"):
+        _export_inferences(output_dir, str(inferences.path))
+    _finish_run(output_dir, timer, prometheus_metrics, profile)
+    print(f"Logs and metrics are stored in: {output_dir}")
+
+    return inferences
+
+
+def summarize(inferences: BIRDMAnInferencesDirectoryFormat, threads: int = 16,
+              hdi_prob: float = 0.94, diagnostics: bool = False) -> Metadata:
+    """Summarize fitted BIRDMAn posteriors as ImmutableMetadata."""
+    from .src._summarize import summarize_inferences
+    from .src._diagnostics import compute_diagnostics
+
+    # Summaries are written next to the inferences, so work in a scratch run
+    # directory that links to the (read-only) artifact
+    with tempfile.TemporaryDirectory() as input_dir:
+        os.symlink(
+            os.path.join(str(inferences.path), "inferences"),
+            os.path.join(input_dir, "inferences")
+        )
+        # Connecting sets the manifest's journal mode, which writes to it, so
+        # work on a copy of the read-only artifact's manifest
+        shutil.copy2(
+            os.path.join(str(inferences.path), "manifest.sqlite"),
+            os.path.join(input_dir, "manifest.sqlite")
+        )
+        os.makedirs(os.path.join(input_dir, "results"))
+
+        summarized_results = summarize_inferences(
+            input_dir, threads=threads, incremental=False, hdi_prob=hdi_prob
+        )
+        if diagnostics:
+            feature_diagnostics = compute_diagnostics(
+                input_dir, threads=threads
+            )
+            if feature_diagnostics is not None:
+                summarized_results = summarized_results.join(
+                    feature_diagnostics
+                )
+
+    summarized_results.index.name = 'featureid'
+    return Metadata(summarized_results)
+
+
+def partition(table: biom.Table,
+              num_partitions: int = 4) -> dict[str, biom.Table]:
+    """Split a feature table into partitions of contiguous features."""
+    from .src._partition import partition_table
+
+    return {
+        f"partition_{str(i).zfill(4)}": part
+        for i, part in enumerate(partition_table(table, num_partitions))
+    }
+
+
+def merge_inferences(
+    inferences: dict[str, BIRDMAnInferencesDirectoryFormat]
+) -> BIRDMAnInferencesDirectoryFormat:
+    """Merge the inferences of fits to partitions of one feature table."""
+    from .src._partition import merge_inference_dirs
+
+    merged = BIRDMAnInferencesDirectoryFormat()
+    merge_inference_dirs(
+        [str(part.path) for part in inferences.values()], str(merged.path)
+    )
+    return merged
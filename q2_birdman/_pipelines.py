@@ -0,0 +1,71 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from qiime2 import Metadata
+
+
+def pipeline(ctx, table, metadata, formula, variables, threads=16,
+             inference_store="netcdf", retain="full", float32=False,
+             compression=0, scratch_dir=None, scratch_cap_mb=4096,
+             work_dir=None, debug=False, prometheus_metrics=False,
+             profile="none", hdi_prob=0.94, diagnostics=False,
+             feature_metadata=None):
+    """Fit BIRDMAn, then summarize and plot the posteriors."""
+    fit = ctx.get_action('birdman', 'fit')
+    summarize = ctx.get_action('birdman', 'summarize')
+    plot = ctx.get_action('birdman', 'plot')
+
+    inferences, = fit(
+        table=table, metadata=metadata, formula=formula, threads=threads,
+        inference_store=inference_store, retain=retain, float32=float32,
+        compression=compression, scratch_dir=scratch_dir,
+        scratch_cap_mb=scratch_cap_mb, work_dir=work_dir, debug=debug,
+        prometheus_metrics=prometheus_metrics, profile=profile
+    )
+    summary, = summarize(
+        inferences=inferences, threads=threads, hdi_prob=hdi_prob,
+        diagnostics=diagnostics
+    )
+    visualization, = plot(
+        summary=summary.view(Metadata), variables=variables,
+        feature_metadata=feature_metadata
+    )
+    return inferences, summary, visualization
+
+
+def birdman(ctx, table, metadata, formula, num_partitions=4, threads=16,
+            inference_store="netcdf", retain="full", float32=False,
+            compression=0, scratch_dir=None, scratch_cap_mb=4096,
+            work_dir=None, debug=False, prometheus_metrics=False,
+            profile="none", hdi_prob=0.94, diagnostics=False):
+    """Fit BIRDMAn to partitions of the features in parallel and summarize."""
+    partition = ctx.get_action('birdman', 'partition')
+    fit = ctx.get_action('birdman', 'fit')
+    merge_inferences = ctx.get_action('birdman', 'merge_inferences')
+    summarize = ctx.get_action('birdman', 'summarize')
+
+    partitions, = partition(table=table, num_partitions=num_partitions)
+    # Each fit is a separate action, so QIIME 2's executor runs them in
+    # parallel and caches them like any other result
+    partition_inferences = []
+    for part in partitions.values():
+        part_inferences, = fit(
+            table=part, metadata=metadata, formula=formula, threads=threads,
+            inference_store=inference_store, retain=retain, float32=float32,
+            compression=compression, scratch_dir=scratch_dir,
+            scratch_cap_mb=scratch_cap_mb, work_dir=work_dir, debug=debug,
+            prometheus_metrics=prometheus_metrics, profile=profile
+        )
+        partition_inferences.append(part_inferences)
+
+    inferences, = merge_inferences(inferences=partition_inferences)
+    summary, = summarize(
+        inferences=inferences, threads=threads, hdi_prob=hdi_prob,
+        diagnostics=diagnostics
+    )
+    return inferences, summary
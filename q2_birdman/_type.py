@@ -0,0 +1,11 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+from qiime2.plugin import SemanticType
+
+BIRDMAnInferences = SemanticType('BIRDMAnInferences')
@@ -0,0 +1,62 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel.
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import html
+import os
+from urllib.parse import quote
+from qiime2 import Metadata
+
+
+def plot(output_dir: str, summary: Metadata, variables: str,
+         feature_metadata: Metadata = None, svg: bool = False,
+         overview: bool = False, threads: int = 1) -> None:
+    """Plot the credible features of each variable of a BIRDMAn summary."""
+    from .src._plot import _label_features, plot_variables
+
+    df = summary.to_dataframe()
+    df.index.name = "Feature"
+    if feature_metadata is not None:
+        df = _label_features(df, feature_metadata.to_dataframe())
+
+    variables = [v.strip() for v in variables.split(",")]
+    figures = plot_variables(
+        df, variables, output_dir, threads=threads, svg=svg, overview=overview
+    )
+
+    with open(os.path.join(output_dir, "index.html"), "w") as f:
+        f.write("<!DOCTYPE html>\n<html>\n"
+                "<head><title>BIRDMAn</title></head>\n<body>\n")
+        for var in variables:
+            f.write(f"<h2>{html.escape(var)}</h2>\n")
+            for name in figures[var]:
+                f.write(
+                    f'<img src="{quote(name)}.png" '
+                    f'alt="{html.escape(name)}">\n')
+                if svg:
+                    f.write(
+                        f'<p><a href="{quote(name)}.svg">Download '
+                        'SVG</a></p>\n')
+        f.write("</body>\n</html>\n")
+
+
+def interactive_plot(output_dir: str, summary: Metadata,
+                     feature_metadata: Metadata = None) -> None:
+    """Explore a BIRDMAn summary interactively in the browser."""
+    from importlib import resources
+    from .src._plot import build_payload, write_interactive_plot
+
+    df = summary.to_dataframe()
+    fmd = None
+    if feature_metadata is not None:
+        fmd = feature_metadata.to_dataframe()
+    template = resources.files("q2_birdman").joinpath(
+        "assets", "interactive", "index.html"
+    )
+    write_interactive_plot(
+        build_payload(df, feature_metadata=fmd), output_dir, str(template)
+    )
@@ -6,11 +6,19 @@
 # The full license is in the file LICENSE, distributed with this software.
 # ----------------------------------------------------------------------------
 
-from qiime2.plugin import Citations, Plugin, Str, Int, Visualization, Metadata
+from qiime2.plugin import (Citations, Plugin, Str, Int, Float, Visualization,
+                           Metadata, Choices, Bool, Range, Collection)
 from q2_types.feature_table import FeatureTable, Frequency
 from q2_types.metadata import ImmutableMetadata
 from q2_birdman import __version__
-from q2_birdman._methods import run
+from q2_birdman._methods import run, fit, summarize, partition, merge_inferences
+from q2_birdman._visualizers import plot, interactive_plot
+from q2_birdman._pipelines import pipeline, birdman
+from q2_birdman._type import BIRDMAnInferences
+from q2_birdman._format import (
+    BIRDMAnInferenceFormat, BIRDMAnManifestFormat,
+    BIRDMAnInferencesDirectoryFormat
+)
 
 citations = Citations.load("citations.bib", package="q2_birdman")
 
@@ -27,24 +35,138 @@ plugin = Plugin(
     citations=[citations['Caporaso-Bolyen-2024']]
 )
 
+plugin.register_formats(
+    BIRDMAnInferenceFormat, BIRDMAnManifestFormat,
+    BIRDMAnInferencesDirectoryFormat
+)
+plugin.register_semantic_types(BIRDMAnInferences)
+plugin.register_artifact_class(
+    BIRDMAnInferences,
+    directory_format=BIRDMAnInferencesDirectoryFormat,
+    description=(
+        'Posterior draws of a BIRDMAn fit, one NetCDF file per feature or one '
+        'HDF5 store per chunk, with the manifest mapping features to their '
+        'draws.'
+    )
+)
+
+# Parameters shared by every action that fits the model
+fit_parameters = {
+    'metadata': Metadata,
+    'threads': Int,
+    'formula': Str,
+    'inference_store': Str % Choices(['netcdf', 'hdf5']),
+    'retain': Str % Choices(['beta_var', 'diagnostics', 'full']),
+    'float32': Bool,
+    'compression': Int % Range(0, 9, inclusive_end=True),
+    'scratch_dir': Str,
+    'scratch_cap_mb': Int % Range(0, None),
+    'work_dir': Str,
+    'debug': Bool,
+    'prometheus_metrics': Bool,
+    'profile': Str % Choices(['none', 'cprofile', 'sampling']),
+}
+fit_parameter_descriptions = {
+    'metadata': (
+        'The sample metadata that includes the columns specified in the '
+        'formula.'
+    ),
+    'threads': (
+        'Number of threads to use for parallel processing. Increasing the '
+        'number of threads can reduce computation time.'
+    ),
+    'formula': (
+        'The formula used to define the model. This should be a valid Patsy '
+        'formula that references columns in the metadata.'
+    ),
+    'inference_store': (
+        'How posterior draws are written to disk. "netcdf" writes one NetCDF '
+        'file per feature; "hdf5" appends all features of a chunk to one '
+        'consolidated HDF5 store indexed by feature, which avoids creating '
+        'one file per feature on shared filesystems.'
+    ),
+    'retain': (
+        'Which parts of each posterior are written to disk. "beta_var" keeps '
+        'only the beta_var draws needed for summarization; "diagnostics" also '
+        'keeps inv_disp, the sampler statistics and the log likelihood; '
+        '"full" additionally keeps the posterior predictive and observed data.'
+    ),
+    'float32': (
+        'Store floating point draws as float32 instead of float64, halving '
+        'the size of the inference output.'
+    ),
+    'compression': (
+        'Compression level (0-9) applied to the inference output. 0 disables '
+        'compression.'
+    ),
+    'scratch_dir': (
+        'Directory for the intermediate CmdStan CSV output of each feature. '
+        'Defaults to the RAM-backed /dev/shm when available, otherwise the '
+        'node-local temporary directory. Per-feature directories are removed '
+        'once the feature is saved.'
+    ),
+    'scratch_cap_mb': (
+        'Maximum total size in MB of the scratch directory across all '
+        'workers. Features that do not fit, or that would not fit in the free '
+        'space, write their CmdStan output under the run output directory '
+        'instead.'
+    ),
+    'work_dir': (
+        'Directory under which this run creates its own uniquely named run '
+        'directory for inferences, logs and results. Defaults to "test_out" '
+        'in the current working directory. Point it at fast local storage to '
+        'keep heavy I/O off shared filesystems; concurrent runs can share the '
+        'same work_dir. Each run also refreshes memory_scaling.tsv in '
+        'work_dir, which fits memory per worker against the number of samples '
+        'across all runs sharing it.'
+    ),
+    'debug': (
+        'Log the full posterior of every feature and DEBUG-level cmdstanpy '
+        'output. By default each feature gets one concise JSON log record '
+        'with its timings.'
+    ),
+    'prometheus_metrics': (
+        'Also write the per-stage timing summary and peak memory per worker '
+        'in Prometheus text format to results/metrics.prom in the run '
+        'directory. Per-feature stage timings are always written to '
+        'results/metrics.tsv and their per-run aggregates to '
+        'results/metrics_summary.tsv; per-feature CPU, memory and I/O go to '
+        'results/resources.tsv and their per-N sizing summary to '
+        'results/resources_summary.tsv.'
+    ),
+    'profile': (
+        'Profile each worker chunk and the summarization step. "cprofile" '
+        'writes one cProfile file per chunk; "sampling" uses the '
+        'lower-overhead pyinstrument sampling profiler when it is installed '
+        'and falls back to cProfile otherwise. Profiles and a merged hotspot '
+        'report (hotspots.txt) are written to the profiles directory of the '
+        'run. Work done inside summarization worker processes is not profiled.'
+    ),
+}
+
 plugin.methods.register_function(
     function=run,
     inputs={
         'table': FeatureTable[Frequency],
     },
     parameters={
-        'metadata': Metadata,
-        'threads': Int,
-        'formula': Str,
+        **fit_parameters,
+        'diagnostics': Bool,
     },
     outputs=[('output_dir', ImmutableMetadata)],
     input_descriptions={
         'table': 'The feature table containing the samples over which feature-based differential abundance should be computed.',
     },
     parameter_descriptions={
-        'metadata': 'The sample metadata that includes the columns specified in the formula.',
-        'threads': 'Number of threads to use for parallel processing. Increasing the number of threads can reduce computation time.',
-        'formula': 'The formula used to define the model. This should be a valid Patsy formula that references columns in the metadata.'
+        **fit_parameter_descriptions,
+        'diagnostics': (
+            'After fitting, compute rank-normalized R-hat, bulk and tail ESS '
+            'and MCSE of beta_var and inv_disp, divergence counts, tree-depth '
+            'saturation and PSIS-LOO for every feature from the stored draws. '
+            'They are written to results/diagnostics.tsv in the run directory '
+            'and joined to the returned summary. Only beta_var diagnostics '
+            'are available under the beta_var retention policy.'
+        ),
     },
     output_descriptions={
         'output_dir': 'The resulting inference results, including parameter estimates, derived from the BIRDMAn model.', # changed from output to output_dir to match
@@ -55,3 +177,314 @@ plugin.methods.register_function(
     citations=[]
 )
 
+plugin.methods.register_function(
+    function=fit,
+    inputs={
+        'table': FeatureTable[Frequency],
+    },
+    parameters=fit_parameters,
+    outputs=[('inferences', BIRDMAnInferences)],
+    input_descriptions={
+        'table': (
+            'The feature table containing the samples over which '
+            'feature-based differential abundance should be computed.'
+        ),
+    },
+    parameter_descriptions=fit_parameter_descriptions,
+    output_descriptions={
+        'inferences': 'Posterior draws of every successfully fit feature.',
+    },
+    name='Fit BIRDMAn',
+    description=(
+        'Fit the default Negative Binomial BIRDMAn model to every feature of '
+        'a feature table and keep the posteriors, so they can be summarized '
+        'and plotted without refitting.'
+    ),
+    citations=[]
+)
+
+plugin.methods.register_function(
+    function=summarize,
+    inputs={
+        'inferences': BIRDMAnInferences,
+    },
+    parameters={
+        'threads': Int % Range(1, None),
+        'hdi_prob': Float % Range(0, 1, inclusive_start=False,
+                                  inclusive_end=False),
+        'diagnostics': Bool,
+    },
+    outputs=[('summary', ImmutableMetadata)],
+    input_descriptions={
+        'inferences': 'Posterior draws from `fit`.',
+    },
+    parameter_descriptions={
+        'threads': (
+            'Number of processes summarizing inference files in parallel.'
+        ),
+        'hdi_prob': (
+            'Probability mass of the highest density interval reported for '
+            'every covariate.'
+        ),
+        'diagnostics': (
+            'Also compute rank-normalized R-hat, bulk and tail ESS and MCSE '
+            'of beta_var and inv_disp, divergence counts, tree-depth '
+            'saturation and PSIS-LOO for every feature and join them to the '
+            'summary. Only beta_var diagnostics are available for inferences '
+            'fit under the beta_var retention policy.'
+        ),
+    },
+    output_descriptions={
+        'summary': (
+            'Posterior mean, standard deviation and HDI of every covariate '
+            'for every feature.'
+        ),
+    },
+    name='Summarize BIRDMAn posteriors',
+    description='Summarize the posterior draws of a BIRDMAn fit.',
+    citations=[]
+)
+
+plugin.visualizers.register_function(
+    function=plot,
+    inputs={},
+    parameters={
+        'summary': Metadata,
+        'variables': Str,
+        'feature_metadata': Metadata,
+        'svg': Bool,
+        'overview': Bool,
+        'threads': Int % Range(1, None),
+    },
+    parameter_descriptions={
+        'summary': 'Summary from `summarize` or `run`.',
+        'variables': (
+            'Comma-separated covariates to plot, as named in the summary '
+            'columns, e.g. "host_age[T.34]".'
+        ),
+        'feature_metadata': (
+            'Feature metadata whose first column holds the names to label '
+            'features with.'
+        ),
+        'svg': (
+            'Also write every figure as SVG. SVGs of many features are large '
+            'and slow to render.'
+        ),
+        'overview': (
+            'Also draw a rasterized overview of every credible feature, in '
+            'addition to the top and bottom 25.'
+        ),
+        'threads': 'Number of processes drawing variables in parallel.',
+    },
+    name='Plot BIRDMAn summaries',
+    description=(
+        'Plot the posterior mean and HDI of the credible features of each '
+        'variable.'
+    ),
+    citations=[]
+)
+
+plugin.visualizers.register_function(
+    function=interactive_plot,
+    inputs={},
+    parameters={
+        'summary': Metadata,
+        'feature_metadata': Metadata,
+    },
+    parameter_descriptions={
+        'summary': 'Summary from `summarize` or `run`.',
+        'feature_metadata': (
+            'Feature metadata whose first column holds the names to label '
+            'features with. All its columns can be searched.'
+        ),
+    },
+    name='Interactive BIRDMAn plot',
+    description=(
+        'Browse the posterior mean and HDI of every feature for every '
+        'covariate. Sorting, filtering and zooming run in the browser on a '
+        'precomputed payload, so no variable or threshold needs replotting.'
+    ),
+    citations=[]
+)
+
+plugin.pipelines.register_function(
+    function=pipeline,
+    inputs={
+        'table': FeatureTable[Frequency],
+    },
+    parameters={
+        **fit_parameters,
+        'variables': Str,
+        'hdi_prob': Float % Range(0, 1, inclusive_start=False,
+                                  inclusive_end=False),
+        'diagnostics': Bool,
+        'feature_metadata': Metadata,
+    },
+    outputs=[
+        ('inferences', BIRDMAnInferences),
+        ('summary', ImmutableMetadata),
+        ('visualization', Visualization),
+    ],
+    input_descriptions={
+        'table': (
+            'The feature table containing the samples over which '
+            'feature-based differential abundance should be computed.'
+        ),
+    },
+    parameter_descriptions={
+        **fit_parameter_descriptions,
+        'variables': (
+            'Comma-separated covariates to plot, as named in the summary '
+            'columns.'
+        ),
+        'hdi_prob': (
+            'Probability mass of the highest density interval reported for '
+            'every covariate.'
+        ),
+        'diagnostics': (
+            'After fitting, compute rank-normalized R-hat, bulk and tail ESS '
+            'and MCSE of beta_var and inv_disp, divergence counts, tree-depth '
+            'saturation and PSIS-LOO for every feature from the stored draws. '
+            'They are joined to the summary. Only beta_var diagnostics are '
+            'available under the beta_var retention policy.'
+        ),
+        'feature_metadata': (
+            'Feature metadata whose first column holds the names to label '
+            'features with.'
+        ),
+    },
+    output_descriptions={
+        'inferences': 'Posterior draws of every successfully fit feature.',
+        'summary': (
+            'Posterior mean, standard deviation and HDI of every covariate '
+            'for every feature.'
+        ),
+        'visualization': 'Plots of the credible features of each variable.',
+    },
+    name='Fit, summarize and plot BIRDMAn',
+    description=(
+        'Run `fit`, `summarize` and `plot` in sequence. Rerun `summarize` and '
+        '`plot` on the inferences to change the HDI or plots without '
+        'refitting.'
+    ),
+    citations=[]
+)
+
+plugin.methods.register_function(
+    function=partition,
+    inputs={
+        'table': FeatureTable[Frequency],
+    },
+    parameters={
+        'num_partitions': Int % Range(1, None),
+    },
+    outputs=[('partitions', Collection[FeatureTable[Frequency]])],
+    input_descriptions={
+        'table': 'The feature table to partition.',
+    },
+    parameter_descriptions={
+        'num_partitions': (
+            'Number of partitions. Features are split into contiguous blocks '
+            'of equal size, so small tables may give fewer partitions.'
+        ),
+    },
+    output_descriptions={
+        'partitions': (
+            'Feature tables holding disjoint subsets of the features and all '
+            'samples.'
+        ),
+    },
+    name='Partition features',
+    description=(
+        'Split a feature table by features so that the partitions can be fit '
+        'in parallel.'
+    ),
+    citations=[]
+)
+
+plugin.methods.register_function(
+    function=merge_inferences,
+    inputs={
+        'inferences': Collection[BIRDMAnInferences],
+    },
+    parameters={},
+    outputs=[('merged_inferences', BIRDMAnInferences)],
+    input_descriptions={
+        'inferences': (
+            'Inferences from fits to partitions of one feature table, in '
+            'partition order.'
+        ),
+    },
+    output_descriptions={
+        'merged_inferences': (
+            'Posterior draws of every feature of every partition.'
+        ),
+    },
+    name='Merge BIRDMAn inferences',
+    description=(
+        'Merge the inferences of fits to disjoint partitions of the features '
+        'of one table.'
+    ),
+    citations=[]
+)
+
+plugin.pipelines.register_function(
+    function=birdman,
+    inputs={
+        'table': FeatureTable[Frequency],
+    },
+    parameters={
+        **fit_parameters,
+        'num_partitions': Int % Range(1, None),
+        'hdi_prob': Float % Range(0, 1, inclusive_start=False,
+                                  inclusive_end=False),
+        'diagnostics': Bool,
+    },
+    outputs=[
+        ('inferences', BIRDMAnInferences),
+        ('summary', ImmutableMetadata),
+    ],
+    input_descriptions={
+        'table': (
+            'The feature table containing the samples over which '
+            'feature-based differential abundance should be computed.'
+        ),
+    },
+    parameter_descriptions={
+        **fit_parameter_descriptions,
+        'threads': (
+            'Number of worker processes used by the fit of each partition and '
+            'by summarization.'
+        ),
+        'num_partitions': (
+            'Number of feature partitions fit as separate actions. With '
+            '--parallel, partitions are fit concurrently by the QIIME 2 '
+            'executor, and rerunning with a result cache reuses the fits of '
+            'unchanged partitions.'
+        ),
+        'hdi_prob': (
+            'Probability mass of the highest density interval reported for '
+            'every covariate.'
+        ),
+        'diagnostics': (
+            'Also compute rank-normalized R-hat, bulk and tail ESS and MCSE '
+            'of beta_var and inv_disp, divergence counts, tree-depth '
+            'saturation and PSIS-LOO for every feature and join them to the '
+            'summary. Only beta_var diagnostics are available for inferences '
+            'fit under the beta_var retention policy.'
+        ),
+    },
+    output_descriptions={
+        'inferences': 'Posterior draws of every successfully fit feature.',
+        'summary': (
+            'Posterior mean, standard deviation and HDI of every covariate '
+            'for every feature.'
+        ),
+    },
+    name='Fit BIRDMAn to feature partitions in parallel',
+    description=(
+        'Partition the features of a table, fit each partition as a separate '
+        'action, merge their inferences and summarize them.'
+    ),
+    citations=[]
+)
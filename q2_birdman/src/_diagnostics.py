@@ -0,0 +1,394 @@
+import logging
+import os
+import arviz as az
+import numpy as np
+import pandas as pd
+import xarray as xr
+from math import ceil
+from scipy.fft import next_fast_len
+from scipy.special import logsumexp
+from scipy.stats import norm, rankdata
+from ._store import STORE_SUFFIX, read_store_feature_ids, read_store_variable
+from ._summarize import (
+    FEAT_REGEX, SUMMARY_BLOCK_SIZE, SUMMARY_INDEX, _discover_inferences,
+    _parallel
+)
+
+DIAGNOSTICS_FILE = "diagnostics.tsv"
+LOG_LIKELIHOOD = "log_lhood"
+# Pareto k above which the PSIS-LOO estimate of an observation is unreliable
+PARETO_K_BAD = 0.7
+# CmdStan's default max_treedepth, which ModelSingle does not override
+MAX_TREEDEPTH = 10
+
+# Variables read for diagnostics as (group, variable); all are optional
+# except beta_var
+DIAGNOSTIC_VARIABLES = {
+    "beta_var": ("posterior", "beta_var"),
+    "inv_disp": ("posterior", "inv_disp"),
+    "diverging": ("sample_stats", "diverging"),
+    "tree_depth": ("sample_stats", "tree_depth"),
+    "log_lik": ("log_likelihood", LOG_LIKELIHOOD),
+}
+
+
+def diagnostics_path(input_dir):
+    """Path of the diagnostics table of a run."""
+    return os.path.join(input_dir, "results", DIAGNOSTICS_FILE)
+
+
+# The statistics below follow Vehtari et al. (2021) and arviz, but work on
+# arrays of shape (..., chain, draw) so that every parameter of every
+# feature in a block is handled in one pass
+
+def _split_chains(x):
+    half = x.shape[-1] // 2
+    return np.concatenate([x[..., :half], x[..., -half:]], axis=-2)
+
+
+def _z_scale(x):
+    # Rank-normalize the pooled draws of each parameter
+    flat = x.reshape(x.shape[:-2] + (-1,))
+    ranks = rankdata(flat, method="average", axis=-1)
+    z = norm.ppf((ranks - 0.375) / (flat.shape[-1] + 0.25))
+    return z.reshape(x.shape)
+
+
+def _rhat(x):
+    n = x.shape[-1]
+    between = n * x.mean(axis=-1).var(axis=-1, ddof=1)
+    within = x.var(axis=-1, ddof=1).mean(axis=-1)
+    # Constant draws have no within-chain variance and get a NaN R-hat
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sqrt((between / within + n - 1) / n)
+
+
+def _autocov(x):
+    n = x.shape[-1]
+    centered = x - x.mean(axis=-1, keepdims=True)
+    m = next_fast_len(2 * n)
+    spectrum = np.fft.rfft(centered, n=m, axis=-1)
+    spectrum *= np.conjugate(spectrum)
+    return np.fft.irfft(spectrum, n=m, axis=-1)[..., :n] / n
+
+
+def _ess(x):
+    """Effective sample size using Geyer's initial monotone sequence."""
+    x = np.asarray(x, dtype=float)
+    m, n = x.shape[-2:]
+    acov = _autocov(x)
+    mean_var = acov[..., 0].mean(axis=-1) * n / (n - 1)
+    var_plus = mean_var * (n - 1) / n
+    if m > 1:
+        var_plus = var_plus + x.mean(axis=-1).var(axis=-1, ddof=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rho = 1 - ((mean_var[..., None] - acov.mean(axis=-2))
+                   / var_plus[..., None])
+    rho[..., 0] = 1
+
+    # Autocorrelations are summed in (even, odd) lag pairs up to the first
+    # non-positive pair (initial positive sequence) ...
+    pairs = rho[..., :n // 2 * 2].reshape(rho.shape[:-1] + (-1, 2)).sum(axis=-1)
+    last_pair = max((n - 3) // 2, 0)
+    # A trailing True marks chains too short to reach any stopping pair
+    stops = np.concatenate(
+        [pairs[..., 1:last_pair + 1] <= 0,
+         np.ones(pairs.shape[:-1] + (1,), bool)],
+        axis=-1
+    )
+    num_pairs = np.minimum(stops.argmax(axis=-1) + 1, last_pair)
+    num_pairs = np.where(pairs[..., 0] <= 0, 0, num_pairs)
+
+    # ... forced to be non-increasing (initial monotone sequence)
+    monotone = np.minimum.accumulate(pairs, axis=-1)
+    summed = np.concatenate(
+        [np.zeros(monotone.shape[:-1] + (1,)), np.cumsum(monotone, axis=-1)],
+        axis=-1
+    )
+    summed = np.take_along_axis(summed, num_pairs[..., None], axis=-1)[..., 0]
+    rho_next = np.take_along_axis(
+        rho, 2 * num_pairs[..., None], axis=-1
+    )[..., 0]
+    pair_next = np.take_along_axis(pairs, num_pairs[..., None], axis=-1)[..., 0]
+    kept = (rho_next > 0) | (pair_next >= 0) | (num_pairs == 0)
+    tau = -1 + 2 * summed + np.where(kept, rho_next, 0)
+    tau = np.maximum(tau, 1 / np.log10(m * n))
+    ess = m * n / tau
+
+    # NaN draws have no ESS; constant draws are perfectly efficient
+    ess = np.where(np.isnan(rho).any(axis=-1), np.nan, ess)
+    spread = x.max(axis=(-2, -1)) - x.min(axis=(-2, -1))
+    constant = spread < np.finfo(float).resolution
+    return np.where(constant, m * n, ess)
+
+
+def rank_rhat(x):
+    """Rank-normalized split R-hat of draws shaped (..., chain, draw)."""
+    split = _split_chains(x)
+    folded = np.abs(split - np.median(split, axis=(-2, -1), keepdims=True))
+    return np.maximum(_rhat(_z_scale(split)), _rhat(_z_scale(folded)))
+
+
+def ess_bulk(x):
+    """Bulk effective sample size of draws shaped (..., chain, draw)."""
+    return _ess(_z_scale(_split_chains(x)))
+
+
+def ess_tail(x, prob=(0.05, 0.95)):
+    """Tail effective sample size of draws shaped (..., chain, draw)."""
+    quantiles = np.quantile(x, prob, axis=(-2, -1), keepdims=True)
+    return np.minimum(
+        _ess(_split_chains(x <= quantiles[0])),
+        _ess(_split_chains(x <= quantiles[1]))
+    )
+
+
+def ess_mean(x):
+    """Effective sample size for the mean of draws shaped (..., chain, draw)."""
+    return _ess(_split_chains(x))
+
+
+def mcse_mean(x):
+    """Monte Carlo standard error of the mean of (..., chain, draw) draws."""
+    sd = x.reshape(x.shape[:-2] + (-1,)).std(axis=-1, ddof=1)
+    return sd / np.sqrt(ess_mean(x))
+
+
+def _psis_loo(log_lik, reff):
+    # log_lik has shape (sample, observation); reimplements az.loo on the
+    # bare array so no InferenceData is built per feature
+    n_samples = log_lik.shape[0]
+    log_weights, pareto_k = az.psislw(-log_lik.T, reff=reff)
+    elpd_i = logsumexp(log_weights + log_lik.T, axis=-1)
+    lppd = np.sum(logsumexp(log_lik, axis=0) - np.log(n_samples))
+    elpd = elpd_i.sum()
+    return {
+        "elpd_loo": elpd,
+        "elpd_loo_se": np.sqrt(len(elpd_i) * np.var(elpd_i)),
+        "p_loo": lppd - elpd,
+        "pareto_k_max": np.max(pareto_k),
+        "pareto_k_bad": int(np.sum(pareto_k > PARETO_K_BAD)),
+    }
+
+
+def diagnose_draws(draws, feature_ids, covariates, inv_disp=None, log_lik=None,
+                   diverging=None, tree_depth=None):
+    """
+    Compute convergence and PSIS-LOO diagnostics of a stack of features.
+
+    Rank-normalized R-hat, bulk and tail ESS and the MCSE of the mean are
+    computed for every parameter of every feature in one vectorized pass;
+    PSIS-LOO is computed feature by feature on the bare arrays.
+
+    Parameters
+    ----------
+    draws : np.ndarray
+        beta_var draws of shape (feature, chain, draw, covariate)
+    feature_ids : sequence of str
+        IDs of the stacked features
+    covariates : sequence of str
+        Covariate names of the last axis
+    inv_disp : np.ndarray, optional
+        inv_disp draws of shape (feature, chain, draw)
+    log_lik : np.ndarray, optional
+        Pointwise log likelihood of shape (feature, chain, draw, sample)
+    diverging : np.ndarray, optional
+        Divergent transitions of shape (feature, chain, draw)
+    tree_depth : np.ndarray, optional
+        NUTS tree depths of shape (feature, chain, draw)
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per feature with ``_rhat``, ``_ess_bulk``, ``_ess_tail``
+        and ``_mcse_mean`` columns for each covariate (and ``inv_disp``),
+        ``rhat_max`` and ``ess_bulk_min`` over all of them, and
+        ``divergences``, ``treedepth_saturation`` and the PSIS-LOO columns
+        when their inputs are given
+    """
+    params = [str(c) for c in covariates]
+    # (feature, parameter, chain, draw)
+    stacked = np.moveaxis(np.asarray(draws, dtype=float), -1, 1)
+    if inv_disp is not None:
+        params.append("inv_disp")
+        stacked = np.concatenate(
+            [stacked, np.asarray(inv_disp)[:, None]], axis=1
+        )
+
+    stats = {
+        "rhat": rank_rhat(stacked),
+        "ess_bulk": ess_bulk(stacked),
+        "ess_tail": ess_tail(stacked),
+        "mcse_mean": mcse_mean(stacked),
+    }
+    columns = {
+        f"{p}_{stat}": values[:, j]
+        for j, p in enumerate(params) for stat, values in stats.items()
+    }
+    columns["rhat_max"] = stats["rhat"].max(axis=1)
+    columns["ess_bulk_min"] = stats["ess_bulk"].min(axis=1)
+    if diverging is not None:
+        columns["divergences"] = diverging.reshape(len(stacked), -1).sum(axis=1)
+    if tree_depth is not None:
+        columns["treedepth_saturation"] = (
+            tree_depth.reshape(len(stacked), -1) >= MAX_TREEDEPTH
+        ).mean(axis=1)
+    df = pd.DataFrame(columns, index=pd.Index(feature_ids, name=SUMMARY_INDEX))
+
+    if log_lik is not None:
+        n_samples = stacked.shape[2] * stacked.shape[3]
+        # Relative efficiency as in az.loo, from the mean ESS of beta_var
+        # per draw
+        reff = ess_mean(stacked[:, :len(covariates)]).mean(axis=1) / n_samples
+        loo = [
+            _psis_loo(ll.reshape(n_samples, -1), r)
+            for ll, r in zip(log_lik, reff)
+        ]
+        df = df.join(pd.DataFrame(loo, index=df.index))
+    return df
+
+
+def _read_group_variable(inf_file, group, var):
+    try:
+        with xr.open_dataset(inf_file, group=group) as ds:
+            return ds[var].load()
+    except (OSError, KeyError):
+        return None
+
+
+def _as_draws(da, leading=("chain", "draw")):
+    # Leading dimensions first, any variable dimensions after
+    return da.transpose(*leading, ...).values
+
+
+def _diagnose_block(inf_items):
+    # Same (file, feature id) pairs as the summary workers
+    blocks = {}
+    for inf_file, feature_id in inf_items:
+        try:
+            if feature_id is None:
+                feature_id = FEAT_REGEX.search(inf_file).groups()[0]
+            variables = {
+                name: _read_group_variable(inf_file, group, var)
+                for name, (group, var) in DIAGNOSTIC_VARIABLES.items()
+            }
+            beta_var = variables["beta_var"].transpose(
+                "chain", "draw", "covariate"
+            )
+        except Exception as e:
+            logging.getLogger("birdman").warning(
+                f"Error processing file {inf_file}: {e}")
+            continue
+        covariates = tuple(str(c) for c in beta_var["covariate"].values)
+        # Features can only be stacked with others holding the same variables
+        # with the same shapes
+        key = (covariates,) + tuple(
+            None if da is None else da.shape for da in variables.values()
+        )
+        block = blocks.setdefault(
+            key, {"ids": [], **{name: [] for name in variables}}
+        )
+        block["ids"].append(feature_id)
+        for name, da in variables.items():
+            if da is not None:
+                block[name].append(_as_draws(da))
+
+    diags = []
+    for key, block in blocks.items():
+        stacks = {
+            name: np.stack(block[name]) if block[name] else None
+            for name in DIAGNOSTIC_VARIABLES
+        }
+        diags.append(diagnose_draws(
+            stacks.pop("beta_var"), block["ids"], key[0], **stacks
+        ))
+    return pd.concat(diags, axis=0) if diags else None
+
+
+def _read_store_optional(store_file, var, group, start, stop):
+    try:
+        return read_store_variable(
+            store_file, var, group=group, start=start, stop=stop
+        )
+    except KeyError:
+        return None
+
+
+def _diagnose_store(store_file):
+    try:
+        num_features = len(read_store_feature_ids(store_file))
+        diags = []
+        for start in range(0, num_features, SUMMARY_BLOCK_SIZE):
+            stop = start + SUMMARY_BLOCK_SIZE
+            variables = {
+                name: _read_store_optional(store_file, var, group, start, stop)
+                for name, (group, var) in DIAGNOSTIC_VARIABLES.items()
+            }
+            beta_var = variables.pop("beta_var").transpose(
+                "feature", "chain", "draw", "covariate"
+            )
+            stacks = {
+                name: None if da is None else
+                _as_draws(da, ("feature", "chain", "draw"))
+                for name, da in variables.items()
+            }
+            diags.append(diagnose_draws(
+                beta_var.values, beta_var["feature"].values,
+                beta_var["covariate"].values, **stacks
+            ))
+        return pd.concat(diags, axis=0) if diags else None
+    except Exception as e:
+        logging.getLogger("birdman").warning(
+            f"Error processing store {store_file}: {e}")
+        return None
+
+
+def compute_diagnostics(input_dir, threads=None):
+    """
+    Compute convergence and PSIS-LOO diagnostics for every inference of a run.
+
+    Diagnostics are computed after fitting from the stored draws, in blocks
+    of features per worker process, and written to
+    ``results/diagnostics.tsv``. PSIS-LOO columns are only present for
+    inferences that retained their log likelihood, and ``inv_disp``,
+    ``divergences`` and ``treedepth_saturation`` only for those that
+    retained them.
+
+    Parameters
+    ----------
+    input_dir : str
+        Run output directory
+    threads : int, optional
+        Number of worker processes, defaults to the number of CPUs
+
+    Returns
+    -------
+    pd.DataFrame or None
+        Diagnostics indexed by feature ID, or None if no inference could be read
+    """
+    if threads is None:
+        threads = os.cpu_count() or 1
+    inf_ids = _discover_inferences(input_dir)
+    inf_items = [
+        (f, fid) for f, fid in inf_ids.items() if not f.endswith(STORE_SUFFIX)
+    ]
+    store_files = [f for f in inf_ids if f.endswith(STORE_SUFFIX)]
+
+    block_size = max(1, min(SUMMARY_BLOCK_SIZE, ceil(len(inf_items) / threads)))
+    inf_blocks = [
+        inf_items[i:i + block_size]
+        for i in range(0, len(inf_items), block_size)
+    ]
+    results = _parallel(threads, _diagnose_block, inf_blocks)
+    results += _parallel(threads, _diagnose_store, store_files)
+    results = [df for df in results if df is not None]
+    if not results:
+        return None
+
+    diagnostics = pd.concat(results, axis=0)
+    diagnostics.index = diagnostics.index.astype(str)
+    diagnostics.index.name = SUMMARY_INDEX
+    results_dir = os.path.join(input_dir, "results")
+    os.makedirs(results_dir, exist_ok=True)
+    diagnostics.to_csv(diagnostics_path(input_dir), sep="\t", index=True)
+    return diagnostics
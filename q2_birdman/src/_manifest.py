@@ -0,0 +1,193 @@
+import os
+import sqlite3
+import pandas as pd
+
+MANIFEST_NAME = "manifest.sqlite"
+# Set to 0 to keep the manifest in SQLite's rollback journal, e.g. when the
+# run directory is on NFS or Lustre
+WAL_ENV = "Q2_BIRDMAN_MANIFEST_WAL"
+MANIFEST_COLUMNS = [
+    "feature_id", "ordinal", "chunk", "status", "output",
+    "started", "finished", "error",
+]
+
+
+def manifest_path(output_dir):
+    """Path of the run manifest inside a run output directory."""
+    return os.path.join(output_dir, MANIFEST_NAME)
+
+
+def wal_enabled():
+    """Whether ``$Q2_BIRDMAN_MANIFEST_WAL`` allows WAL mode (the default)."""
+    return os.environ.get(WAL_ENV, "1").lower() not in ("0", "false", "no")
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=60)
+    # WAL lets workers update their features while others read the manifest,
+    # but needs shared-memory locking that network filesystems such as NFS
+    # and Lustre lack. There SQLite reports another journal mode, raises, or
+    # only fails once the shm file is used, so WAL can also be turned off
+    mode = None
+    if wal_enabled():
+        try:
+            mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+        except sqlite3.OperationalError:
+            pass
+    if mode != "wal":
+        try:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        except sqlite3.OperationalError:
+            # Another connection holds the manifest in WAL mode
+            pass
+    return conn
+
+
+def connect_manifest(output_dir):
+    """
+    Open a connection to the run manifest that can be reused across calls.
+
+    Workers pass it to ``read_manifest`` and ``update_feature`` for every
+    feature of their chunk instead of reconnecting each time, and close it
+    when the chunk is done. Returns None when the run has no manifest.
+    """
+    path = manifest_path(output_dir)
+    if not os.path.exists(path):
+        return None
+    return _connect(path)
+
+
+def create_manifest(output_dir, feature_ids):
+    """
+    Create (or reset) the run manifest for a feature table.
+
+    Every feature is registered with its ordinal in the table and status
+    ``"pending"``, replacing any record left by an earlier run in the same
+    directory.
+
+    Parameters
+    ----------
+    output_dir : str
+        Run output directory
+    feature_ids : sequence of str
+        Feature IDs in table order
+
+    Returns
+    -------
+    str
+        Path of the manifest
+    """
+    path = manifest_path(output_dir)
+    with _connect(path) as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS features (
+                feature_id TEXT PRIMARY KEY,
+                ordinal INTEGER NOT NULL,
+                chunk INTEGER,
+                status TEXT NOT NULL,
+                output TEXT,
+                started REAL,
+                finished REAL,
+                error TEXT
+            )
+            """
+        )
+        conn.execute("DELETE FROM features")
+        conn.executemany(
+            "INSERT INTO features (feature_id, ordinal, status) "
+            "VALUES (?, ?, 'pending')",
+            ((str(fid), i) for i, fid in enumerate(feature_ids))
+        )
+    conn.close()
+    return path
+
+
+def write_manifest(output_dir, manifest):
+    """
+    Write a manifest as returned by ``read_manifest`` to a run directory.
+
+    Output locations are written as-is, so they must already be relative to
+    ``output_dir``.
+
+    Returns
+    -------
+    str
+        Path of the manifest
+    """
+    path = create_manifest(output_dir, manifest.index)
+    columns = [c for c in MANIFEST_COLUMNS if c != "feature_id"]
+    rows = manifest[columns].astype(object)
+    rows = rows.where(rows.notna(), None)
+    assignments = ", ".join(f"{col} = ?" for col in columns)
+    with _connect(path) as conn:
+        conn.executemany(
+            f"UPDATE features SET {assignments} WHERE feature_id = ?",
+            (list(values) + [str(fid)]
+             for fid, values in zip(rows.index, rows.values))
+        )
+    conn.close()
+    return path
+
+
+def update_feature(output_dir, feature_id, conn=None, **fields):
+    """
+    Update the manifest record of one feature.
+
+    Parameters
+    ----------
+    output_dir : str
+        Run output directory
+    feature_id : str
+        Feature to update
+    conn : sqlite3.Connection, optional
+        Connection from ``connect_manifest``, by default one is opened and
+        closed for this update
+    fields
+        Columns to set, e.g. ``status="done"`` or ``output="inferences/..."``.
+        Output locations are stored relative to ``output_dir``.
+    """
+    unknown = set(fields) - set(MANIFEST_COLUMNS)
+    if unknown:
+        raise ValueError(
+            f"Unknown manifest columns: {', '.join(sorted(unknown))}")
+    if fields.get("output") is not None:
+        fields["output"] = os.path.relpath(fields["output"], output_dir)
+
+    assignments = ", ".join(f"{col} = ?" for col in fields)
+    own_conn = conn is None
+    if own_conn:
+        conn = _connect(manifest_path(output_dir))
+    try:
+        with conn:
+            conn.execute(
+                f"UPDATE features SET {assignments} WHERE feature_id = ?",
+                list(fields.values()) + [str(feature_id)]
+            )
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def read_manifest(output_dir, conn=None):
+    """
+    Read the run manifest as a DataFrame indexed by feature ID.
+
+    ``conn`` is an optional connection from ``connect_manifest``. Returns
+    None when the run has no manifest.
+    """
+    path = manifest_path(output_dir)
+    own_conn = conn is None
+    if own_conn:
+        if not os.path.exists(path):
+            return None
+        conn = _connect(path)
+    try:
+        manifest = pd.read_sql_query(
+            "SELECT * FROM features ORDER BY ordinal", conn,
+            index_col="feature_id"
+        )
+    finally:
+        if own_conn:
+            conn.close()
+    return manifest
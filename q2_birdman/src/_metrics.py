@@ -0,0 +1,189 @@
+import os
+import time
+from contextlib import contextmanager
+from glob import glob
+import pandas as pd
+from ._resources import collect_resources
+
+METRICS_COLUMNS = ["scope", "name", "chunk", "stage", "seconds"]
+# Quantiles of the per-feature stage times reported in the run summary
+METRICS_QUANTILES = (0.5, 0.95)
+
+
+class StageTimer:
+    """
+    Accumulate wall-clock time spent in named stages.
+
+    Timing a stage costs two ``perf_counter`` calls, so timers can wrap the
+    per-feature hot path.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        """Add time measured elsewhere to a stage."""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+
+def metrics_path(input_dir, name):
+    """Path of the stage timings written by one worker or step of a run."""
+    return os.path.join(input_dir, "results", "metrics", f"{name}.tsv")
+
+
+def append_metrics(input_dir, name, stages, scope="feature", label=None,
+                   chunk=None):
+    """
+    Append stage timings to a metrics file of the run.
+
+    Each writer (a chunk, or a run-level step such as summarization) owns its
+    file, so appends never race with other workers.
+
+    Parameters
+    ----------
+    input_dir : str
+        Run output directory
+    name : str
+        Metrics file to append to, e.g. ``chunk_0001`` or ``run``
+    stages : dict of str to float
+        Seconds spent in each stage
+    scope : str
+        ``"feature"`` for per-feature timings, ``"chunk"`` or ``"run"`` for
+        timings of a whole chunk or run-level step
+    label : str, optional
+        Feature ID or step the timings belong to, defaults to ``name``
+    chunk : int, optional
+        Chunk the feature belongs to
+    """
+    path = metrics_path(input_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rows = pd.DataFrame(
+        [(scope, label or name, chunk, stage, seconds)
+         for stage, seconds in stages.items()],
+        columns=METRICS_COLUMNS
+    )
+    rows.to_csv(
+        path, sep="\t", index=False, mode="a", header=not os.path.exists(path)
+    )
+
+
+def _summarize_stages(metrics):
+    grouped = metrics.groupby(["scope", "stage"], sort=False)["seconds"]
+    summary = grouped.agg(["count", "sum", "mean", "max"]).rename(
+        columns={"sum": "total_seconds", "mean": "mean_seconds",
+                 "max": "max_seconds"}
+    )
+    for q in METRICS_QUANTILES:
+        summary[f"p{q * 100:g}_seconds"] = grouped.quantile(q)
+    return summary.reset_index()
+
+
+def _prometheus_name(stage):
+    return "".join(c if c.isalnum() else "_" for c in stage)
+
+
+def write_prometheus(path, summary, resources=None):
+    """
+    Write run-level stage totals in the Prometheus text exposition format.
+
+    Every stage becomes a ``birdman_stage_seconds`` summary with ``_sum``
+    and ``_count`` samples labelled by scope and stage, so the file can be
+    picked up by the node exporter's textfile collector. With a resource
+    summary, peak memory per worker is exported as gauges labelled by N.
+    """
+    lines = [
+        "# HELP birdman_stage_seconds "
+        "Wall-clock time spent in each BIRDMAn stage.",
+        "# TYPE birdman_stage_seconds summary",
+    ]
+    for row in summary.itertuples(index=False):
+        labels = f'scope="{row.scope}",stage="{_prometheus_name(row.stage)}"'
+        for q in METRICS_QUANTILES:
+            value = getattr(row, f"p{q * 100:g}_seconds")
+            lines.append(
+                f'birdman_stage_seconds{{{labels},quantile="{q:g}"}} '
+                f'{value:.6f}')
+        lines.append(
+            f"birdman_stage_seconds_sum{{{labels}}} {row.total_seconds:.6f}")
+        lines.append(f"birdman_stage_seconds_count{{{labels}}} {row.count}")
+    if resources is not None:
+        for metric, column, help_text in (
+            ("birdman_worker_peak_rss_bytes", "worker_peak_rss_mb",
+             "Peak RSS of a Python worker."),
+            ("birdman_cmdstan_peak_rss_bytes", "cmdstan_peak_rss_mb",
+             "Peak RSS of a CmdStan chain process."),
+            ("birdman_memory_per_worker_bytes", "memory_per_worker_mb",
+             "Peak memory of a worker and its parallel chains."),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for row in resources.itertuples(index=False):
+                value = getattr(row, column) * 1024 ** 2
+                lines.append(
+                    f'{metric}{{n_samples="{row.n_samples}"}} {value:.0f}')
+    # Write next to the target and rename so collectors never read a
+    # partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+def collect_metrics(input_dir, prometheus=False):
+    """
+    Gather the stage timings and resource usage of a run into its metrics
+    tables.
+
+    Writes every timing to ``results/metrics.tsv`` (and
+    ``results/metrics.parquet`` when a parquet engine is installed), and
+    per-stage counts, totals, means, quantiles and maxima to
+    ``results/metrics_summary.tsv``. Per-feature resource usage and its
+    sizing summary go to ``results/resources.tsv`` and
+    ``results/resources_summary.tsv``.
+
+    Parameters
+    ----------
+    input_dir : str
+        Run output directory
+    prometheus : bool
+        Also write the stage and memory summaries to ``results/metrics.prom``
+
+    Returns
+    -------
+    pd.DataFrame or None
+        Per-stage summary, or None when no timings were recorded
+    """
+    resources = collect_resources(input_dir)
+    all_metric_files = sorted(glob(f"{input_dir}/results/metrics/*.tsv"))
+    if not all_metric_files:
+        return None
+
+    metrics = pd.concat(
+        [pd.read_csv(f, sep="\t", dtype={"name": str})
+         for f in all_metric_files],
+        ignore_index=True
+    )
+    metrics.to_csv(f"{input_dir}/results/metrics.tsv", sep="\t", index=False)
+    try:
+        metrics.to_parquet(f"{input_dir}/results/metrics.parquet", index=False)
+    except ImportError:
+        # Parquet output needs pyarrow or fastparquet; the TSV is always written
+        pass
+
+    summary = _summarize_stages(metrics)
+    summary.to_csv(
+        f"{input_dir}/results/metrics_summary.tsv", sep="\t", index=False
+    )
+    if prometheus:
+        write_prometheus(
+            f"{input_dir}/results/metrics.prom", summary, resources
+        )
+    return summary
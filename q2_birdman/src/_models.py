@@ -0,0 +1,200 @@
+import fcntl
+import hashlib
+import json
+import os
+import platform
+import shutil
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+from importlib import resources
+
+import click
+import cmdstanpy
+
+# Bundled Stan models, by name, in q2_birdman/src/stan
+MODELS = {
+    "negative_binomial_single": "negative_binomial_single.stan",
+    "negative_binomial_lme_single": "negative_binomial_lme_single.stan",
+}
+DEFAULT_MODEL = "negative_binomial_single"
+CACHE_ENV = "Q2_BIRDMAN_STAN_CACHE"
+NATIVE_ENV = "Q2_BIRDMAN_MARCH_NATIVE"
+# stanc's O1 optimizations. -O3 is already CmdStan's default and is only
+# spelled out so builds are rekeyed should that default change
+STANC_OPTIONS = {"O1": True}
+CPP_OPTIONS = {"O": 3}
+# Only for builds that will run on the CPU they were built on
+NATIVE_CPP_OPTIONS = {"CXXFLAGS_OPTIM": "-march=native -mtune=native"}
+EXE_SUFFIX = ".exe" if platform.system() == "Windows" else ""
+
+
+def model_file(name=DEFAULT_MODEL):
+    """Path of a bundled Stan model, resolved through the package resources."""
+    if name not in MODELS:
+        raise ValueError(
+            f"Unknown model {name!r}, expected one of {list(MODELS)}")
+    return str(resources.files("q2_birdman.src").joinpath("stan", MODELS[name]))
+
+
+def cache_root():
+    """
+    Per-user directory holding compiled models.
+
+    ``$Q2_BIRDMAN_STAN_CACHE`` if set, else ``q2-birdman/stan`` under
+    ``$XDG_CACHE_HOME`` (``~/.cache`` by default).
+    """
+    if os.environ.get(CACHE_ENV):
+        return os.path.expanduser(os.environ[CACHE_ENV])
+    xdg_cache = (os.environ.get("XDG_CACHE_HOME")
+                 or os.path.expanduser("~/.cache"))
+    return os.path.join(xdg_cache, "q2-birdman", "stan")
+
+
+def native_default():
+    """Whether ``$Q2_BIRDMAN_MARCH_NATIVE`` asks for -march=native builds."""
+    return os.environ.get(NATIVE_ENV, "").lower() in ("1", "true", "yes")
+
+
+def _cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def compiler_options(native=False):
+    """stanc and C++ options the bundled models are built with."""
+    cpp_options = dict(CPP_OPTIONS)
+    if native:
+        cpp_options.update(NATIVE_CPP_OPTIONS)
+    return dict(STANC_OPTIONS), cpp_options
+
+
+def build_dir(name=DEFAULT_MODEL, native=False):
+    """
+    Cache directory of one build of a model.
+
+    Builds are keyed by the model source, the compiler options and the CmdStan
+    installation, and native builds also by the CPU, so a changed model, an
+    upgraded CmdStan or a node with another CPU gets a fresh build.
+    """
+    with open(model_file(name), "rb") as f:
+        source = f.read()
+    stanc_options, cpp_options = compiler_options(native)
+    key = hashlib.sha256(source)
+    key.update(
+        json.dumps([stanc_options, cpp_options], sort_keys=True).encode()
+    )
+    key.update(os.path.realpath(cmdstanpy.cmdstan_path()).encode())
+    if native:
+        key.update(_cpu_model().encode())
+    return os.path.join(cache_root(), f"{name}-{key.hexdigest()[:16]}")
+
+
+@contextmanager
+def _build_lock(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "w") as lock:
+        # Workers and concurrent runs wait for the first build instead of
+        # compiling the same model side by side
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def compile_model(name=DEFAULT_MODEL, native=None, force=False):
+    """
+    Compile a bundled model into the per-user cache, unless already built.
+
+    Parameters
+    ----------
+    name : str
+        Model in ``MODELS``
+    native : bool, optional
+        Build with ``-march=native``. Such builds are only valid on the CPU
+        they were built on and are cached per CPU model. Defaults to
+        ``$Q2_BIRDMAN_MARCH_NATIVE``
+    force : bool
+        Rebuild even if a cached build exists
+
+    Returns
+    -------
+    str
+        Path of the compiled executable
+    """
+    if native is None:
+        native = native_default()
+    path = build_dir(name, native)
+    exe_file = os.path.join(path, f"{name}{EXE_SUFFIX}")
+    if os.path.exists(exe_file) and not force:
+        return exe_file
+    with _build_lock(path):
+        if os.path.exists(exe_file) and not force:
+            return exe_file
+        os.makedirs(path, exist_ok=True)
+        # Build in a scratch directory next to the cache entry and move the
+        # finished executable into place, so the unlocked check above never
+        # finds a half-written build
+        tmp_dir = tempfile.mkdtemp(prefix=".build-", dir=path)
+        try:
+            # Copy the source so the executable is written next to it rather
+            # than into the installed package
+            stan_file = shutil.copy(model_file(name), tmp_dir)
+            stanc_options, cpp_options = compiler_options(native)
+            cmdstanpy.CmdStanModel(
+                stan_file=stan_file, stanc_options=stanc_options,
+                cpp_options=cpp_options
+            )
+            os.replace(
+                stan_file, os.path.join(path, os.path.basename(stan_file))
+            )
+            os.replace(os.path.join(tmp_dir, f"{name}{EXE_SUFFIX}"), exe_file)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return exe_file
+
+
+@lru_cache(maxsize=None)
+def compiled_model(name=DEFAULT_MODEL, native=None):
+    """
+    Load a bundled model, compiling it on first use.
+
+    Models are loaded from their executable only, so nothing is compiled or
+    parsed by stanc once a build is cached, and each process loads a model
+    once.
+    """
+    if native is None:
+        native = native_default()
+    return cmdstanpy.CmdStanModel(exe_file=compile_model(name, native))
+
+
+def compile_models(native=None, force=False):
+    """
+    Compile all bundled models into the per-user cache.
+
+    Returns
+    -------
+    dict of str to str
+        Path of the executable of each model
+    """
+    if native is None:
+        native = native_default()
+    return {name: compile_model(name, native, force) for name in MODELS}
+
+
+@click.command()
+@click.option("--native/--portable", default=None,
+              help="Build with -march=native "
+                   "(default: $Q2_BIRDMAN_MARCH_NATIVE).")
+@click.option("--force", is_flag=True, help="Rebuild cached models.")
+def main(native, force):
+    """Compile the bundled BIRDMAn Stan models into the per-user cache."""
+    for name, exe_file in compile_models(native, force).items():
+        click.echo(f"{name}: {exe_file}")
@@ -0,0 +1,98 @@
+import os
+from math import ceil
+import pandas as pd
+
+from ._manifest import read_manifest, write_manifest
+from ._utils import link_or_copy
+
+
+def partition_feature_ids(feature_ids, num_partitions):
+    """
+    Split feature IDs into contiguous partitions.
+
+    Uses the same chunking as birdman's ``ModelIterator``, so partitions hold
+    ``ceil(len(feature_ids) / num_partitions)`` features each and there may be
+    fewer partitions than requested.
+
+    Parameters
+    ----------
+    feature_ids : sequence of str
+        Feature IDs in table order
+    num_partitions : int
+        Requested number of partitions
+
+    Returns
+    -------
+    list of list of str
+        Non-empty partitions in table order
+    """
+    feature_ids = list(feature_ids)
+    if not feature_ids:
+        return []
+    size = ceil(len(feature_ids) / num_partitions)
+    return [feature_ids[i:i + size] for i in range(0, len(feature_ids), size)]
+
+
+def partition_table(table, num_partitions):
+    """Split a feature table into tables of contiguous features."""
+    return [
+        table.filter(ids, axis="observation", inplace=False)
+        for ids in partition_feature_ids(
+            table.ids(axis="observation"), num_partitions
+        )
+    ]
+
+
+def merge_inference_dirs(input_dirs, output_dir):
+    """
+    Merge the inferences and manifests of several runs into one directory.
+
+    Inference files are linked (or copied) into ``output_dir/inferences``
+    with a per-run prefix, as chunk stores of different runs share names.
+    Features keep their records and are renumbered in the order of
+    ``input_dirs``, which for partitions of one table is the table order.
+
+    Parameters
+    ----------
+    input_dirs : sequence of str
+        Directories holding ``inferences/`` and ``manifest.sqlite``
+    output_dir : str
+        Directory to merge into
+
+    Returns
+    -------
+    pd.DataFrame
+        Merged manifest
+
+    Raises
+    ------
+    ValueError
+        If a feature appears in more than one input
+    """
+    os.makedirs(os.path.join(output_dir, "inferences"), exist_ok=True)
+    manifests = []
+    for i, input_dir in enumerate(input_dirs):
+        prefix = f"P{str(i).zfill(4)}_"
+        for name in os.listdir(os.path.join(input_dir, "inferences")):
+            link_or_copy(
+                os.path.join(input_dir, "inferences", name),
+                os.path.join(output_dir, "inferences", prefix + name)
+            )
+        manifest = read_manifest(input_dir)
+        manifest["output"] = manifest["output"].map(
+            lambda output: None if pd.isna(output) else os.path.join(
+                "inferences", prefix + os.path.basename(output)
+            )
+        )
+        manifests.append(manifest)
+
+    merged = pd.concat(manifests)
+    duplicated = merged.index[merged.index.duplicated()]
+    if len(duplicated):
+        raise ValueError(
+            "Features fit in more than one input: "
+            f"{', '.join(map(str, duplicated[:10]))}"
+        )
+    merged["ordinal"] = range(len(merged))
+    write_manifest(output_dir, merged)
+    return merged
@@ -1,9 +1,16 @@
+import json
 import os
+from functools import partial
 import numpy as np
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-from src._utils import _create_folder_without_clear
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from ._summarize import _parallel, read_summary
+
+# Features shown at each end of the top-features plot
+TOP_N = 25
+# Overview plots label features only up to this many
+OVERVIEW_MAX_LABELS = 200
 
 
 # TODO: INTEGRATE
@@ -40,86 +47,265 @@ def parse_taxon(taxon):
 df['Genus'], df['Species'] = zip(*df['taxon'].apply(parse_taxon))
 """
 
+
+def _label_features(inf, fmd):
+    """Index a summary by feature names from the first column of ``fmd``."""
+    if set(inf.index).issubset(set(fmd.index)):
+        tmp = inf.merge(
+            fmd.iloc[:, 0], left_index=True, right_index=True, how="left"
+        )
+        tmp.set_index(tmp.columns[-1], drop=True, inplace=True)
+        tmp.index.names = ["Feature"]
+        return tmp
+    else:
+        raise Exception(
+            "Error: Feature metadata does not contain all feature ids in "
+            "summarized inference tsv file."
+        )
+
+
 def _read_results(p, feature_md_path):
-    inf = pd.read_csv(p, sep="\t", index_col="Feature")
+    inf = read_summary(p)
+    inf.index.name = "Feature"
 
     if feature_md_path:
         # assume first column is feature id and second column is feature name
         fmd = pd.read_csv(feature_md_path, sep="\t", index_col=0)
-        if set(inf.index).issubset(set(fmd.index)):
-            tmp = inf.merge(
-                fmd.iloc[:, 0], left_index=True, right_index=True, how="left"
-            )
-            tmp.set_index(tmp.columns[-1], drop=True, inplace=True)
-            tmp.index.names = ["Feature"]
-            return tmp
-        else:
-            raise Exception(
-                "Error: Feature metadata does not contain all feature ids in summarized inference tsv file."
-            )
+        return _label_features(inf, fmd)
     else:
         return inf
 
 
 def _unpack_hdi_and_filter(df, col):
-    df[["lower", "upper"]] = df[col].str.split(",", expand=True)
-    # remove ( from lower and ) from upper and convert to float
-    df.lower = df.lower.str[1:].astype("float")
-    df.upper = df.upper.str[:-1].astype("float")
+    """
+    Return the HDI of ``col`` as error bar lengths around the mean.
 
-    df["credible"] = np.where((df.lower > 0) | (df.upper < 0), "yes", "no")
+    ``df`` is left untouched; the returned copy has ``lower``/``upper``
+    distances from ``<var>_mean`` to the numeric ``<col>_lower``/
+    ``<col>_upper`` bounds and a ``credible`` column marking HDIs that
+    exclude zero.
+    """
+    mean = df[col.replace("hdi", "mean")]
+    lower = df[col + "_lower"]
+    upper = df[col + "_upper"]
+    return df.assign(
+        lower=mean - lower,
+        upper=upper - mean,
+        credible=np.where((lower > 0) | (upper < 0), "yes", "no"),
+    )
 
-    df.upper = df.upper - df[col.replace("hdi", "mean")]
-    df.lower = df[col.replace("hdi", "mean")] - df.lower
 
-    return df
+def _credible_features(df, var):
+    sub_df = _unpack_hdi_and_filter(df, var + "_hdi")
+    sub_df = sub_df.loc[sub_df.credible == "yes"].sort_values(by=var + "_mean")
+    sub_df.index.name = "Feature"
+    return sub_df
 
 
-def _display_top_n_feats(df, n, yvar, xvar, xlab, ylab, title, outdir):
+def _top_n_feats(df, n):
     if df.shape[0] < 2 * n:
-        df_for_display = df
-    else:
-        bottomn = df[:n]
-        topn = df[-1 * n :]
-        df_for_display = pd.concat([bottomn, topn])
-
-    sns.stripplot(data=df_for_display, y=yvar, x=xvar)
-    plt.errorbar(
-        data=df_for_display,
-        x=xvar,
-        y=yvar,
-        xerr=df_for_display[["lower", "upper"]].T,
-        ls="none",
+        return df
+    return pd.concat([df[:n], df[-1 * n:]])
+
+
+def _draw_intervals(ax, df, var, rasterized=False):
+    positions = np.arange(len(df))
+    ax.errorbar(
+        df[var + "_mean"], positions,
+        xerr=df[["lower", "upper"]].T.values,
+        fmt="o", markersize=3 if rasterized else 5,
+        elinewidth=0.5 if rasterized else 1,
+        ls="none", rasterized=rasterized,
     )
-    plt.ylabel(ylab)
-    plt.xlabel(xlab)
-    plt.title(title)
-    plt.savefig(f'{outdir}/{xlab.split("Ratio for ")[1]}_plot.png', bbox_inches='tight')
-    plt.savefig(f'{outdir}/{xlab.split("Ratio for ")[1]}_plot.svg', bbox_inches='tight')
-
-def birdman_plot_single_var(df_inf, var, flip, outdir):
-    # TODO: move print statements to log
-    # print("Unfiltered Shape:  " + str(df_inf.shape))
-    sub_df = _unpack_hdi_and_filter(df_inf, var + "_hdi")
-    sub_df.rename_axis(index="Feature", inplace=True)
-    sub_df = sub_df.sort_values(by=var + "_mean")
-    # print("Filtered Shape: " + str(sub_df.loc[sub_df["credible"] == "yes"].shape))
-
-    xlab = "Ratio for " + var  # e.g. var = "host_age[T.34]_"
-    ylab = "Features"
-    df_for_display = sub_df.reset_index()
-    df_for_display = df_for_display.loc[df_for_display.credible == "yes"]
-    fig, ax = plt.subplots(figsize=(6, 10))
-    _display_top_n_feats(
-        df_for_display, 25, "Feature", var + "_mean", xlab, ylab, "Top Features", outdir
+    ax.axvline(0, color="grey", lw=0.5)
+    ax.set_ylim(-1, max(len(df), 1))
+    ax.invert_yaxis()
+    if len(df) and (not rasterized or len(df) <= OVERVIEW_MAX_LABELS):
+        ax.set_yticks(positions)
+        ax.set_yticklabels(df.index.astype(str))
+    else:
+        ax.set_yticks([])
+    if not len(df):
+        ax.text(0.5, 0.5, "No credible features", transform=ax.transAxes,
+                ha="center", va="center")
+
+
+def _save(fig, path, svg):
+    FigureCanvasAgg(fig)
+    fig.savefig(f"{path}.png", bbox_inches="tight")
+    if svg:
+        fig.savefig(f"{path}.svg", bbox_inches="tight")
+
+
+def plot_variable(df, var, outdir, top_n=TOP_N, svg=False, overview=False):
+    """
+    Plot the posterior mean and HDI of the credible features of a variable.
+
+    Figures are drawn with the Agg canvas directly, without pyplot, so they
+    render the same in worker processes and headless sessions.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Summary with numeric ``<var>_mean`` and ``<var>_hdi_lower``/
+        ``<var>_hdi_upper`` columns, indexed by feature
+    var : str
+        Variable (covariate) to plot
+    outdir : str
+        Directory to write ``<var>_plot.png`` to
+    top_n : int
+        Number of features shown at each end of the plot
+    svg : bool
+        Also write an SVG of every figure
+    overview : bool
+        Also write ``<var>_overview.png``, a rasterized plot of every
+        credible feature
+
+    Returns
+    -------
+    list of str
+        Names of the written figures, without extension
+    """
+    sub_df = _credible_features(df, var)
+    xlab = "Ratio for " + var  # e.g. var = "host_age[T.34]"
+
+    names = [f"{var}_plot"]
+    fig = Figure(figsize=(6, 10))
+    ax = fig.add_subplot()
+    _draw_intervals(ax, _top_n_feats(sub_df, top_n), var)
+    ax.set(xlabel=xlab, ylabel="Features", title="Top Features")
+    _save(fig, os.path.join(outdir, names[-1]), svg)
+
+    if overview:
+        names.append(f"{var}_overview")
+        height = min(max(4, 0.01 * len(sub_df)), 30)
+        fig = Figure(figsize=(6, height))
+        ax = fig.add_subplot()
+        _draw_intervals(ax, sub_df, var, rasterized=True)
+        ax.set(xlabel=xlab, ylabel=f"Features ({len(sub_df)} credible)",
+               title="All Credible Features")
+        _save(fig, os.path.join(outdir, names[-1]), svg)
+    return names
+
+
+def _plot_variable_job(job, outdir, **kwargs):
+    var, df = job
+    return plot_variable(df, var, outdir, **kwargs)
+
+
+def plot_variables(df, variables, outdir, threads=1, **kwargs):
+    """
+    Plot several variables of a summary, one worker process per variable.
+
+    Each worker only receives the columns of its variable. Keyword
+    arguments are passed to ``plot_variable``.
+
+    Returns
+    -------
+    dict of str to list of str
+        Names of the figures written for each variable
+    """
+    jobs = [
+        (var, df[[f"{var}_mean", f"{var}_hdi_lower", f"{var}_hdi_upper"]])
+        for var in variables
+    ]
+    names = _parallel(
+        threads, partial(_plot_variable_job, outdir=outdir, **kwargs), jobs
     )
+    return dict(zip(variables, names))
+
+
+def birdman_plot_single_var(df_inf, var, flip, outdir, **kwargs):
+    return plot_variable(df_inf, var, outdir, **kwargs)
 
 
-def birdman_plot_multiple_vars(input_dir, variables, feature_metadata, flip):
+def birdman_plot_multiple_vars(input_dir, variables, feature_metadata, flip,
+                               threads=1, **kwargs):
     #_create_folder_without_clear(output_dir)
-    input_path = os.path.join(input_dir, "results", "beta_var.tsv")
+    input_path = os.path.join(input_dir, "results", "beta_var.parquet")
+    if not os.path.exists(input_path):
+        input_path = os.path.join(input_dir, "results", "beta_var.tsv")
     output_dir = os.path.join(input_dir, "plots")
     df = _read_results(input_path, feature_metadata)
     variables = [v.strip() for v in variables.split(",")]
+    return plot_variables(df, variables, output_dir, threads=threads, **kwargs)
+
+
+def _compact(values, digits=5):
+    # Rounded to a few significant digits to keep payloads of many
+    # features small; missing values become null
+    return [
+        None if np.isnan(v) else float(f"{v:.{digits}g}")
+        for v in np.asarray(values, dtype=float)
+    ]
+
+
+def summary_variables(df):
+    """Variables of a summary that have a mean and both HDI bounds."""
+    return [
+        c[:-len("_mean")] for c in df.columns
+        if c.endswith("_mean")
+        and {c.replace("_mean", "_hdi_lower"), c.replace("_mean", "_hdi_upper")}
+        <= set(df.columns)
+    ]
+
+
+def build_payload(df, variables=None, feature_metadata=None):
+    """
+    Precompute the data of the interactive plot in a compact columnar form.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Summary with numeric ``<var>_mean`` and ``<var>_hdi_lower``/
+        ``<var>_hdi_upper`` columns, indexed by feature
+    variables : sequence of str, optional
+        Variables to include, defaults to every variable of the summary
+    feature_metadata : pd.DataFrame, optional
+        Feature metadata indexed by feature; its first column labels features
+
+    Returns
+    -------
+    dict
+        Feature IDs, optional labels and metadata columns, and per variable
+        the mean, HDI bounds and credibility (HDI excludes zero) of every
+        feature, as lists aligned with the feature IDs
+    """
+    if variables is None:
+        variables = summary_variables(df)
+    payload = {"features": [str(f) for f in df.index], "variables": {}}
+    if feature_metadata is not None:
+        fmd = feature_metadata.reindex(df.index)
+        payload["labels"] = fmd.iloc[:, 0].fillna("").astype(str).tolist()
+        payload["metadata"] = {
+            str(col): fmd[col].fillna("").astype(str).tolist()
+            for col in fmd.columns
+        }
     for var in variables:
-        birdman_plot_single_var(df, var, flip, output_dir)
+        lower = df[var + "_hdi_lower"]
+        upper = df[var + "_hdi_upper"]
+        payload["variables"][var] = {
+            "mean": _compact(df[var + "_mean"]),
+            "lower": _compact(lower),
+            "upper": _compact(upper),
+            "credible": ((lower > 0) | (upper < 0)).astype(int).tolist(),
+        }
+    return payload
+
+
+def write_interactive_plot(payload, outdir, template):
+    """
+    Write the interactive plot with its payload embedded in the page.
+
+    The payload is also written to ``data.json`` for reuse outside the
+    page.
+    """
+    data = json.dumps(payload, separators=(",", ":"), allow_nan=False)
+    with open(os.path.join(outdir, "data.json"), "w") as f:
+        f.write(data)
+    with open(template) as f:
+        page = f.read()
+    # "</" would end the embedding script element early
+    page = page.replace("{{ payload }}", data.replace("</", "<\\/"))
+    with open(os.path.join(outdir, "index.html"), "w") as f:
+        f.write(page)
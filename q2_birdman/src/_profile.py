@@ -0,0 +1,137 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+from contextlib import contextmanager
+from functools import reduce
+from glob import glob
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+    from pyinstrument.renderers import ConsoleRenderer
+    from pyinstrument.session import Session
+except ImportError:
+    SamplingProfiler = None
+
+PROFILE_MODES = ("none", "cprofile", "sampling")
+# Number of functions listed in each section of the hotspot report
+REPORT_LINES = 40
+
+
+def profile_dir(output_dir):
+    """Directory holding the profiles of a run."""
+    return os.path.join(output_dir, "profiles")
+
+
+def resolve_profile_mode(mode):
+    """
+    Validate a profiling mode, falling back to cProfile when the sampling
+    profiler (pyinstrument) is not installed.
+    """
+    if mode not in PROFILE_MODES:
+        raise ValueError(
+            f"Unknown profiling mode {mode!r}, expected one of {PROFILE_MODES}"
+        )
+    if mode == "sampling" and SamplingProfiler is None:
+        logging.getLogger("birdman").warning(
+            "pyinstrument is not installed, profiling with cProfile instead"
+        )
+        return "cprofile"
+    return mode
+
+
+@contextmanager
+def profiled(output_dir, name, mode="none"):
+    """
+    Profile the enclosed block and write the profile to the run directory.
+
+    Parameters
+    ----------
+    output_dir : str
+        Run output directory
+    name : str
+        Name of the profile, e.g. ``chunk_0001`` or ``summarize``
+    mode : str
+        ``"none"`` to run unprofiled, ``"cprofile"`` to write
+        ``profiles/<name>.prof``, or ``"sampling"`` to write a pyinstrument
+        session to ``profiles/<name>.pyisession``
+    """
+    if mode == "none":
+        yield
+        return
+
+    os.makedirs(profile_dir(output_dir), exist_ok=True)
+    path = os.path.join(profile_dir(output_dir), name)
+    if mode == "sampling":
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop().save(f"{path}.pyisession")
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(f"{path}.prof")
+
+
+def write_profile_report(output_dir):
+    """
+    Merge the profiles of a run into a hotspot report.
+
+    cProfile profiles are merged into ``profiles/merged.prof`` (readable by
+    pstats, snakeviz, ...) and their top functions by cumulative and own
+    time are listed in ``profiles/hotspots.txt``. Sampling profiles are
+    combined into ``profiles/merged.pyisession`` and rendered as a call
+    tree in the same report.
+
+    Returns
+    -------
+    str or None
+        Path of the report, or None when the run has no profiles
+    """
+    prof_dir = profile_dir(output_dir)
+    merged_names = {"merged.prof", "merged.pyisession"}
+    prof_files = [
+        f for f in sorted(glob(f"{prof_dir}/*.prof"))
+        if os.path.basename(f) not in merged_names
+    ]
+    session_files = [
+        f for f in sorted(glob(f"{prof_dir}/*.pyisession"))
+        if os.path.basename(f) not in merged_names
+    ]
+
+    sections = []
+    if prof_files:
+        out = io.StringIO()
+        stats = pstats.Stats(*prof_files, stream=out)
+        stats.dump_stats(os.path.join(prof_dir, "merged.prof"))
+        for sort_key in ("cumulative", "tottime"):
+            out.write(
+                f"=== Top {REPORT_LINES} functions by {sort_key} time ===\n")
+            stats.sort_stats(sort_key).print_stats(REPORT_LINES)
+        sections.append(
+            "cProfile profiles merged: "
+            f"{', '.join(map(os.path.basename, prof_files))}\n"
+            + out.getvalue()
+        )
+    if session_files and SamplingProfiler is not None:
+        session = reduce(Session.combine, map(Session.load, session_files))
+        session.save(os.path.join(prof_dir, "merged.pyisession"))
+        sections.append(
+            "Sampling profiles merged: "
+            f"{', '.join(map(os.path.basename, session_files))}\n"
+            + ConsoleRenderer(unicode=False, color=False).render(session)
+        )
+    if not sections:
+        return None
+
+    report_path = os.path.join(prof_dir, "hotspots.txt")
+    with open(report_path, "w") as f:
+        f.write("\n\n".join(sections))
+    return report_path
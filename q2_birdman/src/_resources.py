@@ -0,0 +1,244 @@
+import os
+import resource
+import sys
+from glob import glob
+import numpy as np
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+MAXRSS_BYTES = 1 if sys.platform == "darwin" else 1024
+# ru_oublock counts 512-byte blocks written to block devices
+BLOCK_BYTES = 512
+RESOURCES_SUMMARY = "resources_summary.tsv"
+MEMORY_SCALING = "memory_scaling.tsv"
+
+
+def _current_rss():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return np.nan
+
+
+def resource_snapshot():
+    """
+    Snapshot the resource use of this process and its reaped children.
+
+    Children are the CmdStan processes run by cmdstanpy, which are waited
+    for before ``fit_model`` returns.
+
+    Returns
+    -------
+    dict
+        Cumulative CPU seconds and bytes written to block devices of the
+        worker and its children, the high-water RSS of the worker and of its
+        largest child, and the worker's current RSS
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "cpu_seconds": own.ru_utime + own.ru_stime,
+        "child_cpu_seconds": children.ru_utime + children.ru_stime,
+        "write_bytes": own.ru_oublock * BLOCK_BYTES,
+        "child_write_bytes": children.ru_oublock * BLOCK_BYTES,
+        "peak_rss_bytes": own.ru_maxrss * MAXRSS_BYTES,
+        "child_peak_rss_bytes": children.ru_maxrss * MAXRSS_BYTES,
+        "rss_bytes": _current_rss(),
+    }
+
+
+def resource_usage(before, after):
+    """
+    Resource use between two snapshots.
+
+    CPU time and bytes written are differenced. Peak RSS values are
+    high-water marks of the whole worker (or of its largest child so far),
+    so they are taken from ``after``; a feature's own peak is only visible
+    when it raised the mark.
+    """
+    usage = {
+        key: after[key] - before[key]
+        for key in ("cpu_seconds", "child_cpu_seconds", "write_bytes",
+                    "child_write_bytes")
+    }
+    usage.update(
+        peak_rss_bytes=after["peak_rss_bytes"],
+        child_peak_rss_bytes=after["child_peak_rss_bytes"],
+        rss_bytes=after["rss_bytes"],
+    )
+    return usage
+
+
+def resources_path(input_dir, name):
+    """Path of the per-feature resource usage written by one chunk."""
+    return os.path.join(input_dir, "results", "resources", f"{name}.tsv")
+
+
+def append_resources(input_dir, name, feature_id, chunk, usage, **fields):
+    """
+    Append the resource usage of one feature to its chunk's table.
+
+    Parameters
+    ----------
+    input_dir : str
+        Run output directory
+    name : str
+        Table to append to, e.g. ``chunk_0001``
+    feature_id : str
+        Feature the usage belongs to
+    chunk : int
+        Chunk the feature belongs to
+    usage : dict
+        Output of ``resource_usage``
+    fields
+        Further columns, e.g. ``n_samples`` or ``output_bytes``
+    """
+    path = resources_path(input_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    row = pd.DataFrame([{
+        "feature id": feature_id, "chunk": chunk, "pid": os.getpid(),
+        **fields, **usage,
+    }])
+    row.to_csv(
+        path, sep="\t", index=False, mode="a", header=not os.path.exists(path)
+    )
+
+
+def summarize_resources(resources):
+    """
+    Aggregate per-feature resource usage into a per-run sizing summary.
+
+    One row is written per model size (number of samples N). Memory per
+    worker is the peak RSS of the Python worker plus one CmdStan process per
+    chain, since cmdstanpy runs the chains in parallel.
+    """
+    grouped = resources.groupby("n_samples")
+    summary = pd.DataFrame({
+        "features": grouped.size(),
+        "workers": grouped["pid"].nunique(),
+        "chains": grouped["chains"].max(),
+        "worker_peak_rss_mb": grouped["peak_rss_bytes"].max() / 1024 ** 2,
+        "cmdstan_peak_rss_mb": (
+            grouped["child_peak_rss_bytes"].max() / 1024 ** 2
+        ),
+        "cpu_seconds_per_feature": (
+            grouped["cpu_seconds"].mean() + grouped["child_cpu_seconds"].mean()
+        ),
+        "output_mb_per_feature": grouped["output_bytes"].mean() / 1024 ** 2,
+        "written_mb": (
+            grouped["write_bytes"].sum() + grouped["child_write_bytes"].sum()
+        ) / 1024 ** 2,
+    })
+    summary["memory_per_worker_mb"] = (
+        summary["worker_peak_rss_mb"]
+        + summary["chains"] * summary["cmdstan_peak_rss_mb"]
+    )
+    return summary.reset_index()
+
+
+def collect_resources(input_dir):
+    """
+    Gather the per-feature resource usage of a run.
+
+    Writes every feature's usage to ``results/resources.tsv`` and the sizing
+    summary of ``summarize_resources`` to ``results/resources_summary.tsv``.
+
+    Returns
+    -------
+    pd.DataFrame or None
+        Sizing summary, or None when no usage was recorded
+    """
+    all_resource_files = sorted(glob(f"{input_dir}/results/resources/*.tsv"))
+    if not all_resource_files:
+        return None
+    resources = pd.concat(
+        [pd.read_csv(f, sep="\t", dtype={"feature id": str})
+         for f in all_resource_files],
+        ignore_index=True
+    )
+    resources.to_csv(
+        f"{input_dir}/results/resources.tsv", sep="\t", index=False
+    )
+    summary = summarize_resources(resources)
+    summary.to_csv(
+        f"{input_dir}/results/{RESOURCES_SUMMARY}", sep="\t", index=False
+    )
+    return summary
+
+
+def memory_scaling(work_dir):
+    """
+    Fit memory per worker against N across the runs of a work directory.
+
+    Parameters
+    ----------
+    work_dir : str
+        Directory holding ``run-*`` directories, as passed to ``run``
+
+    Returns
+    -------
+    summaries : pd.DataFrame
+        Sizing summaries of all runs, one row per run and N
+    fit : dict or None
+        Least-squares ``slope_mb`` (per sample) and ``intercept_mb`` of
+        ``memory_per_worker_mb`` against N, or None with fewer than two
+        distinct N
+    """
+    paths = sorted(glob(
+        os.path.join(work_dir, "run-*", "results", RESOURCES_SUMMARY)
+    ))
+    # Each summary lives in <work_dir>/<run>/results/
+    summaries = [
+        pd.read_csv(p, sep="\t").assign(run=os.path.basename(os.path.dirname(
+            os.path.dirname(p)
+        )))
+        for p in paths
+    ]
+    if not summaries:
+        return pd.DataFrame(), None
+    summaries = pd.concat(summaries, ignore_index=True)
+    if summaries["n_samples"].nunique() < 2:
+        return summaries, None
+    slope, intercept = np.polyfit(
+        summaries["n_samples"], summaries["memory_per_worker_mb"], 1
+    )
+    return summaries, {"slope_mb": slope, "intercept_mb": intercept}
+
+
+def write_memory_scaling(work_dir):
+    """
+    Write the sizing summaries of all runs of a work directory to
+    ``<work_dir>/memory_scaling.tsv``.
+
+    Each row of ``memory_scaling`` is written with the fitted ``slope_mb``
+    and ``intercept_mb`` (empty with fewer than two distinct N) and the
+    memory per worker they predict for that N. Concurrent runs may share a
+    work directory, so the table is replaced atomically.
+
+    Returns
+    -------
+    str or None
+        Path of the table, or None when no run recorded its resources
+    """
+    summaries, fit = memory_scaling(work_dir)
+    if summaries.empty:
+        return None
+    fit = fit or {"slope_mb": np.nan, "intercept_mb": np.nan}
+    summaries = summaries.assign(**fit)
+    summaries["predicted_memory_per_worker_mb"] = (
+        summaries["intercept_mb"]
+        + summaries["slope_mb"] * summaries["n_samples"]
+    )
+    path = os.path.join(work_dir, MEMORY_SCALING)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    summaries.to_csv(tmp_path, sep="\t", index=False)
+    os.replace(tmp_path, path)
+    return path
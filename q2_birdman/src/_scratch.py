@@ -0,0 +1,109 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+RAM_SCRATCH = "/dev/shm"
+# Bytes CmdStan writes per value in its CSV output (6 significant digits,
+# sign, exponent and separator)
+CSV_BYTES_PER_VALUE = 12
+# Sampler diagnostic columns in every CmdStan CSV row (lp__, accept_stat__, ...)
+CSV_SAMPLER_COLUMNS = 7
+
+
+def resolve_scratch_root(output_dir, scratch_dir=None):
+    """
+    Pick the run's root directory for per-feature CmdStan output.
+
+    Parameters
+    ----------
+    output_dir : str
+        Run output directory, used to name a scratch root unique to the run
+    scratch_dir : str, optional
+        Preferred scratch location. Defaults to the RAM-backed ``/dev/shm``
+        when available, then the node-local temporary directory.
+
+    Returns
+    -------
+    str or None
+        Scratch root shared by all workers of the run, or None if no
+        candidate location is writable
+    """
+    if scratch_dir:
+        candidates = [scratch_dir]
+    else:
+        candidates = [RAM_SCRATCH, tempfile.gettempdir()]
+    run_key = hashlib.blake2b(
+        os.path.abspath(output_dir).encode(), digest_size=6
+    ).hexdigest()
+    for candidate in candidates:
+        if os.path.isdir(candidate) and os.access(candidate, os.W_OK):
+            return os.path.join(candidate, f"q2-birdman-{run_key}")
+    return None
+
+
+def estimate_csv_bytes(model):
+    """Estimate the size of the CmdStan CSV files a ModelSingle fit writes."""
+    n = model.dat["N"]
+    p = model.dat["p"]
+    # beta_0, beta_x, inv_disp, beta_var, lam, log_lhood and y_predict
+    columns = CSV_SAMPLER_COLUMNS + 2 * p + 1 + 3 * n
+    return model.chains * model.num_iter * columns * CSV_BYTES_PER_VALUE
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                total += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return total
+
+
+def _has_room(scratch_root, needed_bytes, cap_bytes):
+    if scratch_root is None:
+        return False
+    os.makedirs(scratch_root, exist_ok=True)
+    if shutil.disk_usage(scratch_root).free < needed_bytes:
+        return False
+    # The cap covers the scratch used by every worker of the run together
+    return _dir_size(scratch_root) + needed_bytes <= cap_bytes
+
+
+@contextmanager
+def feature_scratch(name, scratch_root, fallback_root, needed_bytes, cap_bytes):
+    """
+    Provide a per-feature directory for CmdStan output and always remove it.
+
+    Parameters
+    ----------
+    name : str
+        Prefix of the per-feature directory, e.g. ``F0001_<feature id>``
+    scratch_root : str or None
+        Fast scratch root from ``resolve_scratch_root``
+    fallback_root : str
+        On-disk root used when the scratch root is missing, full, or would
+        exceed ``cap_bytes``
+    needed_bytes : int
+        Expected size of the feature's CmdStan output
+    cap_bytes : int
+        Maximum size of the scratch root across all workers
+
+    Yields
+    ------
+    str
+        Path of the per-feature directory
+    """
+    if _has_room(scratch_root, needed_bytes, cap_bytes):
+        root = scratch_root
+    else:
+        root = fallback_root
+    os.makedirs(root, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=f"{name}_", dir=root)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,107 @@
+import numpy as np
+
+try:
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa_csv = None
+
+# CmdStan sampler columns and their arviz sample_stats names
+SAMPLE_STATS = {
+    "lp__": "lp",
+    "accept_stat__": "acceptance_rate",
+    "stepsize__": "step_size",
+    "treedepth__": "tree_depth",
+    "n_leapfrog__": "n_steps",
+    "divergent__": "diverging",
+    "energy__": "energy",
+}
+
+
+def read_stan_csv_header(path):
+    """
+    Return the line number of a CmdStan CSV header and its column names.
+
+    Only the leading configuration comments are scanned, not the draws.
+    """
+    with open(path) as f:
+        for i, line in enumerate(f):
+            if not line.startswith("#"):
+                return i, line.rstrip("\n").split(",")
+    raise ValueError(f"No header found in CmdStan output {path}")
+
+
+def _read_columns(path, header_line, columns):
+    if pa_csv is not None:
+        # Multithreaded parse of just the requested columns; comment lines
+        # between and after the draws have a different number of fields and
+        # are skipped as invalid rows
+        table = pa_csv.read_csv(
+            path,
+            read_options=pa_csv.ReadOptions(
+                skip_rows=header_line, use_threads=True
+            ),
+            parse_options=pa_csv.ParseOptions(
+                invalid_row_handler=lambda row: "skip"
+            ),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=columns,
+                column_types={c: "float64" for c in columns},
+            ),
+        )
+        return np.column_stack([table.column(c).to_numpy() for c in columns])
+
+    import pandas as pd
+    return pd.read_csv(
+        path, comment="#", usecols=columns, dtype="float64", engine="c"
+    )[columns].to_numpy()
+
+
+def _variable_columns(header, variable):
+    # Scalars are written as "name", containers as "name.i.j" in
+    # column-major order
+    if variable in header:
+        return [variable], ()
+    columns = [c for c in header if c.split(".")[0] == variable]
+    if not columns:
+        raise KeyError(f"Variable {variable} not found in CmdStan output")
+    indices = np.array([[int(i) for i in c.split(".")[1:]] for c in columns])
+    return columns, tuple(indices.max(axis=0))
+
+
+def read_stan_csv_variables(csv_files, variables):
+    """
+    Read selected variables from per-chain CmdStan CSV files.
+
+    Parameters
+    ----------
+    csv_files : sequence of str
+        One CmdStan CSV file per chain
+    variables : sequence of str
+        Stan variables (e.g. ``"beta_var"``) or sampler columns
+        (e.g. ``"divergent__"``) to read. Other columns are never parsed.
+
+    Returns
+    -------
+    dict of str to np.ndarray
+        Draws of each variable with shape (chain, draw, *variable shape)
+    """
+    header_line, header = read_stan_csv_header(csv_files[0])
+    layout = {v: _variable_columns(header, v) for v in variables}
+    columns = [c for v in variables for c in layout[v][0]]
+
+    chains = np.stack(
+        [_read_columns(f, header_line, columns) for f in csv_files]
+    )
+    draws = {}
+    start = 0
+    for v in variables:
+        var_columns, shape = layout[v]
+        block = chains[:, :, start:start + len(var_columns)]
+        start += len(var_columns)
+        if not shape:
+            draws[v] = block[:, :, 0]
+            continue
+        # Undo CmdStan's column-major flattening of container variables
+        block = block.reshape(block.shape[:2] + shape[::-1])
+        draws[v] = block.transpose((0, 1) + tuple(range(len(shape) + 1, 1, -1)))
+    return draws
@@ -0,0 +1,244 @@
+import os
+import arviz as az
+import h5py
+import numpy as np
+import xarray as xr
+
+STORE_SUFFIX = ".h5"
+
+# InferenceData groups (and posterior variables) kept by each retention policy;
+# None keeps everything
+RETENTION_POLICIES = {
+    "beta_var": {"groups": ("posterior",), "posterior": ("beta_var",)},
+    "diagnostics": {
+        "groups": ("posterior", "sample_stats", "log_likelihood"),
+        "posterior": None,
+    },
+    "full": {"groups": None, "posterior": None},
+}
+
+
+def chunk_store_path(inference_dir, chunk_num):
+    """Path of the consolidated inference store written by one chunk."""
+    return os.path.join(
+        inference_dir, "inferences",
+        f"chunk_{str(chunk_num).zfill(4)}{STORE_SUFFIX}"
+    )
+
+
+def _string_array(values):
+    return np.asarray([str(v) for v in values], dtype=object)
+
+
+def _decode(values):
+    return [v.decode() if isinstance(v, bytes) else v for v in values]
+
+
+def retain_inference(inf, retain="full", float32=False):
+    """
+    Drop the parts of an inference that the retention policy does not keep.
+
+    Parameters
+    ----------
+    inf : az.InferenceData
+        Inference results of a single feature
+    retain : str
+        One of ``"beta_var"`` (posterior ``beta_var`` draws only),
+        ``"diagnostics"`` (full posterior, sample stats and log likelihood)
+        or ``"full"`` (everything produced by the model)
+    float32 : bool
+        Downcast floating point variables to float32
+
+    Returns
+    -------
+    az.InferenceData
+        Inference results holding only the retained groups and variables
+    """
+    if retain not in RETENTION_POLICIES:
+        raise ValueError(
+            f"Unknown retention policy '{retain}'. "
+            f"Choose from: {', '.join(RETENTION_POLICIES)}"
+        )
+    policy = RETENTION_POLICIES[retain]
+    groups = policy["groups"] or inf.groups()
+
+    kept = {}
+    for group in groups:
+        if group not in inf.groups():
+            continue
+        ds = inf[group]
+        if group == "posterior" and policy["posterior"] is not None:
+            ds = ds[list(policy["posterior"])]
+        if float32:
+            ds = ds.map(
+                lambda da: da.astype("float32")
+                if np.issubdtype(da.dtype, np.floating) else da
+            )
+        kept[group] = ds
+    return az.InferenceData(**kept)
+
+
+def write_netcdf(inf, path, compression=0):
+    """
+    Write an inference to NetCDF, compressing variables with zlib.
+
+    Parameters
+    ----------
+    inf : az.InferenceData
+        Inference results to write
+    path : str
+        Output NetCDF file
+    compression : int
+        zlib compression level from 0 (no compression) to 9
+    """
+    mode = "w"
+    for group in inf.groups():
+        ds = inf[group]
+        encoding = None
+        if compression:
+            encoding = {
+                var: {"zlib": True, "complevel": compression}
+                for var, da in ds.variables.items()
+                if np.issubdtype(da.dtype, np.number) or da.dtype == bool
+            }
+        ds.to_netcdf(path, mode=mode, group=group, encoding=encoding)
+        mode = "a"
+
+
+def append_inference(store_path, feature_id, feature_num, inf, compression=0):
+    """
+    Append the draws of a single feature to a consolidated HDF5 store.
+
+    Every variable of every InferenceData group is stored as one
+    dataset per variable whose leading axis indexes features, so that all
+    features of a chunk can be read back with a single sequential read.
+
+    Parameters
+    ----------
+    store_path : str
+        HDF5 file to append to, created if it does not exist
+    feature_id : str
+        ID of the feature the inference belongs to
+    feature_num : int
+        Ordinal of the feature in the input table
+    inf : az.InferenceData
+        Inference results of the feature
+    compression : int
+        gzip compression level from 0 (no compression) to 9
+
+    Raises
+    ------
+    ValueError
+        If the feature holds other variables than the features already in
+        the store, as their per-variable arrays would no longer line up
+
+    Notes
+    -----
+    Each chunk owns its own store, so there is a single writer per file.
+    HDF5 file locking additionally refuses concurrent writers on one file.
+    """
+    variables = {
+        f"{group}/{var}"
+        for group in inf.groups() for var in inf[group].data_vars
+    }
+    with h5py.File(store_path, "a") as f:
+        n = f["feature_id"].shape[0] if "feature_id" in f else 0
+        if n:
+            stored = {
+                f"{group}/{var}" for group in f
+                if isinstance(f[group], h5py.Group) for var in f[group]
+            }
+            if variables != stored:
+                raise ValueError(
+                    f"Feature {feature_id} holds variables "
+                    f"{sorted(variables)}, but {store_path} holds "
+                    f"{sorted(stored)}"
+                )
+
+        if n == 0:
+            f.create_dataset(
+                "feature_id", shape=(0,), maxshape=(None,),
+                dtype=h5py.string_dtype()
+            )
+            f.create_dataset(
+                "feature_num", shape=(0,), maxshape=(None,), dtype="i8"
+            )
+        for group in inf.groups():
+            ds = inf[group]
+            g = f.require_group(group)
+            for var, da in ds.data_vars.items():
+                values = da.values
+                if var not in g:
+                    dset = g.create_dataset(
+                        var, shape=(0,) + values.shape,
+                        maxshape=(None,) + values.shape,
+                        chunks=(1,) + values.shape, dtype=values.dtype,
+                        compression="gzip" if compression else None,
+                        compression_opts=compression or None,
+                        shuffle=bool(compression)
+                    )
+                    dset.attrs["dims"] = _string_array(da.dims)
+                    for dim in da.dims:
+                        if dim in ("chain", "draw"):
+                            continue
+                        key = f"coord_{dim}"
+                        if key not in g.attrs:
+                            g.attrs[key] = _string_array(ds[dim].values)
+                dset = g[var]
+                # Datasets are sized by the registered features, so leftovers
+                # of an interrupted append are overwritten
+                dset.resize((n + 1,) + dset.shape[1:])
+                dset[n] = values
+
+        # Register the feature last so an interrupted append is overwritten
+        # by the next one instead of leaving misaligned arrays behind
+        f["feature_id"].resize((n + 1,))
+        f["feature_id"][n] = str(feature_id)
+        f["feature_num"].resize((n + 1,))
+        f["feature_num"][n] = feature_num
+
+
+def read_store_feature_ids(store_path):
+    """Return the feature IDs held by a consolidated store, in store order."""
+    with h5py.File(store_path, "r") as f:
+        if "feature_id" not in f:
+            return []
+        return _decode(f["feature_id"][:])
+
+
+def read_store_variable(store_path, var, group="posterior", start=None,
+                        stop=None):
+    """
+    Read one variable for all features of a consolidated store.
+
+    Parameters
+    ----------
+    store_path : str
+        HDF5 store to read
+    var : str
+        Variable name, e.g. ``"beta_var"``
+    group : str
+        InferenceData group the variable belongs to
+    start, stop : int, optional
+        Read only the features in this range of the store
+
+    Returns
+    -------
+    xr.DataArray
+        Draws with a leading ``feature`` dimension followed by the
+        variable's own dimensions
+    """
+    with h5py.File(store_path, "r") as f:
+        feature_ids = _decode(f["feature_id"][start:stop])
+        dset = f[group][var]
+        first = start or 0
+        values = dset[first:first + len(feature_ids)]
+        dims = _decode(dset.attrs["dims"])
+        coords = {"feature": feature_ids}
+        for dim in dims:
+            key = f"coord_{dim}"
+            if key in f[group].attrs:
+                coords[dim] = _decode(f[group].attrs[key])
+    return xr.DataArray(
+        values, dims=["feature"] + dims, coords=coords, name=var
+    )
@@ -1,91 +1,576 @@
+import hashlib
+import logging
+import os
 import re
 import arviz as az
+import numpy as np
 import pandas as pd
+import xarray as xr
 from glob import glob
-from pathlib import Path
-from multiprocessing.pool import ThreadPool
-#from src._utils import _create_folder_without_clear
-from ._utils import _create_folder_without_clear
-
-
-def _process_dataframe(df, feat_id, suffix=""):
-    df = df.copy()
-    df.reset_index(inplace=True, drop=True)
-    df.columns.name = ""
-    df.index = [feat_id]
-    df.columns = [x + suffix for x in df.columns]
+import time
+from functools import partial
+from math import ceil
+from multiprocessing import Pool
+from ._manifest import read_manifest
+from ._metrics import StageTimer, append_metrics
+from ._store import STORE_SUFFIX, read_store_feature_ids, read_store_variable
+
+
+FEAT_REGEX = re.compile(r"F\d{4}_(.*).nc")
+SUMMARY_BLOCK_SIZE = 256
+
+
+def _parallel(processes, unit_func, arg_list):
+    # Summaries are pandas/xarray bound and hold the GIL, so use processes
+    if processes == 1 or len(arg_list) <= 1:
+        return [unit_func(arg) for arg in arg_list]
+    with Pool(processes=min(processes, len(arg_list))) as p:
+        return p.map(unit_func, arg_list)
+
+
+SUMMARY_INDEX = "feature id"
+SUMMARY_DTYPE = "float64"
+
+
+def apply_summary_schema(df):
+    """
+    Cast a summary table to its explicit schema.
+
+    Every summary column (``_mean``, ``_std``, ``_hdi_lower``, ``_hdi_upper``
+    and quantiles) is float64 and the index holds string feature IDs named
+    ``"feature id"``.
+    """
+    df = df.astype(SUMMARY_DTYPE)
+    df.index = df.index.astype(str)
+    df.index.name = SUMMARY_INDEX
     return df
 
 
-def _reformat_multiindex(df, feat_id, suffix=""):
-    df = df.copy().reset_index()
-    new_df = pd.DataFrame(columns=df.covariate.unique(), index=[feat_id])
-    for c in new_df.columns:
-        lower = df.loc[(df["covariate"] == c) & (df["hdi"] == "lower")][
-            "beta_var"
-        ].values[0]
-        higher = df.loc[(df["covariate"] == c) & (df["hdi"] == "higher")][
-            "beta_var"
-        ].values[0]
-        new_df[c][feat_id] = (lower, higher)
-    new_df.columns = [c + suffix for c in new_df.columns]
-    return new_df
-
-
-def _parallel(threads, unit_func, arg_list):
-    p = ThreadPool(processes=threads)
-    results = p.map(unit_func, arg_list)
-    p.close()
-    p.join()
-    return results
-
-def convert_types(df):
-    for col in df.columns:
+def read_summary(path):
+    """
+    Read a summary table written by ``summarize_inferences``.
+
+    Parquet files are read as-is; TSV files are parsed straight into the
+    summary schema without per-column type inference.
+    """
+    if str(path).endswith(".parquet"):
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_csv(path, sep="\t", index_col=0, dtype={0: str})
+    return apply_summary_schema(df)
+
+
+def _hdi(sorted_draws, hdi_prob):
+    # Same narrowest-interval search as az.hdi, run on every
+    # (feature, covariate) pair at once along the draw axis
+    n = sorted_draws.shape[1]
+    interval_idx_inc = int(np.floor(hdi_prob * n))
+    n_intervals = n - interval_idx_inc
+    interval_width = (
+        sorted_draws[:, interval_idx_inc:, :] - sorted_draws[:, :n_intervals, :]
+    )
+    if interval_width.shape[1] == 0:
+        raise ValueError("Too few elements for interval calculation.")
+    min_idx = np.argmin(interval_width, axis=1)[:, None, :]
+    lower = np.take_along_axis(sorted_draws, min_idx, axis=1)[:, 0, :]
+    upper = np.take_along_axis(
+        sorted_draws, min_idx + interval_idx_inc, axis=1
+    )[:, 0, :]
+    return lower, upper
+
+
+def summarize_draws(draws, feature_ids, covariates, hdi_prob=None,
+                    quantiles=()):
+    """
+    Summarize the beta_var draws of a block of features in one vectorized pass.
+
+    Parameters
+    ----------
+    draws : np.ndarray
+        beta_var draws of shape (feature, chain, draw, covariate) or
+        (feature, draw, covariate)
+    feature_ids : sequence of str
+        Feature IDs, one per leading entry of ``draws``
+    covariates : sequence of str
+        Covariate names, one per trailing entry of ``draws``
+    hdi_prob : float, optional
+        Probability mass of the HDI, defaults to arviz's ``stats.hdi_prob``
+    quantiles : sequence of float
+        Additional posterior quantiles to report
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per feature with ``<covariate>_mean``, ``<covariate>_std``
+        and ``<covariate>_hdi_lower``/``<covariate>_hdi_upper`` float columns,
+        followed by ``<covariate>_q<q>`` columns for each requested quantile
+    """
+    if hdi_prob is None:
+        hdi_prob = az.rcParams["stats.hdi_prob"]
+    draws = np.asarray(draws)
+    draws = draws.reshape(draws.shape[0], -1, draws.shape[-1])
+    covariates = [str(c) for c in covariates]
+
+    mean = draws.mean(axis=1)
+    std = draws.std(axis=1)
+    sorted_draws = np.sort(draws, axis=1)
+    lower, upper = _hdi(sorted_draws, hdi_prob)
+
+    columns = {}
+    for j, c in enumerate(covariates):
+        columns[c + "_mean"] = mean[:, j]
+    for j, c in enumerate(covariates):
+        columns[c + "_std"] = std[:, j]
+    for j, c in enumerate(covariates):
+        columns[c + "_hdi_lower"] = lower[:, j]
+        columns[c + "_hdi_upper"] = upper[:, j]
+    if len(quantiles):
+        quantile_values = np.quantile(sorted_draws, quantiles, axis=1)
+        for q, values in zip(quantiles, quantile_values):
+            for j, c in enumerate(covariates):
+                columns[f"{c}_q{q:g}"] = values[:, j]
+
+    return pd.DataFrame(
+        columns, index=pd.Index(feature_ids, name=SUMMARY_INDEX)
+    )
+
+
+def _summarize_beta_var(this_feat_diff, this_feat_id):
+    this_feat_diff = this_feat_diff.transpose("chain", "draw", "covariate")
+    return summarize_draws(
+        this_feat_diff.values[None],
+        [this_feat_id],
+        this_feat_diff["covariate"].values
+    )
+
+
+def _read_beta_var(inf_file):
+    # Only the posterior group is needed, so skip loading the rest of the file
+    with xr.open_dataset(inf_file, group="posterior") as posterior:
+        return posterior["beta_var"].transpose(
+            "chain", "draw", "covariate"
+        ).load()
+
+
+def _file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_state(path, st, cache):
+    """
+    State of a file read after taking its stat ``st``, for the summary cache.
+
+    The file is only hashed when the cache is in use, and its hash is left
+    out if the file changed while it was read, so the cache never pairs old
+    rows with the state of a newer file.
+    """
+    state = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": None}
+    if cache:
+        digest = _file_digest(path)
+        after = os.stat(path)
+        if (after.st_size, after.st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+            state["hash"] = digest
+    return state
+
+
+def _summarize_block_timed(inf_items, hdi_prob=None, cache=False):
+    # inf_items holds (file, feature id) pairs; feature IDs missing from the
+    # run manifest are parsed from the file name
+    blocks = {}
+    timings = []
+    for inf_file, this_feat_id in inf_items:
         try:
-            df[col] = df[col].astype(float)
-        except ValueError:
-            df[col] = df[col].astype(str)
-    return df
+            read_start = time.perf_counter()
+            if this_feat_id is None:
+                this_feat_id = FEAT_REGEX.search(inf_file).groups()[0]
+            st = os.stat(inf_file)
+            this_feat_diff = _read_beta_var(inf_file)
+            timings.append({
+                "file": inf_file,
+                "read_seconds": time.perf_counter() - read_start,
+                "feature_ids": [this_feat_id],
+                **_file_state(inf_file, st, cache),
+            })
+        except Exception as e:
+            logging.getLogger("birdman").warning(
+                f"Error processing file {inf_file}: {e}"
+            )
+            continue
+        covariates = tuple(str(c) for c in this_feat_diff["covariate"].values)
+        # Features can only be stacked with others of the same shape
+        block = blocks.setdefault((this_feat_diff.shape, covariates), ([], []))
+        block[0].append(this_feat_id)
+        block[1].append(this_feat_diff.values)
+
+    compute_start = time.perf_counter()
+    feat_diffs = [
+        summarize_draws(
+            np.stack(draws), feature_ids, covariates, hdi_prob=hdi_prob
+        )
+        for (_, covariates), (feature_ids, draws) in blocks.items()
+    ]
+    compute_seconds = time.perf_counter() - compute_start
+    # The block is summarized in one pass, so its compute time is shared
+    # evenly between the files that were read
+    for timing in timings:
+        timing["compute_seconds"] = compute_seconds / len(timings)
+
+    if not feat_diffs:
+        return None, timings
+    return pd.concat(feat_diffs, axis=0), timings
+
+
+def summarize_inferences_block(inf_files):
+    """Summarize a block of per-feature NetCDF files in one vectorized pass."""
+    return _summarize_block_timed([(f, None) for f in inf_files])[0]
+
 
 def summarize_inferences_single_file(inf_file):
-    FEAT_REGEX = re.compile("F\d{4}_(.*).nc")
+    return summarize_inferences_block([inf_file])
+
+
+def _summarize_store_timed(store_file, hdi_prob=None, cache=False):
+    timings = []
     try:
-        this_feat_id = FEAT_REGEX.search(inf_file).groups()[0]
-        this_feat_diff = az.from_netcdf(inf_file).posterior["beta_var"]
-        this_feat_diff_mean = this_feat_diff.mean(["chain", "draw"]).to_dataframe().T
-        this_feat_diff_std = this_feat_diff.std(["chain", "draw"]).to_dataframe().T
-        this_feat_diff_hdi = az.hdi(this_feat_diff).to_dataframe()
-
-        this_feat_diff_mean = _process_dataframe(
-            this_feat_diff_mean, this_feat_id, suffix="_mean"
-        )
-        this_feat_diff_std = _process_dataframe(
-            this_feat_diff_std, this_feat_id, suffix="_std"
-        )
-        this_feat_diff_hdis = _reformat_multiindex(
-            this_feat_diff_hdi, this_feat_id, suffix="_hdi"
+        st = os.stat(store_file)
+        num_features = len(read_store_feature_ids(store_file))
+        feat_diffs = []
+        read_seconds = compute_seconds = 0.0
+        for start in range(0, num_features, SUMMARY_BLOCK_SIZE):
+            read_start = time.perf_counter()
+            beta_var = read_store_variable(
+                store_file, "beta_var", start=start,
+                stop=start + SUMMARY_BLOCK_SIZE
+            ).transpose("feature", "chain", "draw", "covariate")
+            compute_start = time.perf_counter()
+            feat_diffs.append(summarize_draws(
+                beta_var.values, beta_var["feature"].values,
+                beta_var["covariate"].values, hdi_prob=hdi_prob
+            ))
+            read_seconds += compute_start - read_start
+            compute_seconds += time.perf_counter() - compute_start
+        timings.append({
+            "file": store_file,
+            "read_seconds": read_seconds,
+            "compute_seconds": compute_seconds,
+            "feature_ids": [
+                f for feat_diff in feat_diffs for f in feat_diff.index
+            ],
+            **_file_state(store_file, st, cache),
+        })
+        if not feat_diffs:
+            return None, timings
+        return pd.concat(feat_diffs, axis=0), timings
+    except Exception as e:
+        logging.getLogger("birdman").warning(
+            f"Error processing store {store_file}: {e}"
         )
-        return pd.concat(
-            [this_feat_diff_mean, this_feat_diff_std, this_feat_diff_hdis], axis=1
+        return None, timings
+
+
+def summarize_inferences_store(store_file):
+    """Summarize every feature held by a consolidated chunk store."""
+    return _summarize_store_timed(store_file)[0]
+
+
+def _write_timings(input_dir, timings):
+    timings = pd.DataFrame(
+        timings, columns=["file", "read_seconds", "compute_seconds"]
+    )
+    timings.to_csv(
+        f"{input_dir}/results/summary_timings.tsv", sep="\t", index=False
+    )
+    if not timings.empty:
+        logging.getLogger("birdman").info(
+            f"Summarized {len(timings)} inference files: "
+            f"read {timings.read_seconds.sum():.2f}s "
+            f"({timings.read_seconds.mean() * 1000:.1f} ms/file), "
+            f"compute {timings.compute_seconds.sum():.2f}s "
+            f"({timings.compute_seconds.mean() * 1000:.1f} ms/file)"
         )
-    except Exception as e:
-        print(f"Error processing file {inf_file}: {str(e)}")  # TODO: chaneg this to log
-        return None
 
 
-def summarize_inferences(input_dir, threads=1):
-    #_create_folder_without_clear(output_dir)
-    all_inf_files = glob(f"{input_dir}/inferences/*.nc")
+def _summary_cache_path(input_dir):
+    return os.path.join(input_dir, "results", "summary_cache.tsv")
+
+
+def _read_summary_cache(input_dir):
+    """
+    Load the summary cache and the summary table it describes.
+
+    The cache has one row per (inference file, feature) pair recording the
+    file's size, mtime and content hash when the feature was summarized.
+    Returns empty tables when either part is missing.
+    """
+    cache_path = _summary_cache_path(input_dir)
+    summary_path = os.path.join(input_dir, "results", "beta_var.tsv")
+    parquet_path = os.path.join(input_dir, "results", "beta_var.parquet")
+    empty_cache = pd.DataFrame(
+        columns=["file", "feature id", "size", "mtime_ns", "hash"]
+    )
+    if not os.path.exists(cache_path):
+        return empty_cache, None
+    if os.path.exists(parquet_path):
+        summary = read_summary(parquet_path)
+    elif os.path.exists(summary_path):
+        summary = read_summary(summary_path)
+    else:
+        return empty_cache, None
+    cache = pd.read_csv(
+        cache_path, sep="\t",
+        dtype={"file": str, "feature id": str, "size": "int64",
+               "mtime_ns": "int64", "hash": str}
+    )
+    return cache, summary
+
+
+def _unchanged_files(input_dir, all_files, cache, summary):
+    """
+    Return the files whose cached summaries can be reused as-is.
 
-    results = _parallel(threads, summarize_inferences_single_file, all_inf_files)
-    feat_diff_df_list = [df for df in results if df is not None]
+    Cache rows of files that were only touched are updated with their new
+    mtime so they are not hashed again next time.
+    """
+    if summary is None or cache.empty:
+        return set()
+    by_file = {
+        f: rows for f, rows in cache.groupby("file", sort=False)
+    }
+    unchanged = set()
+    for inf_file in all_files:
+        rel = os.path.relpath(inf_file, input_dir)
+        if rel not in by_file:
+            continue
+        rows = by_file[rel]
+        if not rows["feature id"].isin(summary.index).all():
+            continue
+        st = os.stat(inf_file)
+        size, mtime_ns, digest = rows.iloc[0][["size", "mtime_ns", "hash"]]
+        if st.st_size != size:
+            continue
+        # Only hash files whose mtime moved, e.g. touched or copied files
+        if st.st_mtime_ns == mtime_ns:
+            unchanged.add(inf_file)
+        elif _file_digest(inf_file) == digest:
+            unchanged.add(inf_file)
+            cache.loc[rows.index, "mtime_ns"] = st.st_mtime_ns
+    return unchanged
 
+
+def _write_summary_cache(input_dir, cache, timings):
+    # File states were taken by the workers before reading; files that
+    # changed while being read have no hash and are summarized again next time
+    new_rows = []
+    for timing in timings:
+        if timing["hash"] is None:
+            continue
+        for feature_id in timing["feature_ids"]:
+            new_rows.append({
+                "file": os.path.relpath(timing["file"], input_dir),
+                "feature id": feature_id,
+                "size": timing["size"],
+                "mtime_ns": timing["mtime_ns"],
+                "hash": timing["hash"],
+            })
+    cache = pd.concat([cache, pd.DataFrame(new_rows, columns=cache.columns)])
+    cache.to_csv(_summary_cache_path(input_dir), sep="\t", index=False)
+
+
+def chunk_summary_path(input_dir, chunk_num):
+    """Path of the partial summary table streamed by one chunk."""
+    return os.path.join(
+        input_dir, "results", "summaries",
+        f"chunk_{str(chunk_num).zfill(4)}.tsv"
+    )
+
+
+def append_chunk_summary(input_dir, chunk_num, feature_id, inf):
+    """
+    Summarize a freshly fit feature and append it to its chunk's summary table.
+
+    Called by workers right after ``model.to_inference()`` so the summary is
+    computed from draws that are still in memory. Each chunk owns its table,
+    so appends never race with other workers.
+
+    Parameters
+    ----------
+    input_dir : str
+        Run output directory
+    chunk_num : int
+        Chunk the feature belongs to
+    feature_id : str
+        ID of the summarized feature
+    inf : az.InferenceData
+        Inference results of the feature
+    """
+    path = chunk_summary_path(input_dir, chunk_num)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    feat_diff = _summarize_beta_var(inf.posterior["beta_var"], feature_id)
+    feat_diff.to_csv(
+        path, sep="\t", index=True, mode="a", header=not os.path.exists(path)
+    )
+
+
+def _write_summary(input_dir, feat_diff_df_list):
     if feat_diff_df_list:
-        all_feat_diffs_df = pd.concat(feat_diff_df_list, axis=0)
-        all_feat_diffs_df.index.name = "feature id"
+        all_feat_diffs_df = apply_summary_schema(
+            pd.concat(feat_diff_df_list, axis=0)
+        )
         all_feat_diffs_df.to_csv(
             f"{input_dir}/results/beta_var.tsv", sep="\t", index=True
         )
-        return convert_types(all_feat_diffs_df)
+        try:
+            all_feat_diffs_df.to_parquet(
+                f"{input_dir}/results/beta_var.parquet")
+        except ImportError:
+            # Parquet output needs pyarrow or fastparquet; the TSV is
+            # always written
+            pass
+        return all_feat_diffs_df
     else:
-        print("No available feat_diff_dfs...")  # TODO: chaneg this to log
+        logging.getLogger("birdman").warning("No available feat_diff_dfs...")
+
+
+def collect_chunk_summaries(input_dir):
+    """
+    Concatenate the summary tables streamed by the workers of a run.
+
+    Features refit by a rerun of a chunk keep their most recent summary.
+    Returns None when no worker streamed any summary.
+    """
+    all_summary_files = sorted(glob(
+        f"{input_dir}/results/summaries/chunk_*.tsv"))
+    if not all_summary_files:
+        return None
+
+    feat_diff_df_list = [read_summary(f) for f in all_summary_files]
+    all_feat_diffs_df = pd.concat(feat_diff_df_list, axis=0)
+    all_feat_diffs_df = all_feat_diffs_df[
+        ~all_feat_diffs_df.index.duplicated(keep="last")
+    ]
+    return _write_summary(input_dir, [all_feat_diffs_df])
+
+
+def _discover_inferences(input_dir):
+    """
+    Map the inference outputs of a run to their feature IDs.
+
+    Outputs of finished features are looked up in the run manifest; runs
+    without a manifest fall back to listing the inference directory, in which
+    case feature IDs are left as None to be parsed from the file names.
+    Consolidated stores map to None as they hold many features.
+    """
+    manifest = read_manifest(input_dir)
+    if manifest is None:
+        all_files = glob(f"{input_dir}/inferences/*.nc")
+        all_files += glob(f"{input_dir}/inferences/*{STORE_SUFFIX}")
+        return {f: None for f in all_files}
+
+    outputs = manifest.loc[manifest["status"] == "done", "output"]
+    inf_ids = {}
+    for feature_id, output in outputs.items():
+        path = os.path.join(input_dir, output)
+        inf_ids[path] = None if output.endswith(STORE_SUFFIX) else feature_id
+    return inf_ids
+
+
+def summarize_inferences(input_dir, threads=None, incremental=False,
+                         hdi_prob=None):
+    """
+    Summarize the beta_var posteriors of every inference written by a run.
+
+    Inference files are looked up in the run manifest, or listed from
+    ``inferences/`` for runs without one. Per-feature NetCDF files are split
+    into batches, one or more per worker process, and consolidated stores are
+    handed to the workers whole. Each file's read and compute time is written
+    to ``results/summary_timings.tsv``.
+
+    With ``incremental``, files whose size, mtime (or, failing that, content
+    hash) match ``results/summary_cache.tsv`` keep their rows from the
+    existing summary table and only new or changed files are re-summarized.
+    Cached summaries are only reused at the default HDI probability, and
+    summaries at any other ``hdi_prob`` are returned without writing
+    ``results/beta_var.*`` or the cache. The plugin's actions always
+    summarize fresh directories, so the cache only pays off for direct
+    Python calls that re-summarize one run directory, e.g. while its chunks
+    are still being fit; other calls skip hashing the inference files.
+
+    Parameters
+    ----------
+    input_dir : str
+        Run output directory
+    threads : int, optional
+        Number of worker processes, defaults to the number of CPUs
+    incremental : bool
+        Reuse cached summaries of unchanged inference files and keep the
+        cache up to date
+    hdi_prob : float, optional
+        Probability mass of the HDI, defaults to arviz's ``stats.hdi_prob``
+    """
+    if threads is None:
+        threads = os.cpu_count() or 1
+    timer = StageTimer()
+    with timer.stage("discover"):
+        inf_ids = _discover_inferences(input_dir)
+    all_inf_files = [f for f in inf_ids if not f.endswith(STORE_SUFFIX)]
+    all_store_files = [f for f in inf_ids if f.endswith(STORE_SUFFIX)]
+
+    with timer.stage("cache_check"):
+        use_cache = incremental and hdi_prob is None
+        cache, cached_summary = _read_summary_cache(input_dir)
+        if not use_cache:
+            cache, cached_summary = cache.iloc[0:0], None
+        unchanged = _unchanged_files(
+            input_dir, all_inf_files + all_store_files, cache, cached_summary
+        )
+    all_inf_files = [f for f in all_inf_files if f not in unchanged]
+    all_store_files = [f for f in all_store_files if f not in unchanged]
+
+    block_size = max(
+        1, min(SUMMARY_BLOCK_SIZE, ceil(len(all_inf_files) / threads))
+    )
+    inf_items = [(f, inf_ids[f]) for f in all_inf_files]
+    inf_blocks = [
+        inf_items[i:i + block_size]
+        for i in range(0, len(inf_items), block_size)
+    ]
+    with timer.stage("summarize"):
+        results = _parallel(threads, partial(
+            _summarize_block_timed, hdi_prob=hdi_prob, cache=use_cache
+        ), inf_blocks)
+        results += _parallel(threads, partial(
+            _summarize_store_timed, hdi_prob=hdi_prob, cache=use_cache
+        ), all_store_files)
+    feat_diff_df_list = [df for df, _ in results if df is not None]
+    timings = [t for _, timings in results for t in timings]
+    _write_timings(input_dir, timings)
+
+    if unchanged:
+        unchanged_rel = {os.path.relpath(f, input_dir) for f in unchanged}
+        cache = cache[cache["file"].isin(unchanged_rel)]
+        feat_diff_df_list.insert(
+            0,
+            cached_summary.loc[cached_summary.index.isin(cache["feature id"])]
+        )
+    else:
+        cache = cache.iloc[0:0]
+
+    with timer.stage("write"):
+        if hdi_prob is None:
+            summary = _write_summary(input_dir, feat_diff_df_list)
+            _write_summary_cache(input_dir, cache, timings)
+        elif feat_diff_df_list:
+            # The summary table and its cache only ever hold default HDIs, so
+            # later default calls never reuse HDIs of another probability
+            summary = apply_summary_schema(pd.concat(feat_diff_df_list, axis=0))
+        else:
+            summary = None
+    # Per-file read and compute times are kept in summary_timings.tsv
+    timer.add("read_files", sum(t["read_seconds"] for t in timings))
+    timer.add("compute_files", sum(t["compute_seconds"] for t in timings))
+    append_metrics(input_dir, "summarize", timer.stages, scope="run")
+    return summary
@@ -1,3 +1,8 @@
+import os
+import shutil
+import stat
+import time
+import uuid
 import patsy
 import biom
 import pandas as pd
@@ -95,3 +100,52 @@ def _create_folder_without_clear(dir):
         return
     else:
         dir.mkdir(parents=True, exist_ok=True)
+
+
+def link_or_copy(src, dst):
+    """
+    Hard-link ``src`` to ``dst``, copying when they are on different
+    filesystems.
+
+    ``dst`` is made read-only. A hard link shares its data with ``src``,
+    which is then read-only as well, so a later in-place write to the run
+    directory fails instead of silently changing an artifact.
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    mode = os.stat(dst).st_mode
+    os.chmod(dst, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+
+def create_run_dir(base_dir):
+    """
+    Create a unique run directory under ``base_dir``.
+
+    The directory name combines a timestamp with a random suffix and is
+    created with an atomic ``mkdir`` that is retried on collision, so
+    concurrent runs sharing ``base_dir`` never share a run directory. No lock
+    is taken: the directory is private to its run from the moment it exists.
+
+    Parameters
+    ----------
+    base_dir : str
+        Directory under which run directories are created
+
+    Returns
+    -------
+    str
+        Path of the run directory
+    """
+    os.makedirs(base_dir, exist_ok=True)
+    while True:
+        run_dir = os.path.join(
+            base_dir,
+            f"run-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        )
+        try:
+            os.mkdir(run_dir)
+            return run_dir
+        except FileExistsError:
+            continue
@@ -1,14 +1,19 @@
+import logging
 import os
-from tempfile import TemporaryDirectory
 import time
 import arviz as az
-import biom
 from birdman import ModelIterator
-import cmdstanpy
 import numpy as np
-import pandas as pd
 from .logger import setup_loggers
 from .model_single import ModelSingle
+from ._scratch import estimate_csv_bytes, feature_scratch
+from ._manifest import connect_manifest, read_manifest, update_feature
+from ._metrics import StageTimer, append_metrics
+from ._resources import append_resources, resource_snapshot, resource_usage
+from ._summarize import append_chunk_summary
+from ._store import (
+    append_inference, chunk_store_path, retain_inference, write_netcdf
+)
 
 def run_birdman_chunk(
     table,
@@ -23,9 +28,18 @@ def run_birdman_chunk(
     beta_prior=5,
     inv_disp_sd=5,
     logfile="q2_birdman/tests/",
+    store="netcdf",
+    retain="full",
+    float32=False,
+    compression=0,
+    stream_summaries=True,
+    scratch_root=None,
+    scratch_cap_mb=4096,
+    debug=False,
+    inline_diagnostics=False,
 ):
     FIDS = table.ids(axis="observation")
-    birdman_logger = setup_loggers(logfile)
+    birdman_logger = setup_loggers(logfile, debug=debug)
 
     model_config = {
         "metadata": metadata,
@@ -37,9 +51,12 @@ def run_birdman_chunk(
         "inv_disp_sd": inv_disp_sd,
         "chains": chains,
         "num_iter": num_iter,
-        "num_warmup": num_warmup
+        "num_warmup": num_warmup,
+        "retain": retain
     }
 
+    # ModelIterator builds the models of every chunk up front
+    model_iter_start = time.perf_counter()
     model_iter = ModelIterator(
         table,
         ModelSingle,
@@ -47,9 +64,16 @@ def run_birdman_chunk(
         **model_kwargs,
         **model_config
     )
+    append_metrics(
+        inference_dir, f"chunk_{str(chunk_num).zfill(4)}",
+        {"model_iterator": time.perf_counter() - model_iter_start},
+        scope="chunk", chunk=chunk_num
+    )
 
     # Log the total number of chunks available
-    total_chunks = len(model_iter)
+    # len(model_iter) is the requested number of chunks, which small tables
+    # may not fill
+    total_chunks = len(model_iter.chunks)
     birdman_logger.info(f"ModelIterator created with {total_chunks} chunks.")
 
     # Check if the chunk_num is within range
@@ -60,47 +84,166 @@ def run_birdman_chunk(
     chunk = model_iter[chunk_num - 1]
     birdman_logger.info(f"Processing chunk number: {chunk_num}")
 
-    for feature_id, model in chunk:
-        feature_num = np.where(FIDS == feature_id)[0].item()
-        feature_num_str = str(feature_num).zfill(4)
-        birdman_logger.info(f"Processing feature number: {feature_num_str}")
-        birdman_logger.info(f"Feature ID: {feature_id}")
-
-        tmpdir = f"{inference_dir}/tmp/F{feature_num_str}_{feature_id}"
-        infdir = f"{inference_dir}/inferences/"
-        outfile = f"{inference_dir}/inferences/F{feature_num_str}_{feature_id}.nc"
-
-        os.makedirs(infdir, exist_ok=True)
-        os.makedirs(tmpdir, exist_ok=True)
-
-        with TemporaryDirectory(dir=tmpdir) as t:
-            try:
-                # Compile and fit the model
-                model.compile_model()
-                model.fit_model()
-                model.fit_model(sampler_args={"output_dir": t})
-            except Exception as e:
-                birdman_logger.error(f"Error processing feature {feature_id}: {e}")
-                continue
-
-            # Extract inference results and log them
-            inf = model.to_inference()
-            birdman_logger.info(f"Inference results for feature {feature_id}:")
-            birdman_logger.info(inf.posterior)
-
-            # Calculate LOO and Rhat diagnostics
-            loo = az.loo(inf, pointwise=True)
-            rhat = az.rhat(inf)
-            birdman_logger.info("LOO diagnostics:")
-            birdman_logger.info(loo)
-            birdman_logger.info("Rhat diagnostics:")
-            birdman_logger.info(rhat)
-            if (rhat > 1.05).to_array().any().item():
-                birdman_logger.warning(f"{feature_id} has Rhat values > 1.05")
-            if any(map(np.isnan, loo.values[:3])):
-                birdman_logger.warning(f"{feature_id} has NaN elpd values")
-
-            # Save inference to NetCDF file
-            inf.to_netcdf(outfile)
-            birdman_logger.info(f"Saved to {outfile}")
-            time.sleep(10)
+    # Feature ordinals come from the run manifest when there is one; the
+    # chunk reads and updates it through a single connection
+    manifest_conn = connect_manifest(inference_dir)
+    try:
+        manifest = read_manifest(inference_dir, conn=manifest_conn)
+        if manifest is not None:
+            ordinals = manifest["ordinal"].to_dict()
+        else:
+            ordinals = {fid: i for i, fid in enumerate(FIDS)}
+
+        def _update_manifest(feature_id, **fields):
+            if manifest_conn is not None:
+                update_feature(
+                    inference_dir, feature_id, conn=manifest_conn, **fields
+                )
+
+        for feature_id, model in chunk:
+            feature_num = ordinals[feature_id]
+            resources_before = resource_snapshot()
+            timer = StageTimer()
+            timer.add("model_construction", model.build_seconds)
+            with timer.stage("manifest"):
+                _update_manifest(
+                    feature_id, chunk=chunk_num, status="running",
+                    started=time.time()
+                )
+            feature_num_str = str(feature_num).zfill(4)
+            birdman_logger.debug(
+                f"Processing feature {feature_num_str}: {feature_id}")
+            record = {
+                "feature_id": feature_id, "feature_num": feature_num,
+                "chunk": chunk_num
+            }
+
+            tmpdir = f"{inference_dir}/tmp"
+            infdir = f"{inference_dir}/inferences/"
+            outfile = (
+                f"{inference_dir}/inferences/F{feature_num_str}_{feature_id}.nc"
+            )
+
+            os.makedirs(infdir, exist_ok=True)
+
+            # CmdStan CSVs go to fast scratch when it has room, else to tmpdir,
+            # and are removed once the inference has been saved
+            with feature_scratch(
+                f"F{feature_num_str}", scratch_root, tmpdir,
+                estimate_csv_bytes(model), scratch_cap_mb * 1024 ** 2
+            ) as t:
+                try:
+                    # Compile and fit the model
+                    with timer.stage("compile"):
+                        model.compile_model()
+                    with timer.stage("sampling"):
+                        model.fit_model(sampler_args={"output_dir": t})
+                except Exception as e:
+                    birdman_logger.error(
+                        f"Error processing feature {feature_id}: {e}",
+                        extra={"fields": {
+                            **record, **timer.stages, "status": "failed"
+                        }}
+                    )
+                    _update_manifest(
+                        feature_id, status="failed", error=str(e),
+                        finished=time.time()
+                    )
+                    append_metrics(
+                        inference_dir, f"chunk_{str(chunk_num).zfill(4)}",
+                        timer.stages, label=feature_id, chunk=chunk_num
+                    )
+                    continue
+
+                # Extract inference results; full dumps are only formatted
+                # at DEBUG
+                with timer.stage("csv_parsing"):
+                    inf = model.to_inference()
+                if birdman_logger.isEnabledFor(logging.DEBUG):
+                    birdman_logger.debug(
+                        f"Inference results for feature {feature_id}:")
+                    birdman_logger.debug(inf.posterior)
+
+                # R-hat and LOO are deferred to compute_diagnostics, which
+                # works from the stored draws; inline_diagnostics restores the
+                # per-feature checks on the worker's critical path
+                if "sample_stats" in inf.groups():
+                    record["divergences"] = int(
+                        inf.sample_stats["diverging"].sum()
+                    )
+                if inline_diagnostics:
+                    with timer.stage("rhat"):
+                        rhat = az.rhat(inf)
+                    record["rhat_max"] = float(rhat.to_array().max())
+                    if birdman_logger.isEnabledFor(logging.DEBUG):
+                        birdman_logger.debug("Rhat diagnostics:")
+                        birdman_logger.debug(rhat)
+                    if (rhat > 1.05).to_array().any().item():
+                        birdman_logger.warning(
+                            f"{feature_id} has Rhat values > 1.05")
+                    if "log_likelihood" in inf.groups():
+                        with timer.stage("loo"):
+                            loo = az.loo(inf, pointwise=True)
+                        record["elpd_loo"] = float(loo["elpd_loo"])
+                        record["p_loo"] = float(loo["p_loo"])
+                        if birdman_logger.isEnabledFor(logging.DEBUG):
+                            birdman_logger.debug("LOO diagnostics:")
+                            birdman_logger.debug(loo)
+                        if any(map(np.isnan, loo.values[:3])):
+                            birdman_logger.warning(
+                                f"{feature_id} has NaN elpd values")
+
+                # Save inference to NetCDF file or to the chunk's
+                # consolidated store
+                with timer.stage("write"):
+                    stored = retain_inference(
+                        inf, retain=retain, float32=float32
+                    )
+                    if store == "hdf5":
+                        outfile = chunk_store_path(inference_dir, chunk_num)
+                        # The chunk store is shared, so only count its growth
+                        size_before = (
+                            os.path.getsize(outfile)
+                            if os.path.exists(outfile) else 0
+                        )
+                        append_inference(
+                            outfile, feature_id, feature_num, stored,
+                            compression=compression
+                        )
+                    else:
+                        size_before = 0
+                        write_netcdf(stored, outfile, compression=compression)
+                output_bytes = os.path.getsize(outfile) - size_before
+                record["output"] = outfile
+
+                # Summarize from the draws still in memory, only once they are
+                # stored, so the summary never lists a feature without an
+                # inference
+                if stream_summaries:
+                    with timer.stage("summary"):
+                        append_chunk_summary(
+                            inference_dir, chunk_num, feature_id, inf
+                        )
+                with timer.stage("manifest"):
+                    _update_manifest(
+                        feature_id, status="done", output=outfile,
+                        finished=time.time()
+                    )
+
+            birdman_logger.info(
+                f"Saved feature {feature_id} to {outfile}",
+                extra={"fields": {**record, **timer.stages, "status": "done"}}
+            )
+            append_metrics(
+                inference_dir, f"chunk_{str(chunk_num).zfill(4)}", timer.stages,
+                label=feature_id, chunk=chunk_num
+            )
+            usage = resource_usage(resources_before, resource_snapshot())
+            append_resources(
+                inference_dir, f"chunk_{str(chunk_num).zfill(4)}", feature_id,
+                chunk_num, usage, n_samples=model.dat["N"], chains=model.chains,
+                output_bytes=output_bytes
+            )
+    finally:
+        if manifest_conn is not None:
+            manifest_conn.close()
@@ -1,25 +1,148 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
 import cmdstanpy
 
-def setup_loggers(logfile):
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line.
+
+    Structured fields passed as ``extra={"fields": {...}}`` are merged into
+    the object, so per-feature records can be loaded as a table.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# Handlers installed by setup_loggers, keyed by the thread that installed
+# them, so chunks fit concurrently in one process (thread backends, parallel
+# pipeline actions) never tear down each other's handlers
+_active = {}
+_active_lock = threading.Lock()
+
+
+def _thread_filter(ident):
+    # Records go to the log of the thread that emitted them; cmdstanpy
+    # records logged from its own chain threads only reach the console
+    return lambda record: record.thread == ident
+
+
+def _apply_levels():
+    # The birdman and cmdstanpy loggers are shared by all threads, so they
+    # pass the most verbose level any thread asked for and each thread's
+    # handler drops what it did not ask for. Called with _active_lock held
+    if _active:
+        level = min(state["level"] for state in _active.values())
+        logging.getLogger("birdman").setLevel(level)
+        cmdstanpy.utils.get_logger().setLevel(level)
+
+
+def _remove_handlers(state):
+    qh = state["handler"]
+    logging.getLogger("birdman").removeHandler(qh)
+    cmdstanpy.utils.get_logger().removeHandler(qh)
+    listener = state["listener"]
+    # Stopping the listener writes out any queued records
+    listener.stop()
+    for h in listener.handlers:
+        h.close()
+
+
+def teardown_loggers():
+    """
+    Flush and remove the handlers installed by ``setup_loggers`` in this
+    thread.
+
+    Safe to call when no handlers are installed. Handlers installed by other
+    threads, or added by other code to the birdman or cmdstanpy loggers, are
+    left alone.
+    """
+    with _active_lock:
+        state = _active.pop(threading.get_ident(), None)
+        _apply_levels()
+    if state is not None:
+        _remove_handlers(state)
+
+
+def _teardown_all_loggers():
+    with _active_lock:
+        states = list(_active.values())
+        _active.clear()
+    for state in states:
+        _remove_handlers(state)
+
+
+def setup_loggers(logfile, debug=False):
+    """
+    Send birdman and cmdstanpy records to ``logfile`` and the console.
+
+    Setup is idempotent per thread: calling it again with the same logfile
+    reuses the installed handlers, and calling it with a new logfile swaps
+    them, so a long-lived worker always holds exactly one set of handlers
+    and one open log file. Threads each get their own handlers and level,
+    and records go to the log of the thread that emitted them.
+    """
+    level = logging.DEBUG if debug else logging.INFO
     birdman_logger = logging.getLogger("birdman")
-    birdman_logger.setLevel(logging.INFO)
+    cmdstanpy_logger = cmdstanpy.utils.get_logger()
+    ident = threading.get_ident()
+    with _active_lock:
+        state = _active.get(ident)
+    if state is not None and state["logfile"] == os.path.abspath(logfile) \
+            and state["level"] == level:
+        return birdman_logger
+    teardown_loggers()
+
     fh = logging.FileHandler(logfile, mode="w")
     sh = logging.StreamHandler()
     formatter = logging.Formatter(
         "[%(asctime)s - %(name)s - %(levelname)s] ::  %(message)s"
     )
-    fh.setFormatter(formatter)
-    fh.setLevel(logging.INFO)
+    fh.setFormatter(JsonFormatter())
+    fh.setLevel(level)
     sh.setFormatter(formatter)
-    sh.setLevel(logging.DEBUG)
-    birdman_logger.addHandler(fh)
-    birdman_logger.addHandler(sh)
+    sh.setLevel(level)
+    # cmdstanpy prints to the console itself; only echo our own records
+    sh.addFilter(logging.Filter("birdman"))
 
-    cmdstanpy_logger = cmdstanpy.utils.get_logger()
-    cmdstanpy_logger.setLevel(logging.DEBUG)
-    cmdstanpy_logger.addHandler(fh)
-    for h in cmdstanpy_logger.handlers:
-        h.setFormatter(formatter)
+    # Records are handed to a queue and written by a background thread, so
+    # file and stream I/O stay off the sampling loop
+    log_queue = queue.SimpleQueue()
+    qh = logging.handlers.QueueHandler(log_queue)
+    qh.setLevel(level)
+    qh.addFilter(_thread_filter(ident))
+    listener = logging.handlers.QueueListener(
+        log_queue, fh, sh, respect_handler_level=True
+    )
+    listener.start()
+    birdman_logger.addHandler(qh)
 
+    cmdstanpy_logger.addHandler(qh)
+    with _active_lock:
+        _active[ident] = {
+            "logfile": os.path.abspath(logfile), "level": level,
+            "handler": qh, "listener": listener,
+        }
+        _apply_levels()
+        queue_handlers = [state["handler"] for state in _active.values()]
+    for h in cmdstanpy_logger.handlers:
+        if h not in queue_handlers:
+            h.setFormatter(formatter)
     return birdman_logger
+
+
+atexit.register(_teardown_all_loggers)
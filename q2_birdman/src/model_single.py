@@ -1,18 +1,20 @@
-from pkg_resources import resource_filename
+import logging
+import time
 
+import arviz as az
 import biom
 # IF USING A DIFFERENT STAN MODEL, CHANGE HERE
 from birdman import SingleFeatureModel
 import numpy as np
 import pandas as pd
+import xarray as xr
 
-# PROVIDE FILEPATH TO STAN MODEL
-# ENSURE THAT YOU HAVE COMPILED THIS MODEL BY 
-# ACTIVATING BIRDMAN ENVIRONMENT
-# OPENING PYTHON/IPYTHON  
-# IMPORTING CMDSTANPY, THEN RUNNING 
-# cmdstanpy.CmdStanModel(stan_file="path/to/model.stan")
-MODEL_PATH = "q2_birdman/src/stan/negative_binomial_single.stan"
+from ._stan_csv import SAMPLE_STATS, read_stan_csv_variables
+from ._store import RETENTION_POLICIES
+from ._models import compiled_model, model_file
+
+# Bundled model, resolved and compiled through the model registry in _models
+MODEL_NAME = "negative_binomial_single"
 
 # NAME CLASS SOMETHING RELEVANT TO YOUR MODEL
 class ModelSingle(SingleFeatureModel):
@@ -29,8 +31,10 @@ class ModelSingle(SingleFeatureModel):
         num_draws=100,
         num_iter: int = 500,
         num_warmup: int = 500,
+        retain: str = "full",
         **kwargs
     ):
+        build_start = time.perf_counter()
 
         kwargs.pop('metadata', None)  # remove metadata if it's in kwargs, not sure
         kwargs.pop('formula', None)   # remove formula if it's in kwargs, not sure
@@ -38,7 +42,7 @@ class ModelSingle(SingleFeatureModel):
         super().__init__(
             table=table,
             feature_id=feature_id,
-            model_path=MODEL_PATH,
+            model_path=model_file(MODEL_NAME),
             num_iter=num_iter,
             num_warmup=num_warmup,
             **kwargs
@@ -69,3 +73,86 @@ class ModelSingle(SingleFeatureModel):
             posterior_predictive="y_predict",
             log_likelihood="log_lhood"
         )
+
+        self.retain = retain
+        # Construction time, reported in the run's stage metrics
+        self.build_seconds = time.perf_counter() - build_start
+
+    def compile_model(self):
+        """Load the model's cached build, compiling it on first use."""
+        self.sm = compiled_model(MODEL_NAME)
+
+    def to_inference(self):
+        """
+        Convert the fit to InferenceData, reading only retained variables.
+
+        The CmdStan CSVs are parsed column-selectively (with pyarrow when
+        available) straight into numpy arrays, so unretained ``log_lhood`` and
+        ``y_predict`` columns are never parsed. Falls back to birdman's
+        conversion, with a warning, if the CSVs cannot be read this way.
+        """
+        if self.fit is None:
+            raise ValueError("Model has not been fit!")
+        if isinstance(self.fit, az.InferenceData):
+            return self.fit
+        try:
+            return self._fast_inference()
+        # Missing readers, unexpected columns and unparseable CSVs; pyarrow's
+        # ArrowInvalid and pandas' ParserError are ValueErrors
+        except (ImportError, KeyError, ValueError) as e:
+            logging.getLogger("birdman").warning(
+                "Falling back to birdman's conversion of "
+                f"{self.feature_id}: {e!r}"
+            )
+            return super().to_inference()
+
+    def _fast_inference(self):
+        groups = RETENTION_POLICIES[self.retain]["groups"] or (
+            "posterior", "sample_stats", "log_likelihood",
+            "posterior_predictive", "observed_data"
+        )
+        posterior_vars = (
+            RETENTION_POLICIES[self.retain]["posterior"] or self.params
+        )
+
+        variables = list(posterior_vars)
+        if "sample_stats" in groups:
+            variables += list(SAMPLE_STATS)
+        if "log_likelihood" in groups:
+            variables.append(self.log_likelihood)
+        if "posterior_predictive" in groups:
+            variables.append(self.posterior_predictive)
+        draws = read_stan_csv_variables(self.fit.runset.csv_files, variables)
+
+        n_chains, n_draws = draws[variables[0]].shape[:2]
+        base_coords = {"chain": np.arange(n_chains), "draw": np.arange(n_draws)}
+
+        def _dataset(names, rename=None):
+            rename = rename or {}
+            data_vars = {}
+            coords = dict(base_coords)
+            for name in names:
+                dims = ["chain", "draw"] + self.dims.get(name, [])
+                for dim in dims[2:]:
+                    coords[dim] = self.coords[dim]
+                values = draws[name]
+                if name == "divergent__":
+                    values = values.astype(bool)
+                elif name in ("treedepth__", "n_leapfrog__"):
+                    values = values.astype(np.int64)
+                data_vars[rename.get(name, name)] = (dims, values)
+            return xr.Dataset(data_vars, coords=coords)
+
+        kept = {"posterior": _dataset(posterior_vars)}
+        if "sample_stats" in groups:
+            kept["sample_stats"] = _dataset(SAMPLE_STATS, SAMPLE_STATS)
+        if "log_likelihood" in groups:
+            kept["log_likelihood"] = _dataset([self.log_likelihood])
+        if "posterior_predictive" in groups:
+            kept["posterior_predictive"] = _dataset([self.posterior_predictive])
+        if "observed_data" in groups and self.include_observed_data:
+            kept["observed_data"] = xr.Dataset(
+                {"observed": (["tbl_sample"], self.dat["y"])},
+                coords={"tbl_sample": self.coords["tbl_sample"]}
+            )
+        return az.InferenceData(**kept)
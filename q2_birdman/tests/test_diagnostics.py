@@ -0,0 +1,135 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import arviz as az
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src._diagnostics import (
+    compute_diagnostics, diagnostics_path, ess_bulk, ess_tail, rank_rhat
+)
+from q2_birdman.src._store import (
+    append_inference, chunk_store_path, retain_inference, write_netcdf
+)
+
+
+def _fake_inference(rng, num_samples=12):
+    return az.from_dict(
+        posterior={
+            "beta_var": rng.normal(size=(4, 100, 2)),
+            "inv_disp": rng.gamma(2, size=(4, 100)),
+        },
+        sample_stats={
+            "diverging": rng.random((4, 100)) < 0.02,
+            "tree_depth": rng.integers(3, 11, size=(4, 100)),
+        },
+        log_likelihood={
+            "log_lhood": rng.normal(-2, 0.3, size=(4, 100, num_samples))
+        },
+        coords={"covariate": ["Intercept", "age"]},
+        dims={"beta_var": ["covariate"], "log_lhood": ["tbl_sample"]},
+    )
+
+
+class DeferredDiagnosticsTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_diagnostics_match_arviz(self):
+        """
+        Test that deferred diagnostics of NetCDF inferences match per-feature
+        arviz results
+        """
+        rng = np.random.default_rng(42)
+        infs = {f"feature-{i}": _fake_inference(rng) for i in range(3)}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.makedirs(os.path.join(temp_dir, "inferences"))
+            for i, (feature_id, inf) in enumerate(infs.items()):
+                write_netcdf(inf, os.path.join(
+                    temp_dir, "inferences", f"F{i:04d}_{feature_id}.nc"
+                ))
+
+            diagnostics = compute_diagnostics(temp_dir, threads=1)
+            self.assertTrue(os.path.exists(diagnostics_path(temp_dir)))
+
+        for feature_id, inf in infs.items():
+            row = diagnostics.loc[feature_id]
+            # Relative efficiency is taken from beta_var only
+            ess = az.ess(inf.posterior[["beta_var"]], method="mean")["beta_var"]
+            loo = az.loo(inf, reff=ess.values.mean() / 400)
+            self.assertAlmostEqual(row["elpd_loo"], loo["elpd_loo"])
+            self.assertAlmostEqual(row["p_loo"], loo["p_loo"])
+            for stat, reference in (
+                ("rhat", az.rhat(inf)),
+                ("ess_bulk", az.ess(inf, method="bulk")),
+                ("ess_tail", az.ess(inf, method="tail")),
+                ("mcse_mean", az.mcse(inf)),
+            ):
+                np.testing.assert_allclose(
+                    row[[f"Intercept_{stat}", f"age_{stat}"]]
+                    .values.astype(float),
+                    reference["beta_var"].values
+                )
+                self.assertAlmostEqual(
+                    row[f"inv_disp_{stat}"], reference["inv_disp"].item()
+                )
+            self.assertAlmostEqual(
+                row["treedepth_saturation"],
+                (inf.sample_stats["tree_depth"].values >= 10).mean()
+            )
+            self.assertEqual(
+                row["divergences"], inf.sample_stats["diverging"].values.sum()
+            )
+
+    def test_vectorized_statistics_match_arviz(self):
+        """
+        Test that stacked R-hat and ESS match arviz for mixing, autocorrelated
+        and constant chains
+        """
+        rng = np.random.default_rng(7)
+        draws = rng.normal(size=(4, 4, 151))
+        draws[1] = np.cumsum(draws[1], axis=-1)
+        draws[2] = draws[2] + np.arange(4)[:, None]
+        draws[3] = 1.0
+
+        np.testing.assert_allclose(
+            ess_bulk(draws), [az.ess(d, method="bulk") for d in draws]
+        )
+        np.testing.assert_allclose(
+            ess_tail(draws), [az.ess(d, method="tail") for d in draws]
+        )
+        np.testing.assert_allclose(
+            rank_rhat(draws[:3]), [az.rhat(d) for d in draws[:3]]
+        )
+
+    def test_store_diagnostics_without_log_likelihood(self):
+        """
+        Test that stores retaining only beta_var get convergence diagnostics
+        and no LOO columns
+        """
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.makedirs(os.path.join(temp_dir, "inferences"))
+            store = chunk_store_path(temp_dir, 1)
+            for i in range(3):
+                inf = retain_inference(_fake_inference(rng), retain="beta_var")
+                append_inference(store, f"feature-{i}", i, inf)
+
+            diagnostics = compute_diagnostics(temp_dir, threads=1)
+            written = pd.read_csv(
+                diagnostics_path(temp_dir), sep="\t", index_col=0
+            )
+
+        self.assertEqual(
+            list(diagnostics.index), ["feature-0", "feature-1", "feature-2"]
+        )
+        self.assertIn("age_ess_bulk", diagnostics.columns)
+        self.assertNotIn("elpd_loo", diagnostics.columns)
+        self.assertNotIn("divergences", diagnostics.columns)
+        self.assertEqual(list(written.columns), list(diagnostics.columns))
@@ -0,0 +1,41 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import json
+import subprocess
+import sys
+from qiime2.plugin.testing import TestPluginBase
+
+# Dependencies that are only needed once an action runs
+HEAVY_MODULES = [
+    "joblib", "birdman", "cmdstanpy", "arviz", "xarray", "h5py", "patsy",
+    "matplotlib", "seaborn",
+]
+
+
+class PluginImportTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_plugin_setup_defers_heavy_imports(self):
+        """
+        Test that registering the plugin imports none of the dependencies
+        needed only by actions
+        """
+        # A fresh interpreter, since this test process may already have
+        # them loaded
+        code = (
+            "import json, sys\n"
+            "import q2_birdman.plugin_setup\n"
+            f"heavy = {HEAVY_MODULES!r}\n"
+            "print(json.dumps([m for m in heavy if m in sys.modules]))\n"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True,
+            check=True
+        )
+        self.assertEqual(json.loads(out.stdout.strip().splitlines()[-1]), [])
@@ -0,0 +1,113 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import json
+import logging
+import tempfile
+import threading
+import cmdstanpy
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src.logger import JsonFormatter, setup_loggers, teardown_loggers
+
+
+class JsonLoggingTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_json_formatter_merges_fields(self):
+        """
+        Test that structured fields are written alongside the message as one
+        JSON object
+        """
+        record = logging.LogRecord(
+            "birdman", logging.INFO, __file__, 1, "Saved feature %s", ("F1",),
+            None
+        )
+        record.fields = {
+            "feature_id": "F1", "fit_seconds": 1.5, "status": "done"
+        }
+
+        entry = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(entry["message"], "Saved feature F1")
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["feature_id"], "F1")
+        self.assertEqual(entry["fit_seconds"], 1.5)
+
+    def test_setup_loggers_does_not_accumulate_handlers(self):
+        """
+        Test that repeated setup keeps one handler and swaps log files cleanly
+        """
+        birdman_logger = logging.getLogger("birdman")
+        baseline = len(birdman_logger.handlers)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            first = os.path.join(temp_dir, "chunk_1.log")
+            second = os.path.join(temp_dir, "chunk_2.log")
+            try:
+                for _ in range(3):
+                    setup_loggers(first)
+                self.assertEqual(len(birdman_logger.handlers), baseline + 1)
+                birdman_logger.info("first chunk")
+
+                setup_loggers(second)
+                self.assertEqual(len(birdman_logger.handlers), baseline + 1)
+                birdman_logger.info("second chunk")
+            finally:
+                teardown_loggers()
+            self.assertEqual(len(birdman_logger.handlers), baseline)
+
+            with open(first) as f:
+                first_lines = [json.loads(line)["message"] for line in f]
+            with open(second) as f:
+                second_lines = [json.loads(line)["message"] for line in f]
+        self.assertEqual(first_lines, ["first chunk"])
+        self.assertEqual(second_lines, ["second chunk"])
+
+    def test_concurrent_threads_keep_their_own_logs(self):
+        """
+        Test that chunks logging from concurrent threads neither tear down,
+        write into nor change the level of each other's logs
+        """
+        birdman_logger = logging.getLogger("birdman")
+        baseline = len(birdman_logger.handlers)
+        barrier = threading.Barrier(2)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = [os.path.join(temp_dir, f"chunk_{i}.log") for i in (1, 2)]
+
+            def run_chunk(i):
+                setup_loggers(paths[i], debug=i == 1)
+                barrier.wait()
+                birdman_logger.info(f"chunk {i + 1}")
+                birdman_logger.debug(f"chunk {i + 1} details")
+                cmdstanpy.utils.get_logger().info(f"sampling chunk {i + 1}")
+                # The first chunk finishes while the second is still logging
+                if i == 0:
+                    teardown_loggers()
+                barrier.wait()
+                birdman_logger.info(f"chunk {i + 1} again")
+                if i == 1:
+                    teardown_loggers()
+
+            threads = [
+                threading.Thread(target=run_chunk, args=(i,)) for i in (0, 1)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(len(birdman_logger.handlers), baseline)
+
+            logs = []
+            for path in paths:
+                with open(path) as f:
+                    logs.append([json.loads(line)["message"] for line in f])
+        self.assertEqual(logs[0], ["chunk 1", "sampling chunk 1"])
+        self.assertEqual(
+            logs[1],
+            ["chunk 2", "chunk 2 details", "sampling chunk 2", "chunk 2 again"]
+        )
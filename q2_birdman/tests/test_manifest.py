@@ -0,0 +1,170 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import sqlite3
+import tempfile
+from unittest.mock import patch
+import numpy as np
+import arviz as az
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src import _manifest
+from q2_birdman.src._manifest import (
+    connect_manifest, create_manifest, read_manifest, update_feature
+)
+from q2_birdman.src._summarize import summarize_inferences
+
+
+_sqlite3_connect = sqlite3.connect
+
+
+class _NoWalConnection:
+    """sqlite3 connection on a filesystem without shared-memory locking."""
+
+    def __init__(self, *args, **kwargs):
+        self._conn = _sqlite3_connect(*args, **kwargs)
+
+    def execute(self, sql, *args):
+        # SQLite silently keeps the current journal mode where WAL cannot
+        # be used
+        if sql == "PRAGMA journal_mode=WAL":
+            sql = "PRAGMA journal_mode"
+        return self._conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+
+class RunManifestTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_create_and_update_manifest(self):
+        """
+        Test that features are registered in table order and their records can
+        be updated
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            create_manifest(temp_dir, ["feature-a", "feature-b", "feature-c"])
+            update_feature(
+                temp_dir, "feature-b", chunk=1, status="done",
+                output=os.path.join(temp_dir, "inferences", "b.nc")
+            )
+
+            manifest = read_manifest(temp_dir)
+            self.assertEqual(
+                list(manifest.index), ["feature-a", "feature-b", "feature-c"]
+            )
+            self.assertEqual(list(manifest["ordinal"]), [0, 1, 2])
+            self.assertEqual(manifest.loc["feature-b", "status"], "done")
+            self.assertEqual(
+                manifest.loc["feature-b", "output"],
+                os.path.join("inferences", "b.nc")
+            )
+            self.assertEqual(manifest.loc["feature-a", "status"], "pending")
+
+    def test_updates_share_one_connection(self):
+        """
+        Test that a chunk can read and update the manifest through one reused
+        connection
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.assertIsNone(connect_manifest(temp_dir))
+            create_manifest(temp_dir, ["feature-a", "feature-b"])
+            conn = connect_manifest(temp_dir)
+            try:
+                self.assertEqual(len(read_manifest(temp_dir, conn=conn)), 2)
+                update_feature(
+                    temp_dir, "feature-a", conn=conn, status="running"
+                )
+                update_feature(temp_dir, "feature-a", conn=conn, status="done")
+                self.assertEqual(
+                    read_manifest(temp_dir).loc["feature-a", "status"], "done"
+                )
+            finally:
+                conn.close()
+
+    def test_rollback_journal_without_wal(self):
+        """
+        Test that the manifest falls back to the rollback journal where WAL
+        cannot be enabled
+        """
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch.object(_manifest.sqlite3, "connect", _NoWalConnection):
+            create_manifest(temp_dir, ["feature-a"])
+            update_feature(temp_dir, "feature-a", status="done")
+            self.assertEqual(
+                read_manifest(temp_dir).loc["feature-a", "status"], "done"
+            )
+            conn = connect_manifest(temp_dir)
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            conn.close()
+        self.assertEqual(mode, "delete")
+
+    def test_wal_can_be_turned_off(self):
+        """
+        Test that the manifest uses the rollback journal when WAL is turned off
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            create_manifest(temp_dir, ["feature-a"])
+            with patch.dict(os.environ, {_manifest.WAL_ENV: "0"}):
+                conn = connect_manifest(temp_dir)
+                mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+                conn.close()
+        self.assertEqual(mode, "delete")
+
+    def test_update_unknown_column(self):
+        """
+        Test that updating a column the manifest does not have raises a
+        ValueError
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            create_manifest(temp_dir, ["feature-a"])
+            with self.assertRaisesRegex(
+                ValueError, "Unknown manifest columns: colour"
+            ):
+                update_feature(temp_dir, "feature-a", colour="blue")
+
+    def test_read_missing_manifest(self):
+        """
+        Test that reading a run without a manifest returns None
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.assertIsNone(read_manifest(temp_dir))
+
+    def test_summarize_uses_manifest(self):
+        """
+        Test that summarization reads the outputs listed in the manifest rather
+        than listing the directory
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for sub_dir in ("inferences", "results"):
+                os.makedirs(os.path.join(temp_dir, sub_dir))
+            create_manifest(temp_dir, ["feature-a", "feature-b"])
+
+            for name in ("feature_a_output.nc", "F0009_stray.nc"):
+                az.from_dict(
+                    posterior={"beta_var": rng.normal(size=(4, 100, 1))},
+                    coords={"covariate": ["age"]},
+                    dims={"beta_var": ["covariate"]},
+                ).to_netcdf(os.path.join(temp_dir, "inferences", name))
+            update_feature(
+                temp_dir, "feature-a", status="done",
+                output=os.path.join(
+                    temp_dir, "inferences", "feature_a_output.nc"
+                )
+            )
+
+            summary = summarize_inferences(temp_dir, threads=1)
+            self.assertEqual(list(summary.index), ["feature-a"])
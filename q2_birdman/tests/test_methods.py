@@ -8,6 +8,7 @@
 
 import os
 import re
+import glob
 import tempfile
 import pandas as pd
 import numpy as np
@@ -19,7 +20,11 @@ from qiime2.plugin.testing import TestPluginBase
 from qiime2.plugin.util import transform
 from q2_types.feature_table import BIOMV210Format
 from qiime2 import Metadata
-from q2_birdman._methods import _create_dir, run
+from q2_birdman._methods import _create_dir, run, summarize
+from q2_birdman._format import BIRDMAnInferencesDirectoryFormat
+from q2_birdman.src._manifest import create_manifest, update_feature
+from q2_birdman.src._summarize import summarize_draws
+from q2_birdman.src._utils import create_run_dir
 import patsy
 
 
@@ -176,6 +181,7 @@ class RunMethodTests(TestPluginBase):
 
         with tempfile.TemporaryDirectory() as temp_dir, \
             patch('q2_birdman.src.birdman_chunked.run_birdman_chunk'), \
+            patch('q2_birdman.src._models.compile_model'), \
             patch('q2_birdman.src._summarize.summarize_inferences',
                 return_value=pd.DataFrame({'col1': [1, 2]})):  # Valid DataFrame mock
 
@@ -187,10 +193,12 @@ class RunMethodTests(TestPluginBase):
                     print("Error during run:", str(e))
                     raise
 
-            # Verify directories
+            # Verify directories inside the run's own directory
+            run_dirs = glob.glob(os.path.join(temp_dir, "test_out", "run-*"))
+            assert len(run_dirs) == 1, "Expected exactly one run directory."
             expected_dirs = ["slurm_out", "logs", "inferences", "results", "plots"]
             for sub_dir in expected_dirs:
-                assert os.path.exists(os.path.join(temp_dir, "test_out", sub_dir)), \
+                assert os.path.exists(os.path.join(run_dirs[0], sub_dir)), \
                     f"Expected directory {sub_dir} was not created."
 
 
@@ -229,3 +237,58 @@ class RunMethodTests(TestPluginBase):
         Test that formula contains variables with all non-null values.
         """
         pass
+
+
+class RunDirTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_create_run_dir_is_unique(self):
+        """
+        Test that runs sharing a work directory each get their own empty run
+        directory
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            run_a, run_b = create_run_dir(temp_dir), create_run_dir(temp_dir)
+            self.assertNotEqual(run_a, run_b)
+            self.assertEqual(os.path.dirname(run_a), temp_dir)
+            self.assertEqual(os.listdir(run_a), [])
+
+
+class SummarizeActionTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_summarize_inferences_artifact(self):
+        """
+        Test that summarizing an inferences directory format honours the
+        HDI probability
+        """
+        import arviz as az
+
+        rng = np.random.default_rng(42)
+        inferences = BIRDMAnInferencesDirectoryFormat()
+        inferences_dir = str(inferences.path)
+        os.makedirs(os.path.join(inferences_dir, "inferences"))
+        feature_ids = ["feature-0", "feature-1"]
+        create_manifest(inferences_dir, feature_ids)
+        draws = rng.normal(size=(2, 4, 100, 2))
+        for i, feature_id in enumerate(feature_ids):
+            output = os.path.join(
+                inferences_dir, "inferences", f"F000{i}_{feature_id}.nc"
+            )
+            az.from_dict(
+                posterior={"beta_var": draws[i]},
+                coords={"covariate": ["Intercept", "age"]},
+                dims={"beta_var": ["covariate"]},
+            ).to_netcdf(output)
+            update_feature(
+                inferences_dir, feature_id, status="done", output=output
+            )
+        inferences.validate()
+
+        summary = summarize(inferences, threads=1, hdi_prob=0.5).to_dataframe()
+        expected = summarize_draws(
+            draws, feature_ids, ["Intercept", "age"], hdi_prob=0.5
+        )
+        np.testing.assert_allclose(
+            summary.loc[feature_ids, "age_hdi_lower"], expected["age_hdi_lower"]
+        )
@@ -0,0 +1,71 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import pandas as pd
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src._metrics import StageTimer, append_metrics, collect_metrics
+
+
+class StageMetricsTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_stage_timer_accumulates(self):
+        """
+        Test that repeated stages accumulate and externally measured time is
+        added
+        """
+        timer = StageTimer()
+        for _ in range(2):
+            with timer.stage("manifest"):
+                pass
+        timer.add("model_construction", 1.5)
+
+        self.assertEqual(set(timer.stages), {"manifest", "model_construction"})
+        self.assertGreaterEqual(timer.stages["manifest"], 0)
+        self.assertEqual(timer.stages["model_construction"], 1.5)
+
+    def test_collect_metrics_aggregates_per_run(self):
+        """
+        Test that per-feature timings are gathered, aggregated per stage and
+        exported for Prometheus
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for chunk, feature_id, seconds in [
+                (1, "feature-a", 2.0), (1, "feature-b", 4.0),
+                (2, "feature-c", 6.0)
+            ]:
+                append_metrics(
+                    temp_dir, f"chunk_{chunk:04d}",
+                    {"sampling": seconds, "write": 0.5},
+                    label=feature_id, chunk=chunk
+                )
+            append_metrics(temp_dir, "run", {"fit": 12.0}, scope="run")
+
+            summary = collect_metrics(temp_dir, prometheus=True)
+            metrics = pd.read_csv(
+                os.path.join(temp_dir, "results", "metrics.tsv"), sep="\t"
+            )
+            with open(os.path.join(temp_dir, "results", "metrics.prom")) as f:
+                prom = f.read()
+
+        self.assertEqual(len(metrics), 7)
+        sampling = summary.set_index(["scope", "stage"]).loc[
+            ("feature", "sampling")
+        ]
+        self.assertEqual(sampling["count"], 3)
+        self.assertEqual(sampling["total_seconds"], 12.0)
+        self.assertEqual(sampling["p50_seconds"], 4.0)
+        self.assertIn(
+            'birdman_stage_seconds_sum{scope="run",stage="fit"} 12.000000', prom
+        )
+        self.assertIn(
+            'birdman_stage_seconds_count{scope="feature",stage="sampling"} 3',
+            prom
+        )
@@ -0,0 +1,66 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+from unittest.mock import patch
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src import _models
+from q2_birdman.src._models import MODELS, build_dir, compile_model, model_file
+
+
+def _fake_compile(stan_file, **kwargs):
+    # Write the executable where CmdStan would, next to the Stan file
+    open(os.path.splitext(stan_file)[0], "w").close()
+
+
+class ModelRegistryTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_model_file_resolves_bundled_models(self):
+        """
+        Test that bundled models resolve to package files and unknown models
+        raise ValueError
+        """
+        for name in MODELS:
+            self.assertTrue(os.path.isfile(model_file(name)))
+        with self.assertRaises(ValueError):
+            model_file("poisson")
+
+    def test_compile_model_builds_once_into_cache(self):
+        """
+        Test that a model is compiled once into the cache with tuned flags and
+        native builds are kept apart
+        """
+        with tempfile.TemporaryDirectory() as cache, \
+                patch.dict(os.environ, {_models.CACHE_ENV: cache}), \
+                patch.object(_models.cmdstanpy, "cmdstan_path",
+                             return_value=cache), \
+                patch.object(_models.cmdstanpy, "CmdStanModel",
+                             side_effect=_fake_compile) as cmdstan_model:
+            exe_file = compile_model()
+            self.assertEqual(compile_model(), exe_file)
+            self.assertEqual(cmdstan_model.call_count, 1)
+            self.assertTrue(exe_file.startswith(cache))
+            kwargs = cmdstan_model.call_args.kwargs
+            self.assertEqual(kwargs["stanc_options"], {"O1": True})
+            self.assertNotIn("CXXFLAGS_OPTIM", kwargs["cpp_options"])
+
+            # Only the finished executable and its source are left in the cache
+            self.assertEqual(
+                sorted(os.listdir(os.path.dirname(exe_file))),
+                sorted([os.path.basename(exe_file),
+                        MODELS["negative_binomial_single"]])
+            )
+
+            self.assertNotEqual(build_dir(native=True), build_dir())
+            compile_model(native=True)
+            self.assertIn(
+                "-march=native",
+                cmdstan_model.call_args.kwargs["cpp_options"]["CXXFLAGS_OPTIM"]
+            )
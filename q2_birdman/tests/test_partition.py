@@ -0,0 +1,91 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import numpy as np
+import arviz as az
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src._manifest import (
+    create_manifest, read_manifest, update_feature
+)
+from q2_birdman.src._partition import (
+    merge_inference_dirs, partition_feature_ids
+)
+from q2_birdman.src._summarize import summarize_inferences
+
+
+def _fit_partition(run_dir, feature_ids, rng):
+    os.makedirs(os.path.join(run_dir, "inferences"))
+    create_manifest(run_dir, feature_ids)
+    for i, feature_id in enumerate(feature_ids):
+        output = os.path.join(
+            run_dir, "inferences", f"F{str(i).zfill(4)}_{feature_id}.nc"
+        )
+        az.from_dict(
+            posterior={"beta_var": rng.normal(size=(4, 100, 2))},
+            coords={"covariate": ["Intercept", "age"]},
+            dims={"beta_var": ["covariate"]},
+        ).to_netcdf(output)
+        update_feature(
+            run_dir, feature_id, chunk=1, status="done", output=output
+        )
+
+
+class PartitionTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_partition_feature_ids_follows_model_iterator_chunks(self):
+        """
+        Test that partitions are contiguous, cover every feature and may be
+        fewer than requested
+        """
+        feature_ids = [f"feature-{i}" for i in range(25)]
+        partitions = partition_feature_ids(feature_ids, 20)
+        self.assertEqual(len(partitions), 13)
+        self.assertEqual(sum(partitions, []), feature_ids)
+        self.assertEqual(
+            partition_feature_ids(feature_ids[:3], 4),
+            [[f] for f in feature_ids[:3]]
+        )
+
+    def test_merge_inference_dirs_renumbers_and_summarizes(self):
+        """
+        Test that merged partitions keep table order, get unique file names and
+        summarize together
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            parts = [os.path.join(temp_dir, p) for p in ("part-a", "part-b")]
+            _fit_partition(parts[0], ["feature-0", "feature-1"], rng)
+            _fit_partition(parts[1], ["feature-2"], rng)
+            merged_dir = os.path.join(temp_dir, "merged")
+            os.makedirs(os.path.join(merged_dir, "results"))
+
+            merge_inference_dirs(parts, merged_dir)
+            manifest = read_manifest(merged_dir)
+            summary = summarize_inferences(merged_dir, threads=1)
+
+            self.assertEqual(
+                list(manifest.index), ["feature-0", "feature-1", "feature-2"]
+            )
+            self.assertEqual(list(manifest["ordinal"]), [0, 1, 2])
+            self.assertEqual(manifest["output"].nunique(), 3)
+            self.assertEqual(
+                sorted(summary.index), ["feature-0", "feature-1", "feature-2"]
+            )
+            # Linked inferences share their data with the partitions' files
+            for name in os.listdir(os.path.join(merged_dir, "inferences")):
+                path = os.path.join(merged_dir, "inferences", name)
+                mode = os.stat(path).st_mode
+                self.assertEqual(mode & 0o222, 0)
+
+            with self.assertRaises(ValueError):
+                merge_inference_dirs(
+                    [parts[0], parts[0]], os.path.join(temp_dir, "dup")
+                )
@@ -0,0 +1,99 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src._plot import (
+    _unpack_hdi_and_filter, build_payload, plot_variables,
+    write_interactive_plot
+)
+
+
+def _summary():
+    return pd.DataFrame({
+        "age_mean": [1.0, -2.0, 0.1],
+        "age_hdi_lower": [0.5, -3.0, -0.4],
+        "age_hdi_upper": [1.5, -1.0, 0.6],
+        "sex_mean": [0.0, 0.1, -0.1],
+        "sex_hdi_lower": [-1.0, -1.0, -1.0],
+        "sex_hdi_upper": [1.0, 1.0, 1.0],
+    }, index=pd.Index(["feature-a", "feature-b", "feature-c"], name="Feature"))
+
+
+class PlotTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_unpack_hdi_does_not_mutate_summary(self):
+        """
+        Test that HDI error bars are derived from numeric bounds without
+        modifying the summary
+        """
+        df = _summary()
+        unpacked = _unpack_hdi_and_filter(df, "age_hdi")
+
+        pd.testing.assert_frame_equal(df, _summary())
+        self.assertEqual(list(unpacked["credible"]), ["yes", "yes", "no"])
+        np.testing.assert_allclose(unpacked["lower"], [0.5, 1.0, 0.5])
+        np.testing.assert_allclose(unpacked["upper"], [0.5, 1.0, 0.5])
+
+    def test_plot_variables_writes_optional_outputs(self):
+        """
+        Test that variables are plotted in parallel, with SVG and overview only
+        on request, even without credible features
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            figures = plot_variables(
+                _summary(), ["age", "sex"], temp_dir, threads=2, overview=True
+            )
+            written = sorted(os.listdir(temp_dir))
+
+        self.assertEqual(figures["age"], ["age_plot", "age_overview"])
+        self.assertEqual(written, [
+            "age_overview.png", "age_plot.png",
+            "sex_overview.png", "sex_plot.png"
+        ])
+
+
+class InteractivePlotTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_payload_is_columnar_and_embedded(self):
+        """
+        Test that the payload holds every variable and feature label and is
+        embedded in the page
+        """
+        fmd = pd.DataFrame(
+            {"Taxon": ["g__A", "g__B</script>", "g__C"]},
+            index=pd.Index(
+                ["feature-a", "feature-b", "feature-c"], name="Feature"
+            )
+        )
+        payload = build_payload(_summary(), feature_metadata=fmd)
+        self.assertEqual(sorted(payload["variables"]), ["age", "sex"])
+        self.assertEqual(payload["variables"]["age"]["credible"], [1, 1, 0])
+        self.assertEqual(
+            payload["variables"]["age"]["lower"], [0.5, -3.0, -0.4]
+        )
+        self.assertEqual(payload["labels"][0], "g__A")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            template = os.path.join(temp_dir, "template.html")
+            with open(template, "w") as f:
+                f.write(
+                    '<script type="application/json">{{ payload }}</script>')
+            write_interactive_plot(payload, temp_dir, template)
+            with open(os.path.join(temp_dir, "index.html")) as f:
+                page = f.read()
+            with open(os.path.join(temp_dir, "data.json")) as f:
+                self.assertEqual(json.load(f), payload)
+
+        self.assertEqual(page.count("</script>"), 1)
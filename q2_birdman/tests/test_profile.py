@@ -0,0 +1,59 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src._profile import (
+    profile_dir, profiled, resolve_profile_mode, write_profile_report
+)
+
+
+def _busy_feature_loop():
+    return sum(i * i for i in range(20000))
+
+
+class ProfilingTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_worker_profiles_are_merged(self):
+        """
+        Test that per-worker cProfile files are written and merged into a
+        hotspot report
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for name in ["chunk_0001", "chunk_0002"]:
+                with profiled(temp_dir, name, "cprofile"):
+                    _busy_feature_loop()
+
+            report = write_profile_report(temp_dir)
+            written = sorted(os.listdir(profile_dir(temp_dir)))
+            with open(report) as f:
+                hotspots = f.read()
+
+        self.assertEqual(
+            written,
+            ["chunk_0001.prof", "chunk_0002.prof", "hotspots.txt",
+             "merged.prof"]
+        )
+        self.assertIn("chunk_0001.prof, chunk_0002.prof", hotspots)
+        self.assertIn("_busy_feature_loop", hotspots)
+
+    def test_profiling_disabled(self):
+        """
+        Test that no profiles are written when profiling is off and unknown
+        modes are rejected
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with profiled(temp_dir, "chunk_0001", "none"):
+                _busy_feature_loop()
+            self.assertFalse(os.path.exists(profile_dir(temp_dir)))
+            self.assertIsNone(write_profile_report(temp_dir))
+
+        with self.assertRaisesRegex(ValueError, "Unknown profiling mode"):
+            resolve_profile_mode("perf")
@@ -0,0 +1,84 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src._resources import (
+    resource_snapshot, resource_usage, append_resources, collect_resources,
+    memory_scaling, write_memory_scaling
+)
+
+
+def _usage(peak_mb, child_peak_mb):
+    return {
+        "cpu_seconds": 1.0, "child_cpu_seconds": 3.0,
+        "write_bytes": 0, "child_write_bytes": 0,
+        "peak_rss_bytes": peak_mb * 1024 ** 2,
+        "child_peak_rss_bytes": child_peak_mb * 1024 ** 2,
+        "rss_bytes": peak_mb * 1024 ** 2,
+    }
+
+
+class ResourceAccountingTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_resource_usage_between_snapshots(self):
+        """
+        Test that usage between snapshots has non-negative deltas and the
+        worker's peak RSS
+        """
+        before = resource_snapshot()
+        sum(i * i for i in range(100000))
+        usage = resource_usage(before, resource_snapshot())
+
+        self.assertGreaterEqual(usage["cpu_seconds"], 0)
+        self.assertGreaterEqual(usage["write_bytes"], 0)
+        self.assertGreater(usage["peak_rss_bytes"], 0)
+
+    def test_collect_resources_and_memory_scaling(self):
+        """
+        Test that per-feature usage is summarized per N and memory per worker
+        is fit against N
+        """
+        with tempfile.TemporaryDirectory() as work_dir:
+            for run, n_samples, peak_mb in [
+                ("run-a", 100, 200), ("run-b", 300, 400)
+            ]:
+                run_dir = os.path.join(work_dir, run)
+                for feature_id in ("feature-a", "feature-b"):
+                    append_resources(
+                        run_dir, "chunk_0001", feature_id, 1,
+                        _usage(peak_mb, peak_mb / 2),
+                        n_samples=n_samples, chains=4, output_bytes=1024 ** 2
+                    )
+                summary = collect_resources(run_dir)
+                resources = pd.read_csv(
+                    os.path.join(run_dir, "results", "resources.tsv"), sep="\t"
+                )
+                self.assertEqual(len(resources), 2)
+                self.assertEqual(summary.loc[0, "features"], 2)
+                self.assertEqual(summary.loc[0, "cpu_seconds_per_feature"], 4.0)
+                self.assertEqual(
+                    summary.loc[0, "memory_per_worker_mb"],
+                    peak_mb + 4 * peak_mb / 2
+                )
+
+            summaries, fit = memory_scaling(work_dir)
+            table = pd.read_csv(write_memory_scaling(work_dir), sep="\t")
+
+        self.assertEqual(list(summaries["run"]), ["run-a", "run-b"])
+        # 600 MB at N=100 and 1200 MB at N=300
+        self.assertAlmostEqual(fit["slope_mb"], 3.0)
+        self.assertAlmostEqual(fit["intercept_mb"], 300.0)
+        np.testing.assert_allclose(
+            table["predicted_memory_per_worker_mb"],
+            table["memory_per_worker_mb"]
+        )
@@ -0,0 +1,66 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src._scratch import feature_scratch, resolve_scratch_root
+
+
+class ScratchDirTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_resolve_scratch_root_is_run_specific(self):
+        """
+        Test that the scratch root lives in the requested directory and differs
+        between runs
+        """
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            root_a = resolve_scratch_root("/runs/a", scratch_dir)
+            root_b = resolve_scratch_root("/runs/b", scratch_dir)
+            self.assertEqual(os.path.dirname(root_a), scratch_dir)
+            self.assertNotEqual(root_a, root_b)
+            self.assertEqual(
+                root_a, resolve_scratch_root("/runs/a", scratch_dir)
+            )
+
+    def test_feature_scratch_uses_scratch_and_cleans_up(self):
+        """
+        Test that feature output goes to the scratch root and is removed
+        afterwards
+        """
+        with tempfile.TemporaryDirectory() as scratch_dir, \
+                tempfile.TemporaryDirectory() as fallback:
+            root = resolve_scratch_root("/runs/a", scratch_dir)
+            with feature_scratch("F0001", root, fallback, 1024, 10 * 1024) as t:
+                self.assertEqual(os.path.dirname(t), root)
+                with open(os.path.join(t, "output.csv"), "w") as f:
+                    f.write("lp__\n")
+            self.assertFalse(os.path.exists(t))
+
+    def test_feature_scratch_falls_back_when_over_cap(self):
+        """
+        Test that feature output falls back to disk when it would exceed the
+        scratch cap
+        """
+        with tempfile.TemporaryDirectory() as scratch_dir, \
+                tempfile.TemporaryDirectory() as fallback:
+            root = resolve_scratch_root("/runs/a", scratch_dir)
+            with feature_scratch("F0001", root, fallback, 2048, 1024) as t:
+                self.assertEqual(os.path.dirname(t), fallback)
+            self.assertFalse(os.path.exists(t))
+
+    def test_feature_scratch_cleans_up_on_error(self):
+        """
+        Test that the feature directory is removed even if fitting raises
+        """
+        with tempfile.TemporaryDirectory() as fallback:
+            with self.assertRaises(RuntimeError):
+                with feature_scratch("F0001", None, fallback, 1024, 1024) as t:
+                    raise RuntimeError("sampling failed")
+            self.assertFalse(os.path.exists(t))
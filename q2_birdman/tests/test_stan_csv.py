@@ -0,0 +1,139 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import biom
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src._stan_csv import read_stan_csv_variables
+from q2_birdman.src.model_single import ModelSingle
+
+SAMPLER_COLUMNS = [
+    "lp__", "accept_stat__", "stepsize__", "treedepth__", "n_leapfrog__",
+    "divergent__", "energy__",
+]
+
+
+def _write_stan_csv(path, rng, n_draws, n_samples, p):
+    """Write draws in CmdStan's CSV layout, comments included."""
+    columns = (
+        SAMPLER_COLUMNS + ["beta_0"] + [f"beta_x.{i + 1}" for i in range(p - 1)]
+        + ["inv_disp"] + [f"beta_var.{i + 1}" for i in range(p)]
+        + [f"lam.{i + 1}" for i in range(n_samples)]
+        + [f"log_lhood.{i + 1}" for i in range(n_samples)]
+        + [f"y_predict.{i + 1}" for i in range(n_samples)]
+    )
+    values = rng.normal(size=(n_draws, len(columns)))
+    values[:, SAMPLER_COLUMNS.index("treedepth__")] = 3
+    values[:, SAMPLER_COLUMNS.index("divergent__")] = 0
+    with open(path, "w") as f:
+        f.write("# stan_version_major = 2\n# method = sample (Default)\n")
+        f.write(",".join(columns) + "\n")
+        f.write("# Adaptation terminated\n# Step size = 0.5\n")
+        f.write("# Diagonal elements of inverse mass matrix:\n# 1, 1, 1\n")
+        for row in values:
+            f.write(",".join(f"{v:.6g}" for v in row) + "\n")
+        f.write("# \n#  Elapsed Time: 0.1 seconds (Warm-up)\n")
+    return pd.read_csv(path, comment="#")
+
+
+class StanCsvTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_read_selected_variables(self):
+        """
+        Test that only the requested variables are read, shaped (chain, draw,
+        ...)
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = [os.path.join(temp_dir, f"chain_{i}.csv") for i in range(2)]
+            frames = [_write_stan_csv(p, rng, 50, 4, 3) for p in paths]
+
+            draws = read_stan_csv_variables(
+                paths, ["beta_var", "inv_disp", "divergent__"]
+            )
+            self.assertEqual(draws["beta_var"].shape, (2, 50, 3))
+            self.assertEqual(draws["inv_disp"].shape, (2, 50))
+            np.testing.assert_allclose(
+                draws["beta_var"][1],
+                frames[1][["beta_var.1", "beta_var.2", "beta_var.3"]].values
+            )
+
+    def test_model_single_reads_retained_groups(self):
+        """
+        Test that ModelSingle builds InferenceData holding only the retained
+        groups
+        """
+        rng = np.random.default_rng(42)
+        table = biom.Table(
+            rng.integers(1, 10, size=(3, 4)),
+            sample_ids=[f"sample-{i}" for i in range(4)],
+            observation_ids=["feature-1", "feature-2", "feature-3"]
+        )
+        metadata = pd.DataFrame(
+            {"age": [1.0, 2.0, 3.0, 4.0]}, index=table.ids(axis="sample")
+        )
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths = [os.path.join(temp_dir, f"chain_{i}.csv") for i in range(2)]
+            for p in paths:
+                _write_stan_csv(p, rng, 50, 4, 2)
+            fit = SimpleNamespace(runset=SimpleNamespace(csv_files=paths))
+
+            for retain, groups in [
+                ("beta_var", ["posterior"]),
+                ("diagnostics",
+                 ["posterior", "log_likelihood", "sample_stats"]),
+                ("full", ["posterior", "posterior_predictive", "log_likelihood",
+                          "sample_stats", "observed_data"]),
+            ]:
+                model = ModelSingle(
+                    table, "feature-2", metadata, "age", retain=retain
+                )
+                model.fit = fit
+                inf = model.to_inference()
+                self.assertEqual(sorted(inf.groups()), sorted(groups))
+                self.assertEqual(
+                    list(inf.posterior["beta_var"]["covariate"].values),
+                    ["Intercept", "age"]
+                )
+            self.assertEqual(inf.sample_stats["diverging"].dtype, bool)
+            self.assertEqual(inf.log_likelihood["log_lhood"].shape, (2, 50, 4))
+
+    def test_model_single_falls_back_on_unreadable_csv(self):
+        """
+        Test that ModelSingle warns and falls back to birdman's conversion when
+        the CSVs cannot be parsed
+        """
+        rng = np.random.default_rng(42)
+        table = biom.Table(
+            rng.integers(1, 10, size=(1, 4)),
+            sample_ids=[f"sample-{i}" for i in range(4)],
+            observation_ids=["feature-1"]
+        )
+        metadata = pd.DataFrame(
+            {"age": [1.0, 2.0, 3.0, 4.0]}, index=table.ids(axis="sample")
+        )
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "chain_0.csv")
+            with open(path, "w") as f:
+                f.write("# stan_version_major = 2\n")
+            model = ModelSingle(table, "feature-1", metadata, "age")
+            model.fit = SimpleNamespace(
+                runset=SimpleNamespace(csv_files=[path])
+            )
+
+            with patch("birdman.SingleFeatureModel.to_inference",
+                       return_value="fallback"), \
+                    self.assertLogs("birdman", level="WARNING") as logs:
+                self.assertEqual(model.to_inference(), "fallback")
+            self.assertIn("feature-1", logs.output[0])
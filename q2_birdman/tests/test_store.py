@@ -0,0 +1,156 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import numpy as np
+import arviz as az
+import h5py
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src._store import (
+    append_inference, chunk_store_path, read_store_feature_ids,
+    read_store_variable, retain_inference, write_netcdf
+)
+from q2_birdman.src._summarize import summarize_inferences
+
+
+def _fake_inference(rng, covariates=("Intercept", "age")):
+    return az.from_dict(
+        posterior={
+            "beta_var": rng.normal(size=(4, 100, len(covariates))),
+            "inv_disp": rng.gamma(2, size=(4, 100)),
+        },
+        sample_stats={"diverging": np.zeros((4, 100), dtype=bool)},
+        coords={"covariate": list(covariates)},
+        dims={"beta_var": ["covariate"]},
+    )
+
+
+class ConsolidatedStoreTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_append_and_read_store(self):
+        """
+        Test that features appended to a chunk store are read back in order
+        with their draws
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.makedirs(os.path.join(temp_dir, "inferences"))
+            store = chunk_store_path(temp_dir, 1)
+            infs = [_fake_inference(rng) for _ in range(3)]
+            for i, inf in enumerate(infs):
+                append_inference(store, f"feature-{i}", i, inf)
+
+            self.assertEqual(read_store_feature_ids(store),
+                             ["feature-0", "feature-1", "feature-2"])
+            beta_var = read_store_variable(store, "beta_var")
+            self.assertEqual(
+                beta_var.dims, ("feature", "chain", "draw", "covariate")
+            )
+            np.testing.assert_array_equal(
+                beta_var.sel(feature="feature-1").values,
+                infs[1].posterior["beta_var"].values
+            )
+
+    def test_append_keeps_variables_aligned(self):
+        """
+        Test that features with other variables are refused and interrupted
+        appends are overwritten
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.makedirs(os.path.join(temp_dir, "inferences"))
+            store = chunk_store_path(temp_dir, 1)
+            infs = [_fake_inference(rng) for _ in range(2)]
+            append_inference(store, "feature-0", 0, infs[0])
+
+            with self.assertRaisesRegex(
+                ValueError, "feature-x holds variables"
+            ):
+                append_inference(
+                    store, "feature-x", 1, retain_inference(infs[1], "beta_var")
+                )
+            # An append interrupted after writing one variable
+            with h5py.File(store, "a") as f:
+                f["posterior/beta_var"].resize((2, 4, 100, 2))
+                f["posterior/beta_var"][1] = -1
+            append_inference(store, "feature-1", 1, infs[1])
+
+            self.assertEqual(
+                read_store_feature_ids(store), ["feature-0", "feature-1"]
+            )
+            for var in ("beta_var", "inv_disp"):
+                values = read_store_variable(store, var)
+                self.assertEqual(values.shape[0], 2)
+                np.testing.assert_array_equal(
+                    values.sel(feature="feature-1").values,
+                    infs[1].posterior[var].values
+                )
+
+    def test_summarize_store_matches_netcdf(self):
+        """
+        Test that summarizing a consolidated store gives the same results as
+        per-feature NetCDF files
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as store_dir, \
+                tempfile.TemporaryDirectory() as nc_dir:
+            for d in (store_dir, nc_dir):
+                os.makedirs(os.path.join(d, "inferences"))
+                os.makedirs(os.path.join(d, "results"))
+            for i in range(3):
+                inf = _fake_inference(rng)
+                append_inference(
+                    chunk_store_path(store_dir, 1), f"feature-{i}", i, inf
+                )
+                inf.to_netcdf(os.path.join(
+                    nc_dir, "inferences", f"F000{i}_feature-{i}.nc"
+                ))
+
+            from_store = summarize_inferences(store_dir).sort_index()
+            from_netcdf = summarize_inferences(nc_dir).sort_index()
+            self.assertEqual(list(from_store.index), list(from_netcdf.index))
+            for col in ("age_mean", "age_std"):
+                np.testing.assert_allclose(from_store[col], from_netcdf[col])
+
+    def test_retain_beta_var_float32(self):
+        """
+        Test that the beta_var retention policy keeps only downcast beta_var
+        draws
+        """
+        rng = np.random.default_rng(42)
+        inf = retain_inference(
+            _fake_inference(rng), retain="beta_var", float32=True
+        )
+        self.assertEqual(inf.groups(), ["posterior"])
+        self.assertEqual(list(inf.posterior.data_vars), ["beta_var"])
+        self.assertEqual(inf.posterior["beta_var"].dtype, np.float32)
+
+    def test_retain_unknown_policy(self):
+        """
+        Test that an unknown retention policy raises a ValueError
+        """
+        rng = np.random.default_rng(42)
+        with self.assertRaisesRegex(ValueError, "Unknown retention policy"):
+            retain_inference(_fake_inference(rng), retain="everything")
+
+    def test_write_netcdf_compressed_roundtrip(self):
+        """
+        Test that compressed NetCDF output is read back unchanged
+        """
+        rng = np.random.default_rng(42)
+        inf = _fake_inference(rng)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "F0000_feature-0.nc")
+            write_netcdf(inf, path, compression=4)
+            back = az.from_netcdf(path)
+            np.testing.assert_array_equal(
+                back.posterior["beta_var"].values,
+                inf.posterior["beta_var"].values
+            )
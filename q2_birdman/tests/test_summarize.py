@@ -0,0 +1,384 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+from unittest.mock import patch
+import numpy as np
+import pandas as pd
+import arviz as az
+from qiime2.plugin.testing import TestPluginBase
+from q2_birdman.src import _summarize
+from q2_birdman.src._summarize import (
+    append_chunk_summary, collect_chunk_summaries, read_summary,
+    summarize_draws, summarize_inferences
+)
+
+
+def _fake_inference(rng, covariates=("Intercept", "age")):
+    return az.from_dict(
+        posterior={"beta_var": rng.normal(size=(4, 100, len(covariates)))},
+        coords={"covariate": list(covariates)},
+        dims={"beta_var": ["covariate"]},
+    )
+
+
+def _make_run_dir(temp_dir):
+    for sub_dir in ("inferences", "results"):
+        os.makedirs(os.path.join(temp_dir, sub_dir), exist_ok=True)
+
+
+class StreamedSummaryTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_collect_chunk_summaries_matches_summarize_inferences(self):
+        """
+        Test that summaries streamed by workers match summarizing the saved
+        inferences
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _make_run_dir(temp_dir)
+            for i in range(4):
+                inf = _fake_inference(rng)
+                append_chunk_summary(temp_dir, i % 2 + 1, f"feature-{i}", inf)
+                inf.to_netcdf(
+                    os.path.join(
+                        temp_dir, "inferences", f"F000{i}_feature-{i}.nc"
+                    )
+                )
+
+            streamed = collect_chunk_summaries(temp_dir).sort_index()
+            reread = summarize_inferences(temp_dir).sort_index()
+            self.assertEqual(list(streamed.index), list(reread.index))
+            for col in ("Intercept_mean", "age_mean",
+                        "Intercept_std", "age_std"):
+                np.testing.assert_allclose(streamed[col], reread[col])
+            self.assertTrue(
+                os.path.exists(
+                    os.path.join(temp_dir, "results", "beta_var.tsv")
+                )
+            )
+
+    def test_collect_chunk_summaries_keeps_latest_refit(self):
+        """
+        Test that a feature summarized twice keeps only its most recent summary
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _make_run_dir(temp_dir)
+            append_chunk_summary(temp_dir, 1, "feature-0", _fake_inference(rng))
+            refit = _fake_inference(rng)
+            append_chunk_summary(temp_dir, 1, "feature-0", refit)
+
+            streamed = collect_chunk_summaries(temp_dir)
+            self.assertEqual(list(streamed.index), ["feature-0"])
+            self.assertAlmostEqual(
+                streamed.loc["feature-0", "age_mean"],
+                float(refit.posterior["beta_var"].sel(covariate="age").mean())
+            )
+
+    def test_collect_chunk_summaries_none_streamed(self):
+        """
+        Test that collecting summaries returns None when no worker streamed any
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _make_run_dir(temp_dir)
+            self.assertIsNone(collect_chunk_summaries(temp_dir))
+
+
+class SummarySchemaTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_summary_tables_are_numeric(self):
+        """
+        Test that written summaries carry float HDI bounds and read
+        back unchanged
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _make_run_dir(temp_dir)
+            for i in range(3):
+                _fake_inference(rng).to_netcdf(
+                    os.path.join(
+                        temp_dir, "inferences", f"F000{i}_feature-{i}.nc"
+                    )
+                )
+            summary = summarize_inferences(temp_dir, threads=1)
+            self.assertTrue((summary.dtypes == np.float64).all())
+            self.assertTrue(
+                (summary["age_hdi_lower"] <= summary["age_hdi_upper"]).all()
+            )
+
+            from_tsv = read_summary(
+                os.path.join(temp_dir, "results", "beta_var.tsv")
+            )
+            pd.testing.assert_frame_equal(from_tsv, summary, check_exact=False)
+            parquet_path = os.path.join(temp_dir, "results", "beta_var.parquet")
+            if os.path.exists(parquet_path):
+                pd.testing.assert_frame_equal(
+                    read_summary(parquet_path), summary
+                )
+
+
+class HdiProbTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_summarize_inferences_hdi_prob_bypasses_cache(self):
+        """
+        Test that a non-default HDI probability narrows the HDI and ignores
+        cached summaries
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _make_run_dir(temp_dir)
+            for i in range(3):
+                _fake_inference(rng).to_netcdf(
+                    os.path.join(
+                        temp_dir, "inferences", f"F000{i}_feature-{i}.nc"
+                    )
+                )
+            default = summarize_inferences(
+                temp_dir, threads=1, incremental=True
+            ).sort_index()
+            narrow = summarize_inferences(
+                temp_dir, threads=1, hdi_prob=0.5
+            ).sort_index()
+
+        def width(df):
+            return df["age_hdi_upper"] - df["age_hdi_lower"]
+
+        self.assertTrue((width(narrow) < width(default)).all())
+        np.testing.assert_allclose(narrow["age_mean"], default["age_mean"])
+
+    def test_summarize_inferences_hdi_prob_leaves_cache_untouched(self):
+        """
+        Test that a default call after a non-default HDI probability returns
+        the default HDIs again
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _make_run_dir(temp_dir)
+            for i in range(3):
+                _fake_inference(rng).to_netcdf(
+                    os.path.join(
+                        temp_dir, "inferences", f"F000{i}_feature-{i}.nc"
+                    )
+                )
+            first = summarize_inferences(
+                temp_dir, threads=1, incremental=True
+            ).sort_index()
+            summarize_inferences(temp_dir, threads=1, hdi_prob=0.5)
+            again = summarize_inferences(
+                temp_dir, threads=1, incremental=True
+            ).sort_index()
+            stored = read_summary(
+                os.path.join(temp_dir, "results", "beta_var.tsv")
+            ).sort_index()
+
+        for df in (again, stored):
+            for col in ("age_hdi_lower", "age_hdi_upper"):
+                np.testing.assert_allclose(df[col], first[col])
+
+
+class ParallelSummaryTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_process_pool_matches_serial(self):
+        """
+        Test that summarizing with several worker processes matches a serial
+        run and reports timings
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _make_run_dir(temp_dir)
+            for i in range(6):
+                _fake_inference(rng).to_netcdf(
+                    os.path.join(
+                        temp_dir, "inferences", f"F000{i}_feature-{i}.nc"
+                    )
+                )
+
+            serial = summarize_inferences(temp_dir, threads=1).sort_index()
+            parallel = summarize_inferences(
+                temp_dir, threads=3, incremental=False
+            ).sort_index()
+            self.assertEqual(list(serial.index), list(parallel.index))
+            np.testing.assert_allclose(serial["age_mean"], parallel["age_mean"])
+
+            timings = pd.read_csv(
+                os.path.join(temp_dir, "results", "summary_timings.tsv"),
+                sep="\t"
+            )
+            self.assertEqual(len(timings), 6)
+            self.assertEqual(
+                list(timings.columns),
+                ["file", "read_seconds", "compute_seconds"]
+            )
+
+
+class IncrementalSummaryTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_only_new_and_changed_files_are_resummarized(self):
+        """
+        Test that a second summarization only re-reads new or refit inference
+        files
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _make_run_dir(temp_dir)
+
+            def inf_path(i):
+                return os.path.join(
+                    temp_dir, "inferences", f"F000{i}_feature-{i}.nc"
+                )
+
+            for i in range(4):
+                _fake_inference(rng).to_netcdf(inf_path(i))
+            first = summarize_inferences(temp_dir, threads=1, incremental=True)
+
+            refit = _fake_inference(rng)
+            os.remove(inf_path(1))
+            refit.to_netcdf(inf_path(1))
+            _fake_inference(rng).to_netcdf(inf_path(4))
+            os.remove(inf_path(3))
+            second = summarize_inferences(temp_dir, threads=1, incremental=True)
+
+            timings = pd.read_csv(
+                os.path.join(temp_dir, "results", "summary_timings.tsv"),
+                sep="\t"
+            )
+            self.assertEqual(
+                sorted(os.path.basename(f) for f in timings["file"]),
+                ["F0001_feature-1.nc", "F0004_feature-4.nc"]
+            )
+            self.assertEqual(
+                sorted(second.index),
+                ["feature-0", "feature-1", "feature-2", "feature-4"]
+            )
+            self.assertAlmostEqual(
+                second.loc["feature-1", "age_mean"],
+                float(refit.posterior["beta_var"].sel(covariate="age").mean())
+            )
+            self.assertEqual(
+                second.loc["feature-0", "age_mean"],
+                first.loc["feature-0", "age_mean"]
+            )
+
+    def test_touched_file_with_same_content_is_reused(self):
+        """
+        Test that a file whose mtime changed but whose content did not is
+        not re-read
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _make_run_dir(temp_dir)
+            path = os.path.join(temp_dir, "inferences", "F0000_feature-0.nc")
+            _fake_inference(rng).to_netcdf(path)
+            summarize_inferences(temp_dir, threads=1, incremental=True)
+
+            st = os.stat(path)
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            summarize_inferences(temp_dir, threads=1, incremental=True)
+            timings = pd.read_csv(
+                os.path.join(temp_dir, "results", "summary_timings.tsv"),
+                sep="\t"
+            )
+            self.assertTrue(timings.empty)
+
+    def test_non_incremental_summaries_skip_hashing(self):
+        """
+        Test that inference files are only hashed when the summary cache
+        is in use
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _make_run_dir(temp_dir)
+            _fake_inference(rng).to_netcdf(
+                os.path.join(temp_dir, "inferences", "F0000_feature-0.nc")
+            )
+            with patch.object(_summarize, "_file_digest") as file_digest:
+                summarize_inferences(temp_dir, threads=1)
+                summarize_inferences(temp_dir, threads=1, hdi_prob=0.5)
+                file_digest.assert_not_called()
+                summarize_inferences(temp_dir, threads=1, incremental=True)
+                file_digest.assert_called_once()
+
+    def test_file_rewritten_while_summarizing_is_resummarized(self):
+        """
+        Test that a file replaced while it is being summarized is not cached
+        with its new state
+        """
+        rng = np.random.default_rng(42)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            _make_run_dir(temp_dir)
+            path = os.path.join(temp_dir, "inferences", "F0000_feature-0.nc")
+            _fake_inference(rng).to_netcdf(path)
+            refit = _fake_inference(rng)
+            read_beta_var = _summarize._read_beta_var
+
+            def read_then_refit(inf_file):
+                beta_var = read_beta_var(inf_file)
+                os.remove(path)
+                refit.to_netcdf(path)
+                return beta_var
+
+            with patch.object(_summarize, "_read_beta_var", read_then_refit):
+                summarize_inferences(temp_dir, threads=1, incremental=True)
+            second = summarize_inferences(temp_dir, threads=1, incremental=True)
+
+        self.assertAlmostEqual(
+            second.loc["feature-0", "age_mean"],
+            float(refit.posterior["beta_var"].sel(covariate="age").mean())
+        )
+
+
+class VectorizedSummaryTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_summarize_draws_matches_arviz(self):
+        """
+        Test that vectorized mean, std and HDI match arviz computed per feature
+        """
+        rng = np.random.default_rng(42)
+        draws = rng.standard_t(3, size=(10, 4, 100, 2))
+        summary = summarize_draws(
+            draws, [f"feature-{i}" for i in range(10)], ["Intercept", "age"]
+        )
+        self.assertEqual(
+            list(summary.columns),
+            ["Intercept_mean", "age_mean", "Intercept_std", "age_std",
+             "Intercept_hdi_lower", "Intercept_hdi_upper",
+             "age_hdi_lower", "age_hdi_upper"]
+        )
+        for i in range(10):
+            for j, c in enumerate(["Intercept", "age"]):
+                flat = draws[i, :, :, j].ravel()
+                self.assertAlmostEqual(
+                    summary.iloc[i][c + "_mean"], flat.mean()
+                )
+                self.assertAlmostEqual(summary.iloc[i][c + "_std"], flat.std())
+                np.testing.assert_allclose(
+                    summary.iloc[i][[c + "_hdi_lower", c + "_hdi_upper"]],
+                    az.hdi(flat)
+                )
+
+    def test_summarize_draws_quantiles(self):
+        """
+        Test that requested quantiles are reported per covariate
+        """
+        rng = np.random.default_rng(42)
+        draws = rng.normal(size=(3, 4, 100, 1))
+        summary = summarize_draws(
+            draws, ["a", "b", "c"], ["age"], quantiles=(0.05, 0.5)
+        )
+        np.testing.assert_allclose(
+            summary["age_q0.5"], np.median(draws.reshape(3, -1), axis=1)
+        )
+        self.assertIn("age_q0.05", summary.columns)
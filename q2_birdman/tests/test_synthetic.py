@@ -0,0 +1,75 @@
+# ----------------------------------------------------------------------------
+# Copyright (c) 2024, Lucas Patel, Yang Chen
+#
+# Distributed under the terms of the Modified BSD License.
+#
+# The full license is in the file LICENSE, distributed with this software.
+# ----------------------------------------------------------------------------
+
+import os
+import tempfile
+import numpy as np
+from qiime2.plugin.testing import TestPluginBase
+from benchmarks.synthetic import (
+    simulate_inference, simulate_table, write_run_dir
+)
+from q2_birdman.src._summarize import summarize_inferences
+
+
+class SyntheticDataTests(TestPluginBase):
+    package = 'q2_birdman.tests'
+
+    def test_simulate_table_shapes_and_sparsity(self):
+        """
+        Test that simulated tables, metadata and effects line up and reach the
+        requested sparsity
+        """
+        table, metadata, formula, beta = simulate_table(
+            n_features=50, n_samples=40, n_covariates=2, sparsity=0.8
+        )
+        self.assertEqual(table.shape, (50, 40))
+        self.assertEqual(list(metadata.index), list(table.ids(axis="sample")))
+        self.assertEqual(formula, "x1+x2")
+        self.assertEqual(list(beta.columns), ["Intercept", "x1", "x2"])
+        self.assertEqual(list(beta.index), list(table.ids(axis="observation")))
+        zeros = (table.matrix_data.toarray() == 0).mean()
+        self.assertGreaterEqual(zeros, 0.75)
+
+        dense, *_ = simulate_table(n_features=50, n_samples=40, sparsity=0)
+        self.assertLess((dense.matrix_data.toarray() == 0).mean(), zeros)
+
+    def test_simulate_inference_coordinates(self):
+        """
+        Test that simulated posteriors carry covariate coordinates and an
+        optional log likelihood
+        """
+        rng = np.random.default_rng(42)
+        inf = simulate_inference(rng, ["Intercept", "x1"], chains=2, draws=30)
+        self.assertEqual(inf.posterior["beta_var"].shape, (2, 30, 2))
+        self.assertEqual(
+            list(inf.posterior["beta_var"]["covariate"].values),
+            ["Intercept", "x1"]
+        )
+        self.assertNotIn("log_likelihood", inf.groups())
+
+        inf = simulate_inference(
+            rng, ["Intercept"], chains=2, draws=30, n_samples=5
+        )
+        self.assertEqual(inf.log_likelihood["log_lhood"].shape, (2, 30, 5))
+
+    def test_write_run_dir_can_be_summarized(self):
+        """
+        Test that a simulated run directory has the layout the summarizer reads
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            write_run_dir(temp_dir, 3, chains=2, draws=30)
+            for sub_dir in ["logs", "inferences", "results", "plots"]:
+                self.assertTrue(os.path.isdir(os.path.join(temp_dir, sub_dir)))
+            self.assertEqual(
+                sorted(os.listdir(os.path.join(temp_dir, "inferences"))),
+                ["F0000_F0.nc", "F0001_F1.nc", "F0002_F2.nc"]
+            )
+            summary = summarize_inferences(temp_dir, threads=1)
+
+        self.assertEqual(sorted(summary.index), ["F0", "F1", "F2"])
+        self.assertIn("x1_mean", summary.columns)
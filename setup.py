@@ -26,10 +26,14 @@ setup(
         "qiime2.plugins": [
             "q2_birdman="
             "q2_birdman"
-            ".plugin_setup:plugin"]
+            ".plugin_setup:plugin"],
+        "console_scripts": [
+            "q2-birdman-compile-models="
+            "q2_birdman.src._models:main"]
     },
     package_data={
-        "q2_birdman": ["citations.bib"],
+        "q2_birdman": ["citations.bib", "assets/interactive/*"],
+        "q2_birdman.src": ["stan/*.stan"],
         "q2_birdman.tests": ["data/*"],
     },
     zip_safe=False,